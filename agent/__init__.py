@@ -1 +1,6 @@
-from .agent import Agent
\ No newline at end of file
+def __getattr__(name: str):
+    """Import the Agent class on first use, so importing a cognitive module does not load the memories databases"""
+    if name == 'Agent':
+        from agent.agent import Agent
+        return Agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
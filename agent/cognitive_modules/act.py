@@ -3,7 +3,7 @@ from queue import Queue
 import logging
 from agent.memory_structures.short_term_memory import ShortTermMemory
 from llm import LLMModels
-from utils.llm import extract_answers
+from utils.llm import extract_answers, json_answer_complete
 from utils.logging import CustomAdapter
 
 logger = logging.getLogger(__name__)
@@ -34,7 +34,7 @@ def actions_sequence(name:str, world_context:str, current_plan:str, reflections:
         list[str]: Actions that the agent should perform
     """
 
-    llm = LLMModels().get_main_model()
+    router = LLMModels().get_router()
     prompt_path = os.path.join(prompts_folder, 'act.txt')
     if isinstance(current_observations, list):
         current_observations = "\n".join(current_observations)
@@ -52,11 +52,11 @@ def actions_sequence(name:str, world_context:str, current_plan:str, reflections:
         action_str = ''
     # Actions have to be generated
     while actions_seq_queue.qsize() < 1:
-        response = llm.completion(prompt=prompt_path, inputs=[name, world_context, str(current_plan), reflections, current_observations,
-                                                              str(current_position), str(actions_seq_len), str(valid_actions), current_goals, agent_bio,
-                                                              known_objects, explored_map, previous_actions, changes_in_state, past_observations, action_str,
-                                                              curr_orientation])
-        response_dict = extract_answers(response.lower())
+        inputs = [name, world_context, str(current_plan), reflections, current_observations,
+                  str(current_position), str(actions_seq_len), str(valid_actions), current_goals, agent_bio,
+                  known_objects, explored_map, previous_actions, changes_in_state, past_observations, action_str,
+                  curr_orientation]
+        response_dict = router.completion('actions_sequence', prompt_path, parse=lambda response: extract_answers(response.lower()), inputs=inputs, stop_when=json_answer_complete) or {}
 
         try:
             action = response_dict['answer']
@@ -1,6 +1,6 @@
 import os
 from llm import LLMModels
-from utils.llm import extract_answers
+from utils.llm import extract_answers, json_answer_complete
 from agent.memory_structures.short_term_memory import ShortTermMemory
 from importlib import import_module
 def should_react(name: str, world_context: str, observations: list[str], current_plan: str, actions_queue: list[str], changes_in_state: list[str], curr_position: tuple, agent_bio: str = "", prompts_folder = "base_prompts_v0" ) -> tuple[bool, str]:
@@ -24,7 +24,7 @@ def should_react(name: str, world_context: str, observations: list[str], current
     if current_plan is None:
         return True, 'There is no plan to follow.'
 
-    llm = LLMModels().get_main_model()
+    router = LLMModels().get_router()
     prompt_path = os.path.join(prompts_folder, 'react.txt')
     observation = '\n'.join(observations)
     changes_in_state = '\n'.join(changes_in_state)
@@ -33,8 +33,7 @@ def should_react(name: str, world_context: str, observations: list[str], current
     actions_queue = ', '.join([f'{i+1}.{action}' for i, action in enumerate(actions_queue)]) if len(actions_queue) > 0 else 'None'
     if not observation:
         observation = "You couldn't observe anything interesting."
-    response = llm.completion(prompt=prompt_path, inputs=[name, world_context, observation, current_plan, actions_queue, changes_in_state, curr_position, agent_bio])
-    answers = extract_answers(response)
+    answers = router.completion('should_react', prompt_path, parse=extract_answers, inputs=[name, world_context, observation, current_plan, actions_queue, changes_in_state, curr_position, agent_bio], stop_when=json_answer_complete) or {}
     answer = answers.get('Answer', False)
     reasoning = answers.get('Reasoning', '')
     return answer, reasoning
@@ -1,5 +1,5 @@
 from llm import LLMModels
-from utils.llm import extract_answers
+from utils.llm import extract_answers, json_answer_complete
 import os
 
 def plan(name: str, world_context: str, observation: str, current_plan: str, reflections: str, reason_to_react: str, agent_bio: str = "", prompts_folder = "base_prompts_v0", changes_in_state: str = None, past_observations: str = None, last_step_executed: str = None, position: str = None, orientation: str = None) -> tuple[str, str]:
@@ -22,7 +22,7 @@ def plan(name: str, world_context: str, observation: str, current_plan: str, ref
     Returns:
         tuple[str, str]: New plan and new goals for the agent.
     """
-    llm = LLMModels().get_main_model()
+    router = LLMModels().get_router()
     
     prompt_path = os.path.join(prompts_folder, 'plan.txt')
     if last_step_executed:
@@ -31,8 +31,7 @@ def plan(name: str, world_context: str, observation: str, current_plan: str, ref
         action_str = ''
     if not observation:
         observation = "You couldn't observe anything interesting."
-    response = llm.completion(prompt=prompt_path, inputs=[name, world_context, observation, current_plan, reflections, reason_to_react, agent_bio, changes_in_state, past_observations, action_str, position, orientation], system_prompt='plan_system_prompt.txt')
-    answers = extract_answers(response)
+    answers = router.completion('plan', prompt_path, parse=extract_answers, inputs=[name, world_context, observation, current_plan, reflections, reason_to_react, agent_bio, changes_in_state, past_observations, action_str, position, orientation], system_prompt='plan_system_prompt.txt', stop_when=json_answer_complete) or {}
 
     plan = answers.get('Plan', None)
     goals = answers.get('Goals', None)
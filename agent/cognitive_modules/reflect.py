@@ -26,21 +26,14 @@ def reflect_questions(name: str , world_context:str, statements: list[str]|str,
     if isinstance(statements, list):
         statements = "\n".join(statements)
 
-    llm = LLMModels().get_main_model()
+    router = LLMModels().get_router()
     prompt_path = os.path.join(prompts_folder, 'reflect_questions.txt')
     try:
-        response = llm.completion(prompt=prompt_path, inputs=[name, world_context, statements, agent_bio])
-        relevant_questions_dict = extract_answers(response)
-        relevant_questions = [q['Question'] for q in relevant_questions_dict.values()]
+        relevant_questions = router.completion('reflect_questions', prompt_path, parse=lambda response: [q['Question'] for q in extract_answers(response).values()],
+                                               inputs=[name, world_context, statements, agent_bio]) or []
     except ValueError as e:
-        if str(e) == 'Prompt is too long':
-            llm = LLMModels().get_longer_context_fallback() 
-            response = llm.completion(prompt=prompt_path, inputs=[name, world_context, statements, agent_bio])
-            relevant_questions_dict = extract_answers(response)
-            relevant_questions = [q['Question'] for q in relevant_questions_dict.values()]
-        else:
-            logger.error('Error making the reflections: %s', traceback.format_exc())
-            relevant_questions = []
+        logger.error('Error making the reflections: %s', traceback.format_exc())
+        relevant_questions = []
    
     return relevant_questions
 
@@ -62,23 +55,13 @@ def reflect_insights(name, world_context, memory_statements, questions: list[str
         list[str]: Insights for the agent
     """
 
-    llm = LLMModels().get_main_model()
+    router = LLMModels().get_router()
     prompt_path = os.path.join(prompts_folder, 'reflect_insight.txt')
 
     memory_statements = list_statements_to_string(memory_statements, questions)
     try:
-        response = llm.completion(prompt=prompt_path, inputs=[name, world_context, memory_statements, agent_bio])
-        insights_dict = extract_answers(response)
-        insights = [i['Insight'] for i in insights_dict.values()]
-    except ValueError as e:
-        if str(e) == 'Prompt is too long':
-            llm = LLMModels().get_longer_context_fallback()
-            response = llm.completion(prompt=prompt_path, inputs=[name, world_context, memory_statements, agent_bio])
-            insights_dict = extract_answers(response)
-            insights = [i['Insight'] for i in insights_dict.values()]
-        else:
-            logger.error('Error making the reflections: %s', traceback.format_exc())
-            insights = []
+        insights = router.completion('reflect_insights', prompt_path, parse=lambda response: [i['Insight'] for i in extract_answers(response).values()],
+                                     inputs=[name, world_context, memory_statements, agent_bio]) or []
     except Exception as e:
         logger.error('Error making the reflections: %s', traceback.format_exc())
         insights = []
@@ -1,7 +1,7 @@
 import os
 from llm import LLMModels
 from utils.time import str_to_timestamp
-from utils.llm import extract_answers, extract_text, extract_tags
+from utils.llm import extract_answers, extract_text, extract_tags, tags_closed
 
 def update_understanding(current_observations: list[str], agent, game_time: str, understanding_umbral = 30, prompts_folder = "base_prompts_v0") -> None:
     """Updates the agent understanding about the world and the other agents. Updates the understanding only if the accumulated poignancy of the recent reflections is greater than the umbral, or 
@@ -65,18 +65,9 @@ def update_understanding(current_observations: list[str], agent, game_time: str,
 
 
     # Prompt the language model
-    llm = LLMModels().get_main_model()
+    router = LLMModels().get_router()
     prompt_path = os.path.join(prompts_folder, 'understanding.txt')
-    try:
-        response = llm.completion(prompt=prompt_path, inputs=[agent.name, world_understanding, knowledge_about_agents, observations, other_agents_prompt, remaining_doubts_info, memories_about_other_agents])
-        answers = extract_answers(response)
-    except ValueError as e:
-        if str(e) == 'Prompt is too long':
-            llm = LLMModels().get_longer_context_fallback()
-            response = llm.completion(prompt=prompt_path, inputs=[agent.name, world_understanding, knowledge_about_agents, observations, other_agents_prompt, remaining_doubts_info, memories_about_other_agents])
-            answers = extract_answers(response)
-        else:
-            raise e
+    answers = router.completion('update_understanding', prompt_path, parse=extract_answers, inputs=[agent.name, world_understanding, knowledge_about_agents, observations, other_agents_prompt, remaining_doubts_info, memories_about_other_agents]) or {}
 
     # Update the agent understanding
     world_understanding = answers.get('World_knowledge', None)
@@ -110,10 +101,9 @@ def update_understanding_2(current_observations: list[str], agent, game_time: st
         current_observations = '\n'.join(current_observations)
     else:
         current_observations = 'You cannot see anything within your vision range.'
-    llm = LLMModels().get_main_model()
+    router = LLMModels().get_router()
     prompt_wr_path = os.path.join(prompts_folder, 'world_representation.txt')
-    response = llm.completion(prompt=prompt_wr_path, inputs=[current_observations])
-    current_world_representation = str(extract_answers(response))
+    current_world_representation = str(router.completion('update_understanding_2', prompt_wr_path, parse=extract_answers, inputs=[current_observations]) or {})
     agent.stm.add_memory(current_world_representation, 'world_representation')
         
     # Update the understanding
@@ -124,14 +114,7 @@ def update_understanding_2(current_observations: list[str], agent, game_time: st
     if last_world_representation is not None:
         last_world_rules = agent.stm.get_memory('world_rules') or ''
         prompt_rules_path = os.path.join(prompts_folder, 'world_rules.txt')
-        try:
-            world_rules = llm.completion(prompt=prompt_rules_path, inputs=[last_understanding_update, last_world_representation, agent.name, last_reward, action, state_changes, game_time, reward, current_world_representation, last_world_rules])
-        except ValueError as e:
-            if str(e) == 'Prompt is too long':
-                llm = LLMModels().get_longer_context_fallback()
-                world_rules = llm.completion(prompt=prompt_rules_path, inputs=[last_understanding_update, last_world_representation, agent.name, last_reward, action, state_changes, game_time, reward, current_world_representation, last_world_rules])
-            else:
-                raise e
+        world_rules = router.completion('update_understanding_2', prompt_rules_path, inputs=[last_understanding_update, last_world_representation, agent.name, last_reward, action, state_changes, game_time, reward, current_world_representation, last_world_rules])
         agent.stm.add_memory(world_rules, 'world_rules')
         agent.stm.add_memory(f'{current_world_representation}\n{world_rules}', 'world_context')
     else:
@@ -168,21 +151,13 @@ def update_understanding_3(current_observations: list[str], agent, game_time: st
     action = agent.stm.get_memory('current_action') or 'No action executed yet.'
     state_changes = '\n'.join(state_changes) if state_changes else 'There were no changes observed.'
     current_position = agent.stm.get_memory('current_position')
-    llm = LLMModels().get_main_model()
+    router = LLMModels().get_router()
     if last_world_representation is not None:
         last_world_rules = agent.stm.get_memory('world_rules') or ''
         prompt_rules_path = os.path.join(prompts_folder, 'world_rules.txt')
         if last_world_rules:
             last_world_rules = f'The previous knowledge of the world:\n{last_world_rules}'
-        try:
-            response = llm.completion(prompt=prompt_rules_path, inputs=[last_understanding_update, last_world_representation, agent.name, last_reward, action, state_changes, game_time, reward, current_world_representation, last_world_rules, last_position, current_position])
-        except ValueError as e:
-            if str(e) == 'Prompt is too long':
-                llm = LLMModels().get_longer_context_fallback()
-                response = llm.completion(prompt=prompt_rules_path, inputs=[last_understanding_update, last_world_representation, agent.name, last_reward, action, state_changes, game_time, reward, current_world_representation, last_world_rules, current_position, last_position, current_position])
-            else:
-                raise e
-        world_rules = extract_text(response)
+        world_rules = router.completion('update_understanding_3', prompt_rules_path, parse=extract_text, inputs=[last_understanding_update, last_world_representation, agent.name, last_reward, action, state_changes, game_time, reward, current_world_representation, last_world_rules, last_position, current_position]) or ''
         agent.stm.add_memory(world_rules, 'world_rules')
         agent.stm.add_memory(world_rules, 'world_context')
     else:
@@ -235,17 +210,10 @@ def update_understanding_4(current_observations: list[str], agent, game_time: st
     world_rules = '\n'.join([f'<{i+1}>{rule}<\{i+1}>' for i, rule in enumerate(world_rules)]) if world_rules else None
     world_hypotheses = '\n'.join([f'<{i+1+number_of_rules}>{hypothesis}<\{i+1+number_of_rules}>' for i, hypothesis in enumerate(world_hypotheses)]) if world_hypotheses else None
 
-    llm = LLMModels().get_best_model()
+    router = LLMModels().get_router()
     prompt_path = os.path.join(prompts_folder, 'world_understanding.txt')
-    try:
-        response = llm.completion(prompt=prompt_path, inputs=[world_rules, world_hypotheses, previous_observations, current_state, game_time])
-    except ValueError as e:
-        if str(e) == 'Prompt is too long':
-            llm = LLMModels().get_longer_context_fallback()
-            response = llm.completion(prompt=prompt_path, inputs=[world_rules, world_hypotheses, previous_observations, current_state, game_time])
-        else:
-            raise e
-    answers = extract_tags(response)
+    world_understanding_complete = tags_closed('used_knowledge', 'new_world_knowledge', 'future_observations')
+    answers = router.completion('update_understanding_4', prompt_path, parse=extract_tags, inputs=[world_rules, world_hypotheses, previous_observations, current_state, game_time], stop_when=world_understanding_complete) or {}
 
     # Convert the hypotheses that were used to explain the world into theories if they meet an umbral of usage.
     used_rules = answers.get('used_knowledge', None)
@@ -3,11 +3,22 @@ import logging
 
 import chromadb
 import uuid
+from chromadb import Documents, EmbeddingFunction, Embeddings
 from chromadb.utils import embedding_functions
 
+from llm import LLMModels
 from utils.time import str_to_timestamp
 from utils.logging import CustomAdapter
-from utils.llm import CustomEmbeddingFunction
+
+
+class CustomEmbeddingFunction(EmbeddingFunction):
+    """Embedding function of chromadb that uses the embedding model of the simulation"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.model = LLMModels().get_embedding_model()
+    def __call__(self, texts: Documents) -> Embeddings:
+        return self.model.get_embeddings(texts)
+
 
 class LongTermMemory:
     """Class for long term memory. Memories are stored in the chromadb database.
@@ -1,8 +1,8 @@
-from datetime import datetime
 import logging
 from queue import Queue
 import random
-from utils.route_plan import shortest_valid_route
+import numpy as np
+from utils.route_plan import shortest_valid_route, get_distance_field_cache
 import re
 from utils.queue_utils import queue_from_list, new_empty_queue
 from utils.math import manhattan_distance
@@ -30,14 +30,28 @@ class SpatialMemory:
         self.current_observed_map = None
         self.mapSize = (len(self.scenario_map), len(self.scenario_map[0]))
         self.scenario_obstacles = scenario_obstacles  
+        # The agents move, so only the rest of the impassable obstacles are static. The fields are shared by all the agents of the map
+        impassable_obstacles = scenario_obstacles['impassable_obstacles'] if isinstance(scenario_obstacles, dict) else scenario_obstacles
+        self.distance_fields = get_distance_field_cache(scenario_map, [obstacle for obstacle in impassable_obstacles if not obstacle.isdigit()])
         
-        self.known_map = ["?"*self.mapSize[1] for _ in range(self.mapSize[0])]
-        #TODO: Change the timestamp to step_number
-        self.timestamp_map = [[datetime.now() for _ in range(self.mapSize[1])] for _ in range(self.mapSize[0])]
-        self.updated_frequency_map = [[0 for _ in range(self.mapSize[1])] for _ in range(self.mapSize[0])]
-        self.explored_map_per_round = [0]
+        self.known_map = np.full(self.mapSize, '?', dtype='<U1')
+        # Step number of the last update of each cell, 0 if the cell has never been seen
+        self.step_number = 0
+        self.timestamp_map = np.zeros(self.mapSize, dtype=int)
+        self.updated_frequency_map = np.zeros(self.mapSize, dtype=int)
+        # Percentage of the map known after each round, preallocated and doubled when it is full
+        self.explored_map_per_round = np.zeros(64)
+        self.explored_rounds = 1
         self.updated_map_per_round = [0]
         self.agent_id = agent_id
+        # Positions of the agents symbols on the known map by symbol, to clear them without scanning the whole map
+        self.agents_positions: dict[str, set[tuple[int, int]]] = {}
+        # Running counters of the metrics, updated only with the cells that changed
+        self.unknown_cells = self.mapSize[0] * self.mapSize[1]
+        self.changed_cells = np.zeros(self.mapSize, dtype=bool)
+        self.compared_global_map = None
+        self.updated_cells_map = np.zeros(self.mapSize, dtype=bool)
+        self.updated_cells = 0
         
     def update_current_scene(self, new_position: tuple, orientation:int, current_observed_map:str, current_global_map) -> None:
         """
@@ -56,31 +70,37 @@ class SpatialMemory:
         
         # By using the current observed map, we can update the known map
         self.update_known_map()
-        self.explored_map_per_round.append(self.get_percentage_known())
+        if self.explored_rounds == len(self.explored_map_per_round):
+            self.explored_map_per_round = np.concatenate([self.explored_map_per_round, np.zeros(len(self.explored_map_per_round))])
+        self.explored_map_per_round[self.explored_rounds] = self.get_percentage_known()
+        self.explored_rounds += 1
 
     def update_known_map(self) -> None:
         """
-        Updates the map with a new current map.
-        """
-        self.near_agents = list()
-        timestamp = datetime.now()
-        for i, row in enumerate(self.current_observed_map.split('\n')):
-            for j, element in enumerate(row):
-                if element != '-':
-                    if re.match(r'^[0-9]$', element):
-                        self.near_agents.append(element)
-                    if element == "#":
-                        element = self.agent_id
-                    try:
-                        global_position = self.get_global_position((i,j), self.get_local_self_position())
-                        self.update_pixel_if_newer(global_position[0], global_position[1], element, timestamp)
-                    except:
-                        self.logger.error(f'Error updating the explored map with the element {element} {(i,j)} at position {global_position}')
-                        continue
-        for i, row in enumerate(self.known_map):
-            for j, element in enumerate(row):
-                if element in self.near_agents or element == self.agent_id:
-                    self.update_pixel_if_newer(i, j, "?", timestamp)
+        Updates the map with a new current map. The observed window is rotated to global coordinates
+        and written at once, then the old symbols of the agents that are seen now are cleared.
+        """
+        self.step_number += 1
+        observed_rows = self.current_observed_map.split('\n')
+        observed_map = np.array(observed_rows).view('<U1').reshape(len(observed_rows), -1)
+        is_observed = (observed_map != '-') & (observed_map != '')
+        local_positions = np.argwhere(is_observed)
+        elements = observed_map[is_observed]
+        self.near_agents = elements[np.char.isdigit(elements)].tolist()
+        elements[elements == '#'] = self.agent_id
+
+        global_positions = self.get_global_positions(local_positions, self.get_local_self_position())
+        inside = (global_positions[:, 0] >= 0) & (global_positions[:, 0] < self.mapSize[0]) & \
+                 (global_positions[:, 1] >= 0) & (global_positions[:, 1] < self.mapSize[1])
+        if not inside.all():
+            self.logger.error(f'Error updating the explored map with the elements at the local positions {local_positions[~inside].tolist()}, they are out of the map')
+        rows, cols = global_positions[inside].T
+        self.update_pixels_if_newer(rows, cols, elements[inside], self.step_number)
+
+        old_positions = [position for agent_symbol in set(self.near_agents + [self.agent_id]) for position in self.agents_positions.get(agent_symbol, ())]
+        if old_positions:
+            rows, cols = np.array(old_positions).T
+            self.update_pixels_if_newer(rows, cols, np.full(len(old_positions), '?'), self.step_number)
 
     def get_percentage_known(self) -> float:
         """
@@ -89,8 +109,7 @@ class SpatialMemory:
         Returns:
             float: Percentage of the map that has been known.
         """
-        n_known = sum([row.count('?') for row in self.known_map])
-        percentage = (1 - n_known / (self.mapSize[0] * self.mapSize[1])) * 100
+        percentage = (1 - self.unknown_cells / (self.mapSize[0] * self.mapSize[1])) * 100
         return float("{:.2f}".format(percentage))
     
 
@@ -103,7 +122,7 @@ class SpatialMemory:
             position_end (tuple): End position of the route.
             orientation (int): Orientation of the agent. 0: North, 1: East, 2: South, 3: West.
             return_list (bool, optional): If True, returns a list instead of a queue. Defaults to False.
-            include_last_pos (bool, optional): If True, includes the last position of the route. Defaults to True.
+            include_last_pos (bool, optional): If True, the route ends at the end position. If False, it stops next to it facing it. Defaults to True.
             
         Returns:
             Queue(str): Steps sequence for the route.
@@ -115,25 +134,9 @@ class SpatialMemory:
             if return_list:
                 return route
             return queue_from_list(route)
-        route = shortest_valid_route(current_global_map, self.position, position_end, scenario_obstacles=self.scenario_obstacles, orientation=orientation)
-
-
-        if not include_last_pos and len(route) > 0:
-            route = route[:-2] + route[-1:]
-        
-        # Adds a change on orientation on the last step of the route
-        if len(route) > 0:
-            # if down we need to turn twice
-            new_orientation = 'turn '+ route[-1].split(' ')[1]
-            if new_orientation == 'turn down':
-                route.append('turn right')
-                route.append('turn right')
-            # If the new orientation is the same as the current one, we do not need to change it
-            elif new_orientation == 'turn up':
-                pass
-            else: 
-                route.append(new_orientation)
-
+        # The route ends facing its last move, or facing the end position when the last position is not included
+        route = shortest_valid_route(current_global_map, self.position, position_end, scenario_obstacles=self.scenario_obstacles, orientation=orientation,
+                                     distance_fields=self.distance_fields, turns=True, face_end=not include_last_pos)
 
         if return_list:
             return route
@@ -183,17 +186,8 @@ class SpatialMemory:
 
             # Only attack if the agent is not in the beam range, we need to move to the position
             if not is_in_beam_range:       
-                list_sequence = self.find_route_to_position(current_global_map,agent2attack_pos, self.orientation, return_list=True, include_last_pos=True)
-
-                # We need to put needed rotations to face the agent first: 
-                new_orientation = 'turn '+ list_sequence[-1].split(' ')[1]
-                # If the new orientation is the same as the current one, we do not need to change it, if down we need to turn twice
-                if new_orientation == 'turn down':
-                    # We need to to add two rotations to face the agent add the beginning
-                    list_sequence.insert(0, 'turn right')
-                    list_sequence.insert(0, 'turn right')
-                else: 
-                    list_sequence.insert(0, new_orientation)
+                # The route stops next to the agent facing it
+                list_sequence = self.find_route_to_position(current_global_map,agent2attack_pos, self.orientation, return_list=True, include_last_pos=False)
                 sequence_steps = queue_from_list(list_sequence)
 
             sequence_steps.put('attack')
@@ -314,6 +308,24 @@ class SpatialMemory:
 
         return element_global
     
+    def get_global_positions(self, local_dest_positions: np.ndarray, local_self_pos: tuple[int, int]) -> np.ndarray:
+        """Get the global positions of several elements at once given their local positions on the observed map.
+
+        Args:
+            local_dest_positions (np.ndarray): Local positions of the elements on the observed map, an array of shape (n, 2).
+            local_self_pos (tuple[int, int]): Local position of the agent on the observed map.
+
+        Returns:
+            np.ndarray: Global positions of the elements, an array of shape (n, 2).
+        """
+        local_dest_positions = np.asarray(local_dest_positions, dtype=int).reshape(-1, 2)
+        delta_row = local_dest_positions[:, 0] - local_self_pos[0]
+        delta_col = local_dest_positions[:, 1] - local_self_pos[1]
+        # Rows and columns offsets of the elements for each orientation: North, East, South, West
+        rotations = {0: (delta_row, delta_col), 1: (delta_col, -delta_row), 2: (-delta_row, -delta_col), 3: (-delta_col, delta_row)}
+        global_row, global_col = rotations[self.orientation]
+        return np.stack([global_row + self.position[0], global_col + self.position[1]], axis=1)
+
     def get_local_position_from_global(self, global_dest_pos: tuple[int, int], local_self_pos: tuple[int, int]) -> tuple[int, int]:
         """Get the local position of an element given its global position on the map.
 
@@ -462,19 +474,74 @@ class SpatialMemory:
         :param x: X-coordinate of the pixel to update.
         :param y: Y-coordinate of the pixel to update.
         :param new_value: The new value for the pixel.
-        :param new_timestamp: The new timestamp for the pixel.
-        """
-        current_timestamp = self.timestamp_map[x][y]
-        if  new_timestamp > current_timestamp:
-            self.known_map[x] = self.known_map[x][:y] + new_value + self.known_map[x][y+1:]
-            self.timestamp_map[x][y] = new_timestamp
-            self.updated_frequency_map[x][y] += 1
-
-    def get_percentage_map_is_updated(self, current_global_map):
-        updated_cells = 0
-        current_global_map = "\n".join(["".join(row) for row in current_global_map]).split('\n')
-        for i, row in enumerate(self.known_map):
-            for j, element in enumerate(row):
-                if element == current_global_map[i][j]:
-                    updated_cells += 1
-        return updated_cells / (len(current_global_map) * len(current_global_map[0])) * 100
\ No newline at end of file
+        :param new_timestamp: The step number of the new value.
+        """
+        self.update_pixels_if_newer(np.array([x]), np.array([y]), np.array([new_value]), new_timestamp)
+
+    def is_agent_symbol(self, values: np.ndarray) -> np.ndarray:
+        """
+        Checks which values are symbols of agents on the known map.
+
+        Args:
+            values (np.ndarray): Symbols of the map.
+
+        Returns:
+            np.ndarray: Mask with True where the symbol is an agent.
+        """
+        return np.char.isdigit(values) | (values == self.agent_id)
+
+    def update_pixels_if_newer(self, rows: np.ndarray, cols: np.ndarray, new_values: np.ndarray, new_timestamp: int) -> None:
+        """
+        Vectorized version of update_pixel_if_newer, the positions must not be repeated.
+
+        Args:
+            rows (np.ndarray): Rows of the pixels to update.
+            cols (np.ndarray): Columns of the pixels to update.
+            new_values (np.ndarray): New values of the pixels.
+            new_timestamp (int): Step number of the new values.
+        """
+        newer = self.timestamp_map[rows, cols] < new_timestamp
+        rows, cols, new_values = rows[newer], cols[newer], new_values[newer]
+        old_values = self.known_map[rows, cols]
+        # Keep the index of the agents symbols in sync with the known map
+        old_agents, new_agents = self.is_agent_symbol(old_values), self.is_agent_symbol(new_values)
+        for i in np.flatnonzero(old_agents | new_agents):
+            position = (int(rows[i]), int(cols[i]))
+            if old_agents[i]:
+                self.agents_positions[str(old_values[i])].discard(position)
+            if new_agents[i]:
+                self.agents_positions.setdefault(str(new_values[i]), set()).add(position)
+        self.unknown_cells += np.count_nonzero(new_values == '?') - np.count_nonzero(old_values == '?')
+        self.changed_cells[rows, cols] = True
+        self.known_map[rows, cols] = new_values
+        self.timestamp_map[rows, cols] = new_timestamp
+        self.updated_frequency_map[rows, cols] += 1
+
+    def get_percentage_map_is_updated(self, current_global_map) -> float:
+        """
+        Returns the percentage of the known map that is equal to the current global map. Only the cells that changed
+        on the known map or on the global map since the last call are compared again.
+
+        Args:
+            current_global_map (str | list | np.ndarray): Current global map, as rows of symbols or a matrix of symbols.
+
+        Returns:
+            float: Percentage of the map that is up to date.
+        """
+        if isinstance(current_global_map, str):
+            current_global_map = current_global_map.split('\n')
+        if not isinstance(current_global_map, np.ndarray):
+            current_global_map = np.array([list(row) for row in current_global_map])
+        if self.compared_global_map is None or self.compared_global_map.shape != current_global_map.shape:
+            changed = np.ones(current_global_map.shape, dtype=bool)
+            self.updated_cells_map = np.zeros(current_global_map.shape, dtype=bool)
+            self.updated_cells = 0
+        else:
+            changed = self.changed_cells | (current_global_map != self.compared_global_map)
+        rows, cols = np.nonzero(changed)
+        is_updated = self.known_map[rows, cols] == current_global_map[rows, cols]
+        self.updated_cells += np.count_nonzero(is_updated) - np.count_nonzero(self.updated_cells_map[rows, cols])
+        self.updated_cells_map[rows, cols] = is_updated
+        self.changed_cells[:] = False
+        self.compared_global_map = current_global_map
+        return self.updated_cells / current_global_map.size * 100
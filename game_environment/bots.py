@@ -1,6 +1,3 @@
-from meltingpot.python.scenario import get_config
-from meltingpot.utils.policies.policy import Policy
-from meltingpot.python.bot import build
 import dm_env
 import logging
 
@@ -18,6 +15,8 @@ def get_bots_for_scenario(scenario: str) -> list[str]:
     Returns:
         A list the policies names for the bots
     """
+    # The scenarios and the bots policies are only loaded when a scenario is played, they import TensorFlow
+    from meltingpot.python.scenario import get_config
     try:
         scenario_config = get_config(scenario)
     except KeyError:
@@ -54,6 +53,7 @@ class Bot:
             player_index: Index of the player in the game
             ACTION_SET: List of actions for the game
         """
+        from meltingpot.python.bot import build
         self.policy = build(policy_name)
         self.name = name
         self.state = self.policy.initial_state()
@@ -38,6 +38,7 @@ from meltingpot.python.utils.substrates import builder
 from game_environment.scene_descriptor.scene_descriptor import SceneDescriptor
 from game_environment.scene_descriptor.observations_generator import ObservationsGenerator
 from utils.logging import CustomAdapter
+from utils.background_worker import BackgroundWorker
 from game_environment.bots import Bot
 from game_environment.utils import default_agent_actions_map, check_agent_out_of_game
 
@@ -397,12 +398,18 @@ class Game:
         self.game_steps = 0 # Number of steps of the game
         self.bots = bots
         self.curr_scene_description = None
+        self.curr_observations = {}
         self.game_ascii_map = game_ascii_map
         self.substrate_name = substrate_name
+        self.background_worker = None
 
     def end_game(self):
         """Ends the game. This function is called when the game is finished."""
         game_steps = self.game_steps
+        if self.background_worker is not None:
+            # Wait for the records that are still being written in the background
+            self.background_worker.shutdown()
+            self.background_worker = None
         self.env.close()
         self.env = None
         self.pygame.quit()
@@ -411,6 +418,7 @@ class Game:
 
         for prefix in self.player_prefixes:
             logger.info('Player %s: score is %g' % (prefix, self.score[prefix]))
+        logger.info('Observations descriptions cache: %s', self.observationsGenerator.get_cache_stats())
 
     def step(self, current_actions_map:dict) -> dict[int, list[str]] | None:
         """Run one step of the game.
@@ -435,7 +443,7 @@ class Game:
         description, curr_global_map = self.descriptor.describe_scene(self.timestep)
         prev_global_map = self.prev_global_map.copy() if hasattr(self, 'prev_global_map') else None
         
-        self.game_recorder.record_game_state_before_actions(self.game_ascii_map, curr_global_map, current_actions_map, description, prev_global_map)
+        self._record(self.game_recorder.record_game_state_before_actions, self.game_ascii_map, curr_global_map, current_actions_map, description, prev_global_map)
 
         if self.first_move_done :
             self.game_steps += 1
@@ -507,18 +515,43 @@ class Game:
         description, curr_global_map = self.descriptor.describe_scene(self.timestep)
 
         # Record the game
-        self.game_recorder.record(self.timestep, description)
-        self.game_recorder.record_rewards(rewards)
-        self.game_recorder.record_elements_status(self.game_ascii_map, curr_global_map)
-        self.game_recorder.record_scene_tracking(self.time, curr_global_map, description)
+        self._record(self.game_recorder.record, self.timestep, description)
+        self._record(self.game_recorder.record_rewards, rewards)
+        self._record(self.game_recorder.record_elements_status, self.game_ascii_map, curr_global_map)
+        self._record(self.game_recorder.record_scene_tracking, self.time, curr_global_map, description)
         self.record_counter += 1
 
         # Update the observations generator
         game_time = self.get_time()
-        self.observationsGenerator.update_state_changes(description, game_time)
+        # The layers of avatar ids tell apart the agents drawn with the same digit in large populations
+        avatar_ids = (self.descriptor.last_avatar_ids_map, self.descriptor.avatar_ids_map)
+        self.observationsGenerator.update_state_changes(description, game_time, avatar_ids)
 
         self.curr_scene_description = description
         self.curr_global_map = curr_global_map
+        # Describe the observations of every player once per step, the players read them from this cache.
+        # The entities are taken from the global map once and filtered by the observation window of every player
+        self.curr_observations = self.observationsGenerator.get_all_observations_descriptions(description, curr_global_map, self.descriptor.avatar_ids_map)
+
+    def set_background_worker(self, background_worker: BackgroundWorker | None) -> None:
+        """Sets the worker that records the game in the background. When it is set, the records of a step are written
+        while the agents decide the actions of the next step.
+        Args:
+            background_worker: Worker that runs the records in order. None to record synchronously
+        """
+        self.background_worker = background_worker
+
+    def _record(self, record_func: Callable, *args) -> None:
+        """Runs a record function of the game recorder, in the background worker if it is set.
+        The arguments must not be modified after the call, the step creates new objects for them on every step.
+        Args:
+            record_func: Record function of the game recorder
+            *args: Arguments of the record function
+        """
+        if self.background_worker is not None:
+            self.background_worker.submit(record_func, *args)
+        else:
+            record_func(*args)
 
     def get_observations_by_player(self, player_prefix: str) -> dict:
         """Returns the observations of the given player.
@@ -527,7 +560,7 @@ class Game:
         Returns:
             A dictionary with the observations of the player
         """
-        curr_state = self.observationsGenerator.get_all_observations_descriptions(str(self.curr_scene_description).strip())[player_prefix]
+        curr_state = list(self.curr_observations[player_prefix])
         scene_description = self.curr_scene_description[player_prefix]
         if (check_agent_out_of_game(curr_state)):
             state_changes = []
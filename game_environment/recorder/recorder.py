@@ -3,6 +3,7 @@ from typing import Mapping
 import cv2
 from datetime import datetime
 import shutil
+import threading
 import numpy as np
 from skimage import io
 from skimage.transform import resize
@@ -23,6 +24,9 @@ class Recorder:
         self.create_log_tree()
         self.player_names = player_names
         self.agents_ids = {name: str(agent_id) for agent_id, name in enumerate(player_names)}
+        # Agents can record their actions from different threads when they move concurrently,
+        # and the game can be recorded in a background thread while the agents observe the next step
+        self._lock = threading.Lock()
 
         # Import custom recorder functions for the substrate
         # Try to import the custom recorder functions for the substrate
@@ -60,7 +64,8 @@ class Recorder:
         self.step += 1
 
         if self._record:
-            self._record(self, timestep, description)
+            with self._lock:
+                self._record(self, timestep, description)
 
     def record_rewards(self, rewards: Mapping[str, float])->None:
         #Writes the rewards to a file
@@ -83,7 +88,8 @@ class Recorder:
             current_map (list[list[str]]): Current map
         """
         if self._record_elements_status:
-            self._record_elements_status(self, initial_map, current_map)
+            with self._lock:
+                self._record_elements_status(self, initial_map, current_map)
         elif self.substrate_name == 'clean_up':
             apples = 0
             dirt = 0
@@ -109,15 +115,18 @@ class Recorder:
             scene_description (dict): Current state of the game before any actions are taken
         """
         if self._record_game_state_before_actions:
-            self._record_game_state_before_actions(self, initial_map, current_map, current_actions_map, scene_description, previous_map)
+            with self._lock:
+                self._record_game_state_before_actions(self, initial_map, current_map, current_actions_map, scene_description, previous_map)
 
     def record_observations(self, **kwargs):
         if self._record_observations:
-            self._record_observations(self, **kwargs)
+            with self._lock:
+                self._record_observations(self, **kwargs)
 
     def record_action(self, **kwargs):
         if self._record_action:
-            self._record_action(self, **kwargs)
+            with self._lock:
+                self._record_action(self, **kwargs)
 
     def save_log(self, game_steps):
         """
@@ -8,10 +8,11 @@ Description: Implements required functions for the observations descriptor
 from importlib import import_module
 import numpy as np
 import ast
+import os
 from scipy.ndimage import label, center_of_mass
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import re
-from game_environment.utils import connected_elems_map, check_agent_out_of_game, get_element_global_pos, get_matrix, number_to_words
+from game_environment.utils import connected_elems_map, check_agent_out_of_game, get_element_global_pos, get_matrix, number_to_words, get_global_entities, get_visible_entities
 
 
 import logging
@@ -47,35 +48,96 @@ class ObservationsGenerator (object):
         self.substrate_utils_module = import_module(f'game_environment.substrates.utilities.{substrate_name}.substrate_utils')
 
         self.connected_elments = self.substrate_utils_module.get_connected_elements(global_map)
+        # Symbols of the entities taken from the global map once per step: the agents and the elements the substrate describes
+        self.substrate_entities_symbols = getattr(self.substrate_utils_module, 'entities_symbols', None)
+        self.entities_symbols = self.other_players_symbols + (self.substrate_entities_symbols or [])
 
+        # Descriptions of the last observation windows seen, agents that stay still or walk through unchanged regions reuse them
+        self.descriptions_cache = OrderedDict()
+        self.descriptions_cache_size = int(os.getenv('OBSERVATIONS_CACHE_SIZE', 1024))
+        self.cache_hits = 0
+        self.cache_misses = 0
 
-    def get_all_observations_descriptions(self,  agents_observations_str: str) -> dict[str, list[str]]:
+
+    def get_all_observations_descriptions(self,  agents_observations: dict | str, global_map: np.ndarray | None = None, avatar_ids_map: np.ndarray | None = None) -> dict[str, list[str]]:
         """
         Description: Returns a dictionary with the descriptions of the observations of the agents
 
         Args:
-            agents_observations_str (str): Observations of the agents in ascci format
-            agents_observing (list[str]): List of the agents that are observing and didn't take an action
+            agents_observations (dict | str): Scene description of the agents, as returned by the scene descriptor or as its string representation
+            global_map (np.ndarray | None, optional): Global map of the step. If it is given, the entities are taken from it once and
+                every agent only filters the ones in its observation window, instead of reading its window. Defaults to None.
+            avatar_ids_map (np.ndarray | None, optional): Layer of avatar ids of the global map. If it is given, the observed agents
+                are identified by their id instead of the digit they are drawn with. Defaults to None.
 
         Returns:
             dict[str, list[str]]: Dictionary with the descriptions of the observations in a list by agent name
         """
-        agents_observations = ast.literal_eval(agents_observations_str)
+        if isinstance(agents_observations, str):
+            agents_observations = ast.literal_eval(agents_observations)
+        entities = get_global_entities(global_map, self.entities_symbols, avatar_ids_map) if global_map is not None else None
         observations_description_per_agent = {}
         for agent_name, agent_dict in agents_observations.items():
-            observations_description_per_agent[agent_name] = self.get_observations_per_agent(agent_dict, agent_name, True)
+            observations_description_per_agent[agent_name] = self.get_observations_per_agent(agent_dict, agent_name, True, entities)
 
         return observations_description_per_agent
 
 
-    def get_observations_per_agent(self, agent_dict: dict, agent_name: str, is_observing: bool) -> list[str]:
+    def get_observations_per_agent(self, agent_dict: dict, agent_name: str, is_observing: bool, entities: dict | None = None) -> list[str]:
+        """
+        Description: Returns a list with the descriptions of the observations of the agent. The descriptions are cached by
+        observation window, position and orientation, so an unchanged window is not described again
+
+        Args:
+            agent_dict (dict): Dictionary with the observations of the agent
+            agent_name (str): Name of the agent
+            is_observing (bool): True if the agent is observing, False otherwise
+            entities (dict | None, optional): Entities of the step, as returned by get_global_entities. Defaults to None.
+
+        Returns:
+            list: List with the descriptions of the observations of the agent
+        """
+        # The observation texts of the agents out of the game are not a map
+        visible_entities = None
+        if entities is not None and 'no observations' not in agent_dict['observation']:
+            rows = agent_dict['observation'].split('\n')
+            visible_entities = get_visible_entities(entities, (9, 5), agent_dict['global_position'], agent_dict['orientation'], (len(rows), len(rows[0])))
+
+        # The self symbol hides the name of the agent, so the agents with the same window share the descriptions.
+        # Several agents are drawn with the same digit in large populations, the ids of the visible agents tell them apart
+        global_position = tuple(agent_dict['global_position']) if agent_dict['global_position'] is not None else None
+        visible_agents = tuple((symbol, tuple(position)) for symbol, _, position in visible_entities or [] if symbol in self.other_players_symbols)
+        key = (agent_dict['observation'], global_position, agent_dict.get('orientation'), self.substrate_name, agent_dict.get('is_movement_allowed'), visible_agents)
+        if key in self.descriptions_cache:
+            self.cache_hits += 1
+            self.descriptions_cache.move_to_end(key)
+            return list(self.descriptions_cache[key])
+
+        self.cache_misses += 1
+        list_of_observations = self._describe_observations(agent_dict, agent_name, is_observing, visible_entities)
+        self.descriptions_cache[key] = list(list_of_observations)
+        if len(self.descriptions_cache) > self.descriptions_cache_size:
+            self.descriptions_cache.popitem(last=False)
+        return list_of_observations
+
+    def get_cache_stats(self) -> dict:
+        """
+        Description: Returns the hits and misses of the cache of the observations descriptions
+
+        Returns:
+            dict: Hits, misses and number of descriptions cached
+        """
+        return {'hits': self.cache_hits, 'misses': self.cache_misses, 'size': len(self.descriptions_cache)}
+
+    def _describe_observations(self, agent_dict: dict, agent_name: str, is_observing: bool, visible_entities: list | None = None) -> list[str]:
         """
-        Description: Returns a list with the descriptions of the observations of the agent
+        Description: Generates the list with the descriptions of the observations of the agent
 
         Args:
             agent_dict (dict): Dictionary with the observations of the agent
             agent_name (str): Name of the agent
             is_observing (bool): True if the agent is observing, False otherwise
+            visible_entities (list | None, optional): Entities in the observation window, as returned by get_visible_entities. Defaults to None.
 
         Returns:
             list: List with the descriptions of the observations of the agent
@@ -95,20 +157,25 @@ class ObservationsGenerator (object):
             agent_orientation = agent_dict['orientation']
             symbols = {'self_symbol': self.self_symbol, 'other_players_symbols': self.other_players_symbols }
 
-            substrate_items_descriptions = self.get_specific_substrate_observations(local_observation_map, local_map_position, global_position, agent_orientation, self.connected_elments, symbols, scene_description=agent_dict)
+            kwargs = {'scene_description': agent_dict}
+            if visible_entities is not None and self.substrate_entities_symbols is not None:
+                kwargs['visible_entities'] = visible_entities
+            substrate_items_descriptions = self.get_specific_substrate_observations(local_observation_map, local_map_position, global_position, agent_orientation, self.connected_elments, symbols, **kwargs)
             list_of_observations.extend(substrate_items_descriptions)
 
             # Get agents observed descriptions for structured elements in the substrate map
-            agents_observed = self.get_agents_observed(local_observation_map, local_map_position, global_position, agent_orientation)
+            agents_observed = self.get_agents_observed(local_observation_map, local_map_position, global_position, agent_orientation, visible_entities)
             list_of_observations.extend(agents_observed)
 
         return list_of_observations
 
-    def update_state_changes(self, scene_description: dict, game_time: str):
+    def update_state_changes(self, scene_description: dict, game_time: str, avatar_ids: tuple | None = None):
         """Update the state changes of the agents
 
         Args:
             scene_description (dict): Scene description of the agents
+            game_time (str): Current game time
+            avatar_ids (tuple | None, optional): Layers of avatar ids of the last and the current global maps. Defaults to None.
         """
         for agent_name in self.players_names:
             agent_dict = scene_description[agent_name]
@@ -121,7 +188,7 @@ class ObservationsGenerator (object):
             agent_orientation = agent_dict['orientation']
 
             # Get observed changes in the environment. If the agent is observing, the changes are stored in the observed_changes dictionary
-            observed_changes = self.get_observed_changes(local_observation_map, last_observation_map, local_map_position, global_position, last_global_position, agent_orientation, last_orientation, game_time, agent_name)
+            observed_changes = self.get_observed_changes(local_observation_map, last_observation_map, local_map_position, global_position, last_global_position, agent_orientation, last_orientation, game_time, agent_name, avatar_ids)
             self.observed_changes[agent_name].extend(observed_changes)
 
     def get_observed_changes_per_agent(self, agent_name: str) -> list[tuple[str, str]]:
@@ -138,7 +205,7 @@ class ObservationsGenerator (object):
         self.observed_changes[agent_name] = []
         return observations
 
-    def get_agents_observed(self, local_observation_map: str, local_map_position: tuple, global_position: tuple, agent_orientation: int) -> list[str]:
+    def get_agents_observed(self, local_observation_map: str, local_map_position: tuple, global_position: tuple, agent_orientation: int, visible_entities: list | None = None) -> list[str]:
         """
         Returns a list with the descriptions of the agents observed by the agent
 
@@ -147,11 +214,17 @@ class ObservationsGenerator (object):
             local_map_position (tuple): Local position of the agent in the observed window
             global_position (tuple): Global position of the agent
             agent_orientation (int): Orientation of the agent
+            visible_entities (list | None, optional): Entities in the observation window, as returned by get_visible_entities.
+                If it is given, the agents are taken from it instead of reading the window. Defaults to None.
 
         Returns:
             list[str]: List with the descriptions of the agents observed by the agent
         """
 
+        if visible_entities is not None:
+            return ["Observed agent {} at position {}.".format(self.players_names[int(symbol)], position)
+                    for symbol, _, position in visible_entities if symbol in self.other_players_symbols]
+
         agents_observed = []
 
         i = 0
@@ -187,7 +260,7 @@ class ObservationsGenerator (object):
 
         return self.substrate_utils_module.get_specific_substrate_obs(local_observation_map, local_map_position, global_position, agent_orientation, connected_elments, symbols, **kwargs)
 
-    def get_observed_changes(self, observed_map: str, last_observed_map: str | None, agent_local_position: tuple, agent_global_position: tuple, agent_last_global_position: tuple, agent_orientation: int, agent_last_orientation: int, game_time: str, agent_name:str) -> list[tuple[str, str]]:
+    def get_observed_changes(self, observed_map: str, last_observed_map: str | None, agent_local_position: tuple, agent_global_position: tuple, agent_last_global_position: tuple, agent_orientation: int, agent_last_orientation: int, game_time: str, agent_name:str, avatar_ids: tuple | None = None) -> list[tuple[str, str]]:
         """Calls the specific substrate observation function of the substrate utilities module
             It creates a list of tuples with the changes in the environment and the game time
 
@@ -201,6 +274,7 @@ class ObservationsGenerator (object):
             agent_last_orientation (int): Last orientation of the agent
             game_time (str): Current game time
             agent_name (str): Name of the agent
+            avatar_ids (tuple | None, optional): Layers of avatar ids of the last and the current global maps. Defaults to None.
         Returns:
             list[tuple[str, str]]: List of tuples with the changes in the environment, and the game time
         """
@@ -216,4 +290,5 @@ class ObservationsGenerator (object):
             game_time, 
             self.players_names, 
             agent_name,
-            self.self_symbol)
+            self.self_symbol,
+            avatar_ids=avatar_ids)
@@ -2,7 +2,7 @@ from importlib import import_module
 import re
 import numpy as np
 import logging
-from game_environment.utils import parse_string_to_matrix, matrix_to_string
+from game_environment.utils import parse_string_to_grid, grid_to_string, grid_to_matrix, matrix_to_grid, get_avatar_symbol
 from utils.logging import CustomAdapter
 
 logger = logging.getLogger(__name__)
@@ -68,7 +68,8 @@ class Avatar:
         self.last_partial_observation = partial_observation
 
     def set_position(self, x, y):
-        self.position = (x, y)
+        # Plain ints, the position is written in the observations descriptions
+        self.position = (int(x), int(y))
 
     def set_orientation(self, orientation):
         self.orientation = orientation
@@ -104,6 +105,11 @@ class SceneDescriptor:
         self.n_players = substrate_config.lab2d_settings.numPlayers
         self.avatars = self.get_avatars(substrate_config.player_names)
         self.last_map = None # Map of the inmediately last step
+        # Ids of the avatars in the cells of the current and the last maps, -1 where there is no avatar. The map only has
+        # a single character per cell, so it draws the avatars with the last digit of their id
+        self.avatar_ids_map = None
+        self.last_avatar_ids_map = None
+        self._padded_maps = [] # Padded and rotated views of the last and the current maps and avatar ids, shared by the avatars
         for avatar_id, avatar in self.avatars.items():
             logger.info(f"{avatar.name} is player {avatar_id}")
         global substrate_utils 
@@ -123,10 +129,10 @@ class SceneDescriptor:
 
     def describe_scene(self, timestep):
         self.reset_population()
-        map, zaps = self.parse_timestep(timestep)
+        grid, zaps = self.parse_timestep(timestep)
         self.parse_zaps(zaps)
-        self.compute_partial_observations(map, self.last_map)
-        self.last_map = map
+        self.compute_partial_observations(grid, self.last_map, self.avatar_ids_map, self.last_avatar_ids_map)
+        self.last_map = grid
         result = {}
         for avatar_id, avatar in self.avatars.items():
             logger.info(f"Avatar {avatar_id} is in position {avatar.position}")
@@ -141,7 +147,8 @@ class SceneDescriptor:
                                  "effective_zap": avatar.name in [a.murder for a in self.avatars.values() if a.just_died],
                                  "is_movement_allowed": avatar.is_movement_allowed
                                 }
-        return result, map
+        # The scene descriptor works with the symbols grid, the global map is given as characters
+        return result, grid_to_matrix(grid)
 
     def parse_zaps(self, zaps):
         for victim_index, row in enumerate(zaps):
@@ -150,7 +157,11 @@ class SceneDescriptor:
                 if value > 0:
                     self.avatars[victim_index].set_murder(murder_name)
 
-    def compute_partial_observations(self, map, last_map):
+    def compute_partial_observations(self, map, last_map, avatar_ids_map=None, last_avatar_ids_map=None):
+        padded_maps = self.get_padded_maps(map)
+        last_padded_maps = self.get_padded_maps(last_map) if last_map is not None else None
+        padded_ids_maps = self.get_padded_maps(avatar_ids_map) if avatar_ids_map is not None else None
+        last_padded_ids_maps = self.get_padded_maps(last_avatar_ids_map) if last_avatar_ids_map is not None else None
         for avatar_id, avatar in self.avatars.items():
             if avatar.avatar_state == 0:
                 if avatar.just_died:
@@ -161,42 +172,98 @@ class SceneDescriptor:
                 avatar.set_agents_in_observation({})
             else:
                 min_padding = max(avatar.avatar_view.values())
-                padded_map = self.pad_matrix_to_square(map, min_padding)
-                padded_map = np.rot90(padded_map, k=int(avatar.orientation))
-                observation, agents_in_observation = self.crop_observation(padded_map, avatar_id, avatar.avatar_view)
+                padded_map, avatar_pos = self.get_rotated_map(padded_maps, map, min_padding, int(avatar.orientation), avatar.position)
+                avatar_ids = self.get_rotated_map(padded_ids_maps, avatar_ids_map, min_padding, int(avatar.orientation), padding_char=-1)[0] if padded_ids_maps is not None else None
+                observation, agents_in_observation = self.crop_observation(padded_map, avatar_id, avatar.avatar_view, avatar_pos, avatar_ids)
                 avatar.set_partial_observation(observation)
                 avatar.set_agents_in_observation(agents_in_observation)
 
                 # Get the past observations of the observed map to calculate state changes
                 if last_map is not None and not avatar.just_revived:
-                    last_padded_map = self.pad_matrix_to_square(last_map, min_padding)
-                    last_padded_map = np.rot90(last_padded_map, k=int(avatar.last_orientation))
-                    last_observation, _ = self.crop_observation(last_padded_map, avatar_id, avatar.avatar_view)
+                    last_padded_map, last_avatar_pos = self.get_rotated_map(last_padded_maps, last_map, min_padding, int(avatar.last_orientation), avatar.last_position)
+                    last_avatar_ids = self.get_rotated_map(last_padded_ids_maps, last_avatar_ids_map, min_padding, int(avatar.last_orientation), padding_char=-1)[0] if last_padded_ids_maps is not None else None
+                    last_observation, _ = self.crop_observation(last_padded_map, avatar_id, avatar.avatar_view, last_avatar_pos, last_avatar_ids)
                     avatar.set_last_partial_observation(last_observation)
                 # If the avatar just revived, set the last observation to None
                 elif last_map is not None and avatar.just_revived:
                     avatar.set_last_partial_observation(None)
 
-    def crop_observation(self, map, avatar_id, avatar_view):
+    def get_padded_maps(self, map) -> dict:
+        """Returns the cache of the padded and rotated views of a map. The caches of the current and the last maps and
+        their avatar ids are kept, so the last observations of the next step reuse the views of this step instead of padding the map again.
+
+        Args:
+            map (np.ndarray): Global map of a step
+
+        Returns:
+            dict: Padded maps by padding and rotated views by padding and orientation
+        """
+        for cached_map, padded_maps in self._padded_maps:
+            if cached_map is map:
+                return padded_maps
+        padded_maps = {}
+        self._padded_maps = self._padded_maps[-3:] + [(map, padded_maps)]
+        return padded_maps
+
+    def get_rotated_map(self, padded_maps: dict, map, min_padding: int, orientation: int, avatar_position: tuple | None = None, padding_char="-") -> tuple:
+        """Returns the map padded to a square and rotated to the orientation of an avatar.
+        The map is padded once for each padding and the rotations are views of the padded map, without copies.
+
+        Args:
+            padded_maps (dict): Cache of the padded maps of the map, returned by get_padded_maps
+            map (np.ndarray): Global map
+            min_padding (int): Minimum padding around the map
+            orientation (int): Orientation of the avatar. 0: North, 1: East, 2: South, 3: West
+            avatar_position (tuple | None, optional): Position (row, column) of the avatar in the global map. Defaults to None.
+            padding_char (optional): Value of the padding, the avatar ids maps are padded with -1. Defaults to "-".
+
+        Returns:
+            tuple: Rotated view of the padded map and the position of the avatar on it, None if the avatar position is not given
+        """
+        orientation = orientation % 4
+        if (min_padding, orientation) not in padded_maps:
+            if min_padding not in padded_maps:
+                padded_maps[min_padding] = self.pad_matrix_to_square(map, min_padding, padding_char)
+            padded_maps[(min_padding, orientation)] = np.rot90(padded_maps[min_padding], k=orientation)
+        rotated_map = padded_maps[(min_padding, orientation)]
+        if avatar_position is None:
+            return rotated_map, None
+
+        # Position of the avatar after the padding and the counterclockwise rotations of np.rot90
+        size = rotated_map.shape[0]
+        offset = (size - max(map.shape)) // 2
+        row, col = avatar_position[0] + offset, avatar_position[1] + offset
+        for _ in range(orientation):
+            row, col = size - 1 - col, row
+        return rotated_map, (row, col)
+
+    def crop_observation(self, map, avatar_id, avatar_view, avatar_position: tuple | None = None, avatar_ids=None):
         # get avatar position in matrix
-        avatar_pos = np.where(map == str(avatar_id))
-        avatar_pos = list(zip(avatar_pos[1], avatar_pos[0]))[0]
+        avatar_symbol = ord(get_avatar_symbol(avatar_id))
+        if avatar_position is None or map[avatar_position] != avatar_symbol:
+            avatar_pos = np.where(map == avatar_symbol) if avatar_ids is None else np.where(avatar_ids == avatar_id)
+            avatar_pos = list(zip(avatar_pos[1], avatar_pos[0]))[0]
+        else:
+            avatar_pos = (avatar_position[1], avatar_position[0])
         upper_bound = avatar_pos[1] - avatar_view.get("forward")
         left_bound = avatar_pos[0] - avatar_view.get("left")
         lower_bound = avatar_pos[1] + avatar_view.get("backward") + 1
         right_bound = avatar_pos[0] + avatar_view.get("right") + 1
-        observation = matrix_to_string(map[upper_bound:lower_bound, left_bound:right_bound])
-        observation = observation.replace(str(avatar_id), "#")
-        agents_in_observation = self.get_agents_in_observation(observation)
+        window = map[upper_bound:lower_bound, left_bound:right_bound].copy()
+        window[avatar_view.get("forward"), avatar_view.get("left")] = ord("#")
+        observation = grid_to_string(window)
+        if avatar_ids is None:
+            agents_in_observation = self.get_agents_in_observation(observation)
+        else:
+            # The other avatars of the window, in the order they are read
+            window_ids = avatar_ids[upper_bound:lower_bound, left_bound:right_bound]
+            window_ids = window_ids[window_ids >= 0].tolist()
+            agents_in_observation = {str(other_id): self.avatars[other_id].name for other_id in dict.fromkeys(window_ids) if other_id != avatar_id}
         return observation, agents_in_observation
 
     def get_agents_in_observation(self, observation):
-        digits_list = []
-        pattern = r'\d+'
-
-        for string in observation:
-            digits = re.findall(pattern, string)
-            digits_list.extend(digits)
+        # Every digit of the observation is an agent
+        digits_list = re.findall(r'\d', observation)
 
         agents = {}
         for digit in digits_list:
@@ -215,6 +282,8 @@ class SceneDescriptor:
 
         new_dim = max_dim + 2 * total_padding
 
+        if matrix.dtype == np.uint8:
+            padding_char = ord(padding_char)
         padded_matrix = np.full((new_dim, new_dim), padding_char, dtype=matrix.dtype)
 
         start_row = total_padding
@@ -230,11 +299,20 @@ class SceneDescriptor:
             avatar.reset_observation_variables()
 
     def parse_timestep(self, timestep):
-        
-        map = timestep.observation["GLOBAL.TEXT"].item().decode("utf-8")
-        map = parse_string_to_matrix(map)
-        # Execute the modify_map_with_rgb function if it exists
-        map = substrate_utils.modify_map_with_rgb(map, timestep.observation["WORLD.RGB"]) if hasattr(substrate_utils, 'modify_map_with_rgb') else map
+        """Parses the global map of a timestep into a grid of uint8 symbols with the alive avatars on it, and updates the avatars
+        and the layer of avatar ids
+
+        Args:
+            timestep (dm_env.TimeStep): Timestep of the environment
+
+        Returns:
+            tuple: Grid of the global map and the matrix of zaps
+        """
+        grid = parse_string_to_grid(timestep.observation["GLOBAL.TEXT"].item().decode("utf-8"))
+        avatar_ids_map = np.full(grid.shape, -1, dtype=np.int16)
+        # Execute the modify_map_with_rgb function if it exists, it works with the map of characters
+        if hasattr(substrate_utils, 'modify_map_with_rgb'):
+            grid = matrix_to_grid(substrate_utils.modify_map_with_rgb(grid_to_matrix(grid), timestep.observation["WORLD.RGB"]))
         
         zaps = timestep.observation["WORLD.WHO_ZAPPED_WHO"]
         states = timestep.observation["WORLD.AVATAR_STATES"]
@@ -243,7 +321,8 @@ class SceneDescriptor:
             _id = avatar_id + 1
             position = timestep.observation[f"{_id}.POSITION"]
             if states[avatar_id]: # Only include the avatar in the map if it is alive
-                map[position[1], position[0]] = avatar_id
+                grid[position[1], position[0]] = ord(get_avatar_symbol(avatar_id))
+                avatar_ids_map[position[1], position[0]] = avatar_id
             avatar.set_position(position[1], position[0])
             avatar.set_orientation(timestep.observation[f"{_id}.ORIENTATION"])
             avatar.set_reward(timestep.observation[f"{_id}.REWARD"])
@@ -251,5 +330,6 @@ class SceneDescriptor:
             if movement_states is not None:
                 avatar.set_is_movement_allowed(movement_states[avatar_id])
 
-        return map, zaps
+        self.last_avatar_ids_map, self.avatar_ids_map = self.avatar_ids_map, avatar_ids_map
+        return grid, zaps
     
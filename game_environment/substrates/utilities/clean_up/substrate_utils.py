@@ -1,5 +1,5 @@
 from agent.memory_structures.short_term_memory import ShortTermMemory
-from game_environment.utils import connected_elems_map, get_element_global_pos, check_agent_out_of_game, get_matrix
+from game_environment.utils import connected_elems_map, get_element_global_pos, check_agent_out_of_game, get_matrix, get_observed_changes_by_rules, DIGITS
 import numpy as np
 from game_environment.server import get_scenario_map
 
@@ -145,7 +145,7 @@ def get_specific_substrate_obs(local_map:str, local_position:tuple, global_posit
 
 
 
-def get_observed_changes(observed_map: str, last_observed_map: str | None, agent_local_position: tuple, agent_global_position: tuple, agent_orientation: int, game_time: str, players_names: dict, agent_name:str) -> list[tuple[str, str]]:
+def get_observed_changes(observed_map: str, last_observed_map: str | None, agent_local_position: tuple, agent_global_position: tuple, agent_orientation: int, game_time: str, players_names: dict, agent_name:str, avatar_ids: tuple | None = None) -> list[tuple[str, str]]:
     """Create a list of observations of the changes in the environment
     
     Args:
@@ -155,6 +155,7 @@ def get_observed_changes(observed_map: str, last_observed_map: str | None, agent
         agent_global_position (tuple): Global position of the agent
         agent_orientation (int): Orientation of the agent
         game_time (str): Current game time
+        avatar_ids (tuple | None, optional): Layers of avatar ids of the last and the current global maps. Defaults to None.
 
     Returns:
         list[tuple[str, str]]: List of tuples with the changes in the environment, and the game time
@@ -168,36 +169,22 @@ def get_observed_changes(observed_map: str, last_observed_map: str | None, agent
     
     curr_m = get_matrix(observed_map)
     last_m = get_matrix(last_observed_map)
-    for index in np.ndindex(curr_m.shape):
-        curr_el = curr_m[index]
-        last_el = last_m[index]
-        if curr_el != last_el:
-            # If someone attacked nearby
-            if last_el.isnumeric() and curr_el == 'B':
-                el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-                observations.append((f"Someone was attacked at position {el_pos}.", game_time))
-            elif curr_el == 'B':
-                el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-                observations.append((f"Observed a ray beam from an attack at position {el_pos}.", game_time))
-            elif last_el == 'B':
-                pass
-            # If an apple was taken
-            elif last_el == 'A':
-                agent_id = int(curr_el)
-                agent_name = players_names[agent_id]
-                el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-                observations.append((f"Observed that agent {agent_name} took an apple from position {el_pos}.", game_time))
-            # If grass desappeared
-            elif last_el == 'G' and curr_el == 'F':
-                el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-                observations.append((f"Observed that the grass at position {el_pos} disappeared.", game_time))
-            # If grass appeared
-            elif last_el == 'F' and curr_el == 'G':
-                el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-                observations.append((f"Observed that grass to grow apples appeared at position {el_pos}.", game_time))
-            # If an apple appeared
-            elif last_el == 'G' and curr_el == 'A':
-                el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-                observations.append((f"Observed that an apple grew at position {el_pos}.", game_time))
-
-    return observations
+    def describe_apple_taken(last_el: str, curr_el: str, el_pos: list[int]) -> str:
+        agent_name = players_names[int(curr_el)]
+        return f"Observed that agent {agent_name} took an apple from position {el_pos}."
+
+    rules = [
+        # If someone attacked nearby
+        (DIGITS, 'B', "Someone was attacked at position {position}."),
+        (None, 'B', "Observed a ray beam from an attack at position {position}."),
+        ('B', None, None),
+        # If an apple was taken
+        ('A', None, describe_apple_taken),
+        # If grass desappeared
+        ('G', 'F', "Observed that the grass at position {position} disappeared."),
+        # If grass appeared
+        ('F', 'G', "Observed that grass to grow apples appeared at position {position}."),
+        # If an apple appeared
+        ('G', 'A', "Observed that an apple grew at position {position}."),
+    ]
+    return get_observed_changes_by_rules(curr_m, last_m, rules, agent_local_position, agent_global_position, agent_orientation, game_time, avatar_ids=avatar_ids)
@@ -1,12 +1,14 @@
 import json
 from agent.memory_structures.short_term_memory import ShortTermMemory
-from game_environment.utils import connected_elems_map, get_element_global_pos, check_agent_out_of_game, get_matrix, process_observed_matrices
+from game_environment.utils import connected_elems_map, get_element_global_pos, check_agent_out_of_game, get_matrix, process_observed_matrices, get_observed_changes_by_rules, get_attack_description, get_sprites_colors, get_local_entities, DIGITS
 import numpy as np
 from game_environment.server import get_scenario_map
 
 substrate_name = "coins_original"
 scenario_obstacles = {"impassable_obstacles": ["W", "$"] + [str(i) for i in range(10)],
                       "passable_obstacles": ["r, y"]}
+# Elements described in the observations, the observations generator takes them from the global map once per step
+entities_symbols = ["r", "R", "y", "Y"] + list(DIGITS)
 
 
 
@@ -126,7 +128,7 @@ def get_connected_elements(global_map: str):
     
     
     
-def get_specific_substrate_obs(local_map:str, local_position:tuple, global_position:tuple, agent_orientation:int, connected_elements:dict, symbols:dict, **kwargs):
+def get_specific_substrate_obs(local_map:str, local_position:tuple, global_position:tuple, agent_orientation:int, connected_elements:dict, symbols:dict, visible_entities: list | None = None, **kwargs):
         
         """
         Description: Returns a list with the descriptions of the coins observed by the agent
@@ -136,34 +138,32 @@ def get_specific_substrate_obs(local_map:str, local_position:tuple, global_posit
             local_position (tuple): Local position of the agent
             global_position (tuple): Global position of the agent
             agent_orientation (int): Orientation of the agent
+            visible_entities (list | None, optional): Entities in the observation window of the agent. Defaults to None, the local map is read.
             
         Returns:
             list: List with the descriptions of the coins observed by the agent
         """
         
         obaservations = []
+        if visible_entities is None:
+            visible_entities = get_local_entities(local_map, entities_symbols, local_position, global_position, agent_orientation)
+
         # Get coins (C) observed descriptions
-        for i, row in enumerate(local_map.split('\n')):
-            for j, char in enumerate(row):
-                if char == 'r' or char == 'R':
-                    coin_global_pos = get_element_global_pos((i,j), local_position, global_position, agent_orientation)
-                    obaservations.append("Observed a red coin at position {}".format(coin_global_pos))
-                elif char == 'y' or char == 'Y':
-                    coin_global_pos = get_element_global_pos((i,j), local_position, global_position, agent_orientation)
-                    obaservations.append("Observed a yellow coin at position {}".format(coin_global_pos))
-                else:
-                    try:
-                        other_agent_id = int(char)
-                        other_agent_team = 'yellow' if other_agent_id%2 == 0  else 'red'
-                        other_agent_name = agents_context[other_agent_id]['name']
-                        #other_agent_pos = get_element_global_pos((i,j), local_position, global_position, agent_orientation)
-                        #obaservations.append(f"Observed agent {other_agent_name} from {other_agent_team} team at position {other_agent_pos}")
-                        #Observation above is omited because the global function says the same thing but without team info.
-                        
-                        #Add observation saying that observes agent is from team red or yellow
-                        obaservations.append(f"Observed agent {other_agent_name} is from {other_agent_team} team ")
-                    except:
-                        pass
+        for char, _, coin_global_pos in visible_entities:
+            if char == 'r' or char == 'R':
+                obaservations.append("Observed a red coin at position {}".format(coin_global_pos))
+            elif char == 'y' or char == 'Y':
+                obaservations.append("Observed a yellow coin at position {}".format(coin_global_pos))
+            else:
+                try:
+                    other_agent_id = int(char)
+                    other_agent_team = 'yellow' if other_agent_id%2 == 0  else 'red'
+                    other_agent_name = agents_context[other_agent_id]['name']
+                    #Observation of the agent position is omited because the global function says the same thing but without team info.
+                    #Add observation saying that observes agent is from team red or yellow
+                    obaservations.append(f"Observed agent {other_agent_name} is from {other_agent_team} team ")
+                except:
+                    pass
                     
         return obaservations
     
@@ -171,7 +171,7 @@ def get_specific_substrate_obs(local_map:str, local_position:tuple, global_posit
 
 
 
-def get_observed_changes( observed_map: str, last_observed_map: str | None, agent_local_position: tuple, agent_global_position: tuple, agent_last_global_position: tuple, agent_orientation: int, agent_last_orientation: int, game_time: str, players_names:dict, agent_name: str, self_symbol:str) -> list[tuple[str, str]]:
+def get_observed_changes( observed_map: str, last_observed_map: str | None, agent_local_position: tuple, agent_global_position: tuple, agent_last_global_position: tuple, agent_orientation: int, agent_last_orientation: int, game_time: str, players_names:dict, agent_name: str, self_symbol:str, avatar_ids: tuple | None = None) -> list[tuple[str, str]]:
     """
     Create a list of observations of the changes in the environment by comparing the current and last observed maps.
 
@@ -187,6 +187,7 @@ def get_observed_changes( observed_map: str, last_observed_map: str | None, agen
         player_names (dict): Dictionary with the names of the players.
         agent_name (str): Name of the agent.
         self_symbol (str): Symbol of the agent.
+        avatar_ids (tuple | None, optional): Layers of avatar ids of the last and the current global maps. Defaults to None.
 
     Returns:
         list[tuple[str, str]]: List of tuples with the changes in the environment and the game time.
@@ -214,55 +215,32 @@ def get_observed_changes( observed_map: str, last_observed_map: str | None, agen
             pad_token
         )
 
-    for index in np.ndindex(curr_m.shape):
-        curr_el = curr_m[index]
-        last_el = last_m[index]
-        # Skip if the elements are the same
-        if curr_el == last_el:
-            continue
-    
+    def describe_coin_taken(last_el: str, curr_el: str, el_pos: list[int]) -> str | None:
+        color_coin = 'red' if last_el == 'r' else 'yellow'
+        if curr_el == 'F':
+            return f"Observed that {color_coin} coin disappeared at position {el_pos}."
+        elif curr_el == self_symbol:
+            return f"I took a {color_coin} coin at position {el_pos}."
+        elif curr_el.isnumeric():
+            other_agent_name = players_names[int(curr_el)]
+            other_agent_team = get_agent_team_by_name(other_agent_name)
+            return f"Observed that agent {other_agent_name} from {other_agent_team} team took a {color_coin} coin from position {el_pos}."
+        return None
+
+    def describe_coin_appeared(last_el: str, curr_el: str, el_pos: list[int]) -> str:
+        color_coin = 'red' if curr_el == 'r' else 'yellow'
+        return f"Observed that {color_coin} coin appeared at position {el_pos}."
+
+    rules = [
         # If someone attacked nearby
-        if curr_el == pad_token or last_el == pad_token:
-            pass
-        elif last_el.isnumeric() and curr_el == 'B':
-            el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-            agent_name = players_names[int(last_el)]
-            # If agent attacked the agent did not move
-            if agent_moved or agent_turned:
-                observations.append((f"{agent_name} was attacked at position {el_pos}.", game_time))
-            else:
-                if agent_local_position[0] >= 3 and curr_m[agent_local_position[0]-3,agent_local_position[1]] == 'B' and curr_m[agent_local_position[0],agent_local_position[1]-1] == 'B' and curr_m[agent_local_position[0],agent_local_position[1]+1] == 'B':
-                    observations.append((f"I successfully attacked {agent_name} at position {el_pos}.", game_time))
-                else:
-                    observations.append((f"{agent_name} was attacked at position {el_pos}.", game_time))
-                    
-        elif last_el == 'B':
-            pass
-        
+        (DIGITS, 'B', get_attack_description(players_names, curr_m, agent_local_position, agent_moved, agent_turned)),
+        ('B', None, None),
         # If an coin was taken
-        elif last_el in ['r', 'y']:
-            color_coin = 'red' if last_el == 'r' else 'yellow'
-            agent_team = get_agent_team_by_name(agent_name)
-            if curr_el == 'F':
-                el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-                observations.append((f"Observed that {color_coin} coin disappeared at position {el_pos}.", game_time))
-            elif curr_el == self_symbol:
-                el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-                observations.append((f"I took a {color_coin} coin at position {el_pos}.", game_time))            
-            elif curr_el.isnumeric(): 
-                other_agent_id = int(curr_el)
-                other_agent_name = players_names[other_agent_id]
-                other_agent_team = get_agent_team_by_name(other_agent_name)
-                el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-                observations.append((f"Observed that agent {other_agent_name} from {other_agent_team} team took a {color_coin} coin from position {el_pos}.", game_time))
-
+        ('ry', None, describe_coin_taken),
         # If coin appeared
-        elif last_el == 'F' and (curr_el == 'r' or curr_el == 'y'):
-            el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-            color_coin = 'red' if curr_el == 'r' else 'yellow'
-            observations.append((f"Observed that {color_coin} coin appeared at position {el_pos}.", game_time))
-
-    return observations
+        ('F', 'ry', describe_coin_appeared),
+    ]
+    return get_observed_changes_by_rules(curr_m, last_m, rules, agent_local_position, agent_global_position, agent_orientation, game_time, pad_token, avatar_ids=avatar_ids)
 
 
 def modify_map_with_rgb(symbolic_map: np.array, rgb_map: np.array):
@@ -280,11 +258,17 @@ def modify_map_with_rgb(symbolic_map: np.array, rgb_map: np.array):
     return calculate_coins_colors(symbolic_map, rgb_map)
 
 # Utils functions for Scene Descriptor fixes
+COINS_COLORS = {"r": (238, 102, 119), "y": (204, 187, 68)}
+# Color of the coins seen in the last step by position, with the pixel of the RGB map that set the color
+coins_colors_cache = {}
+coins_colors_cache_shape = None
+
 def calculate_coins_colors( current_matrix_map, map_rgb):
     """
     Calculate the coins and colors in the map based on the text and RGB map 
     coins are represented with a character "c" in the current_matrix_map. The colors will be extracted from the RGB map
     which is a representation of the pixels in the map. We are using the shapes to identify the colors in the map.
+    The color of a coin is kept while the pixel that set it does not change, only the new coins are looked up in the RGB map.
     
     Args:
         current_matrix_map (np.array): Matrix map with chars with the current state of the game, where the coins are represented with "c"
@@ -294,38 +278,30 @@ def calculate_coins_colors( current_matrix_map, map_rgb):
         np.array: Matrix map with the coins and colors replaced by the corresponding character.
         Possible colors are "red"  (238, 102, 119) that is replaced by "r" and "yellow" that is replaced by "y" (204, 187, 68),
     """
-    # Get the coins in the map
-    coins = np.where(current_matrix_map == "c")
-    coins = list(zip(coins[1], coins[0]))  # Reversed coordinates (y, x) due to numpy indexing
-    
-    matrix_map_width = current_matrix_map.shape[1]
-    matrix_map_height = current_matrix_map.shape[0]
-    
-    rgb_map_width = map_rgb.shape[1]
-    rgb_map_height = map_rgb.shape[0]
-    
-    # Scale factor for coordinates conversion
-    scale_x = rgb_map_width / matrix_map_width
-    scale_y = rgb_map_height / matrix_map_height
-    
-    for coin in coins:
-        x, y = coin
-        # Scale coordinates to match RGB map
-        x_rgb = int(x * scale_x)
-        y_rgb = int(y * scale_y)
-        x_rgb_end = int((x + 1) * scale_x)-1
-        y_rgb_end = int((y + 1) * scale_y)-1
-        # Check if the scaled coordinates are within the boundaries of the RGB map
-        if 0 <= x_rgb < rgb_map_width and 0 <= y_rgb < rgb_map_height:
-            # Print all the colors between the scaled coordinates                
-            for i in range(x_rgb, x_rgb_end):
-                for j in range(y_rgb, y_rgb_end):
-                    color_char = get_color_name(map_rgb[j, i])
-                    if color_char == "r" or color_char == "y":
-                        current_matrix_map[y, x] = color_char
-                        break
+    global coins_colors_cache, coins_colors_cache_shape
+    if coins_colors_cache_shape != map_rgb.shape:
+        coins_colors_cache, coins_colors_cache_shape = {}, map_rgb.shape
 
-            
+    coins = [tuple(coin) for coin in np.argwhere(current_matrix_map == "c").tolist()]
+    cached = [coin for coin in coins if coin in coins_colors_cache]
+    if cached:
+        # A coin keeps its color while the pixel that set it still has that color
+        pixels = np.array([coins_colors_cache[coin][1] for coin in cached])
+        colors = np.array([COINS_COLORS[coins_colors_cache[coin][0]] for coin in cached])
+        unchanged = (map_rgb[pixels[:, 0], pixels[:, 1]] == colors).all(axis=1)
+        cached = [coin for coin, keep in zip(cached, unchanged) if keep]
+    colors_cache = {coin: coins_colors_cache[coin] for coin in cached}
+
+    new_coins = [coin for coin in coins if coin not in colors_cache]
+    colors, pixels = get_sprites_colors(map_rgb, current_matrix_map.shape, np.array(new_coins, dtype=int), np.array(list(COINS_COLORS.values())))
+    color_chars = list(COINS_COLORS)
+    for coin, color, pixel in zip(new_coins, colors.tolist(), pixels.tolist()):
+        if color >= 0:
+            colors_cache[coin] = (color_chars[color], pixel)
+
+    for (y, x), (color_char, _) in colors_cache.items():
+        current_matrix_map[y, x] = color_char
+    coins_colors_cache = colors_cache
     return current_matrix_map
 def get_color_name( color):
     """
@@ -1,33 +1,46 @@
 import os
 import json
+import numpy as np
 
-from game_environment.utils import connected_elems_map, get_local_position_of_element, get_element_global_pos
+from game_environment.utils import ComponentIndex, get_local_position_of_element, get_element_global_pos, get_elements_global_pos
 from utils.math import manhattan_distance
+from utils.route_plan import DistanceFieldCache, get_distance_field_cache
 
-def get_nearest_apple(map:str|list[list[str]], position:tuple[int, int]) -> tuple[tuple[int, int]|None, int]:
+# Obstacles of the substrate that never change, the distance fields of the map are built over them
+static_obstacles = ['W', '$']
+
+def get_nearest_apple(map:str|list[list[str]], position:tuple[int, int], distance_fields: DistanceFieldCache | None = None, global_position: tuple[int, int] | None = None, orientation: int = 0) -> tuple[tuple[int, int]|None, int]:
     """
     Get the nearest apple position
 
     Args:
         map (list[list[str]]): Map of the game
         position (tuple[int, int]): Position of the agent or reference position in the map
+        distance_fields (DistanceFieldCache | None, optional): Distance fields of the global map. If they are given, the apples are compared by
+            their walking distance around the static obstacles instead of the manhattan distance. Defaults to None.
+        global_position (tuple[int, int] | None, optional): Global position of the reference position, required with the distance fields. Defaults to None.
+        orientation (int, optional): Orientation of the agent, used with the distance fields. Defaults to 0.
 
     Returns:
         tuple[tuple[int, int], int]: Nearest apple position and its distance. If there are no apples, return None, float('inf')
     """
-    groups = connected_elems_map(map, ['A'])
-    nearest_apple = None
-    nearest_distance = float('inf')
-    for group in groups.values():
-        for apple in group['elements']:
-            distance = manhattan_distance(apple, position)
-            if distance < nearest_distance:
-                nearest_distance = distance
-                nearest_apple = apple
-
-    return nearest_apple, nearest_distance
-
-def is_apple_the_last_of_tree(game_map: list[list[str]], apple_position: tuple[int, int], agent_ids: list[str]) -> tuple[int, int]:
+    labels = ComponentIndex(map, ['A']).labels
+    apples = np.argwhere(labels > 0)
+    if len(apples) == 0:
+        return None, float('inf')
+
+    # Visit the apples tree by tree, so the ties are broken as in the trees order
+    apples = apples[np.argsort(labels[labels > 0], kind='stable')]
+    if distance_fields is not None:
+        nearest, distance = distance_fields.get_nearest(global_position, get_elements_global_pos(apples, position, global_position, orientation))
+        if nearest is None:
+            return None, float('inf')
+        return apples[nearest].tolist(), distance
+    distances = np.abs(apples - np.array(position)).sum(axis=1)
+    nearest = distances.argmin()
+    return apples[nearest].tolist(), int(distances[nearest])
+
+def is_apple_the_last_of_tree(game_map: list[list[str]], apple_position: tuple[int, int], agent_ids: list[str], trees_index: ComponentIndex | None = None) -> tuple[int, int]:
     """
     Evaluate if the apple is the last of the tree
 
@@ -35,27 +48,53 @@ def is_apple_the_last_of_tree(game_map: list[list[str]], apple_position: tuple[i
         game_map (list[list[str]]): Map of the game
         apple_position (tuple[int, int]): Position of the apple
         agent_ids (list[str]): List of agents ids
+        trees_index (ComponentIndex | None, optional): Index of the trees of the game map, formed by the apples, the grass and the agents. Defaults to None, it is built from the map.
 
     Returns:
         bool: True if the apple is the last of the tree, False otherwise
     """
-    groups = connected_elems_map(game_map, ['A', 'G'] + agent_ids)
-    for group in groups.values():
-        apples = []
+    if trees_index is None:
+        trees_index = ComponentIndex(game_map, ['A', 'G'] + agent_ids)
 
-        # We only want to consider the tree that contains the apple
-        if list(apple_position) not in group['elements']:
-            continue
+    # We only want to consider the tree that contains the apple
+    tree = trees_index.get_component(apple_position)
+    if tree is None:
+        return False
+    return trees_index.count('A')[tree] == 1
+
+def get_distance_fields(record_obj, initial_map: list[list[str]] | None) -> DistanceFieldCache | None:
+    """
+    Get the distance fields of the map, they are built the first time and shared with the agents
 
-        for elem in group['elements']:
-            element = game_map[elem[0]][elem[1]]
-            if element == 'A':
-                apples.append(elem)
+    Args:
+        record_obj (Recorder): Recorder object
+        initial_map (list[list[str]] | None): Initial map
 
-        if len(apples) == 1:
-            return True
+    Returns:
+        DistanceFieldCache | None: Distance fields of the map. None if there is no map, the manhattan distance is used instead
+    """
+    if getattr(record_obj, 'distance_fields', None) is None and initial_map is not None and len(initial_map) > 0:
+        record_obj.distance_fields = get_distance_field_cache(initial_map, static_obstacles)
+    return getattr(record_obj, 'distance_fields', None)
 
-    return False
+def get_distance_to_apple(record_obj, agent_position: tuple[int, int], apple_position: tuple[int, int]) -> float:
+    """
+    Get the distance from an agent to an apple, measured as in get_nearest_apple
+
+    Args:
+        record_obj (Recorder): Recorder object
+        agent_position (tuple[int, int]): Global position of the agent
+        apple_position (tuple[int, int]): Global position of the apple
+
+    Returns:
+        float: Walking distance around the static obstacles if the recorder has the distance fields, manhattan distance otherwise.
+            inf if the apple can not be reached
+    """
+    distance_fields = getattr(record_obj, 'distance_fields', None)
+    if distance_fields is None:
+        return manhattan_distance(agent_position, apple_position)
+    distance = distance_fields.get_distances(tuple(apple_position))[agent_position[0], agent_position[1]]
+    return float('inf') if distance < 0 else int(distance)
 
 def record(record_obj, timestep, description: dict):
     """
@@ -97,6 +136,16 @@ def record_game_state_before_actions(record_obj, initial_map: list[list[str]], c
     if current_actions_map is None:
         return
 
+    # The distance fields of the map are shared with the agents
+    distance_fields = get_distance_fields(record_obj, initial_map)
+
+    # The trees index is updated only where the map changed since the last step
+    agent_ids = list(record_obj.agents_ids.values())
+    if not hasattr(record_obj, 'trees_index'):
+        record_obj.trees_index = ComponentIndex(current_map, ['A', 'G'] + agent_ids)
+    else:
+        record_obj.trees_index.update(current_map)
+
     for agent in current_actions_map:
         scene = scene_description[agent]
         # Check if is the last apple scenario
@@ -104,10 +153,10 @@ def record_game_state_before_actions(record_obj, initial_map: list[list[str]], c
         # TODO: The following corner cases are not taken in account
         ## Since the apple is searched in the agent's observation window, if someone attacked, the ray beam could hide the apple
         ## Might happen that there are two apples at the same distance and just one of them is a last apple
-        nearest_apple, distance = get_nearest_apple(scene['observation'], scene['local_position'])
+        nearest_apple, distance = get_nearest_apple(scene['observation'], scene['local_position'], distance_fields, scene['global_position'], scene['orientation'])
         if nearest_apple:
             nearest_apple = get_element_global_pos(nearest_apple, scene['local_position'], scene['global_position'], scene['orientation'])
-            is_last = is_apple_the_last_of_tree(current_map, nearest_apple, list(record_obj.agents_ids.values()))
+            is_last = is_apple_the_last_of_tree(current_map, nearest_apple, agent_ids, record_obj.trees_index)
 
         if is_last:
             # Update the last_apple_object
@@ -130,15 +179,13 @@ def record_elements_status(record_obj, initial_map: list[list[str]], current_map
         initial_map (str): Initial map
         current_map (list[list[str]]): Current map
     """
-    connected_elements = connected_elems_map(initial_map, ['A'])
-
-    trees = {}
+    # The trees of the initial map do not change, they are indexed once
+    if not hasattr(record_obj, 'initial_trees_index'):
+        record_obj.initial_trees_index = ComponentIndex(initial_map, ['A'])
+        record_obj.initial_trees = [tree for tree, component in record_obj.initial_trees_index.get_components().items() if len(component['elements']) > 1]
 
-    for elem_key in connected_elements:
-        elements = connected_elements[elem_key]['elements']
-        if len(elements) > 1:
-            apples_count = len([elem for elem in elements if current_map[elem[0]][elem[1]] == 'A'])
-            trees[elem_key] = apples_count
+    apples_count = record_obj.initial_trees_index.count('A', current_map)
+    trees = {tree: apples_count[tree] for tree in record_obj.initial_trees}
 
     with open(os.path.join(record_obj.log_path, "trees_history.txt"), "a") as f:
         f.write(f"{record_obj.step}: {trees}\n")
@@ -150,7 +197,8 @@ def record_elements_status(record_obj, initial_map: list[list[str]], current_map
             if record_obj.last_apple_object[agent]['last_apple_pos'] is not None:
                 # Check if the agent moved towards the last apple
                 agent_position = get_local_position_of_element(current_map, record_obj.agents_ids[agent])
-                new_distance = manhattan_distance(agent_position, record_obj.last_apple_object[agent]['last_apple_pos'])
+                # The distance is measured as when the last apple was seen
+                new_distance = get_distance_to_apple(record_obj, agent_position, record_obj.last_apple_object[agent]['last_apple_pos'])
                 if new_distance < record_obj.last_apple_object[agent]['distance']:
                     record_obj.last_apple_object[agent]['move_towards_last_apple'] += 1
                 # Check if the agent took the last apple
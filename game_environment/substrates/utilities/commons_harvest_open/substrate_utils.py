@@ -1,6 +1,7 @@
 from agent.memory_structures.short_term_memory import ShortTermMemory
-from game_environment.utils import connected_elems_map, get_element_global_pos, check_agent_out_of_game, get_matrix, process_observed_matrices
+from game_environment.utils import connected_elems_map, get_element_global_pos, get_elements_global_pos, check_agent_out_of_game, get_matrix, process_observed_matrices, get_observed_changes_by_rules, get_attack_description, DIGITS
 import numpy as np
+from scipy.ndimage import label
 from game_environment.server import get_scenario_map
 
 substrate_name = "commons_harvest_open"
@@ -109,10 +110,29 @@ def get_connected_elements(global_map: str):
     
     connected_elements = {}
     connected_elements['global_trees'] = connected_elems_map(global_map, ['A', 'G'])
+    connected_elements['global_trees_labels'] = get_trees_labels(connected_elements['global_trees'])
     
     return connected_elements
-    
-    
+
+
+def get_trees_labels(global_trees: dict) -> np.ndarray:
+    """
+    Get a raster of the global map with the id of the tree of every cell
+
+    Args:
+        global_trees (dict): Connected elements of the trees in the global map
+
+    Returns:
+        np.ndarray: Matrix with the tree id of every cell, 0 for the cells that do not belong to a tree
+    """
+    elements = [element for tree_data in global_trees.values() for element in tree_data['elements']]
+    if not elements:
+        return np.zeros((0, 0), dtype=int)
+    labels = np.zeros(np.max(elements, axis=0) + 1, dtype=int)
+    for tree_id, tree_data in global_trees.items():
+        rows, cols = np.array(tree_data['elements']).T
+        labels[rows, cols] = tree_id
+    return labels
     
     
 def get_specific_substrate_obs(local_map:str, local_position:tuple, global_position:tuple, agent_orientation:int, connected_elements:dict, symbols:dict, **kwargs):
@@ -132,56 +152,72 @@ def get_specific_substrate_obs(local_map:str, local_position:tuple, global_posit
         """
         tree_elements = ['A', 'G']
         elements_to_find = tree_elements + symbols['other_players_symbols'] + [symbols['self_symbol']]
-        local_tree_elements = connected_elems_map(local_map, elements_to_find=elements_to_find)
+        global_trees = connected_elements['global_trees']
+        global_labels = connected_elements.get('global_trees_labels')
+        if global_labels is None:
+            global_labels = get_trees_labels(global_trees)
+
+        local_matrix = np.array([list(row) for row in local_map.split('\n') if row != ''])
+        local_labels, num_local_groups = label(np.isin(local_matrix, elements_to_find))
+        if num_local_groups == 0:
+            return []
+
+        # Cells of the local groups sorted by group, each group keeps its cells in row-major order
+        flat_labels = local_labels.ravel()
+        cells = np.flatnonzero(flat_labels)
+        cells = cells[np.argsort(flat_labels[cells], kind='stable')]
+        group_sizes = np.bincount(flat_labels[cells], minlength=num_local_groups + 1)[1:]
+        group_starts = np.concatenate(([0], np.cumsum(group_sizes)[:-1]))
+        cells_types = local_matrix.ravel()[cells]
+
+        # Tree of the global map under every cell of the local groups
+        cells_local_pos = np.stack(np.unravel_index(cells, local_matrix.shape), axis=1)
+        cells_global_pos = get_elements_global_pos(cells_local_pos, local_position, global_position, agent_orientation)
+        in_map = np.all((cells_global_pos >= 0) & (cells_global_pos < global_labels.shape), axis=1)
+        cells_trees = np.zeros(len(cells), dtype=int)
+        cells_trees[in_map] = global_labels[cells_global_pos[in_map, 0], cells_global_pos[in_map, 1]]
+
+        is_apple, is_grass = cells_types == 'A', cells_types == 'G'
+        group_ids = flat_labels[cells] - 1
+        apples_per_group = np.bincount(group_ids, weights=is_apple, minlength=num_local_groups).astype(int)
+        grass_per_group = np.bincount(group_ids, weights=is_grass, minlength=num_local_groups).astype(int)
+
+        # A local group belongs to the global tree under its first cell. As before, a tree takes only the first
+        # group of each type of first element, the second element is checked in case an agent overlaps the first one
+        groups_per_tree = {}
+        for group, start in enumerate(group_starts):
+            element_type = cells_types[start]
+            second_element_type = cells_types[start + 1] if group_sizes[group] > 1 else None
+            if (element_type not in tree_elements) and (second_element_type not in tree_elements):
+                continue
+            tree_id = cells_trees[start]
+            if tree_id == 0:
+                continue
+            tree_groups = groups_per_tree.setdefault(tree_id, {})
+            tree_groups.setdefault(element_type, group)
+
         list_trees_observations = []
-        trees_observed = {}
-        for global_tree_id, global_tree_data in connected_elements['global_trees'].items():
-            apple_count, grass_count = 0, 0
-            apple_list, grass_list = [], []
-            for local_tree_data in local_tree_elements.values():
-                # Check if the group is a tree element
-                first_element = local_tree_data['elements'][0]
-                element_type = local_map.split('\n')[first_element[0]][first_element[1]]
-                second_element_type = None
-                if len(local_tree_data['elements'])>1: # We'll make a double check to verify if the first elelment is being overlapped by another element
-                    second_element = local_tree_data['elements'][1] 
-                    second_element_type = local_map.split('\n')[second_element[0]][second_element[1]]
-                if (element_type not in tree_elements) and (second_element_type not in tree_elements):
-                    continue
-
-                # Continue if the tree has already been observed
-                if global_tree_id in trees_observed.get(element_type, []): 
-                    continue
-
-                first_el_real_pos = get_element_global_pos(first_element, local_position, global_position, agent_orientation)
-
-                # Check if the local tree corresponds to the global tree
-                if first_el_real_pos not in global_tree_data['elements']:
-                    continue
-
-                # Find the cluster tree of the local tree
-                trees_observed[element_type] = trees_observed.get(element_type, []) + [global_tree_id]
-    
-                for apple in local_tree_data['elements']:
-                    apple_global_pos = get_element_global_pos(apple, local_position, global_position, agent_orientation)
-                    if local_map.split('\n')[apple[0]][apple[1]] == 'G':
+        cells_global_pos = cells_global_pos.tolist()
+        for global_tree_id, global_tree_data in global_trees.items():
+            tree_groups = sorted(groups_per_tree.get(global_tree_id, {}).values())
+            for group in tree_groups:
+                for cell in range(group_starts[group], group_starts[group] + group_sizes[group]):
+                    if is_grass[cell]:
                         list_trees_observations.append("Observed grass to grow apples at position {}. This grass belongs to tree {}."
-                                                    .format(apple_global_pos, global_tree_id))
-                        grass_list.append(apple_global_pos)
-                        grass_count += 1
-                    elif local_map.split('\n')[apple[0]][apple[1]] == 'A':
+                                                    .format(cells_global_pos[cell], global_tree_id))
+                    elif is_apple[cell]:
                         list_trees_observations.append("Observed an apple at position {}. This apple belongs to tree {}."
-                                                    .format(apple_global_pos, global_tree_id ))
-                        apple_list.append(apple_global_pos)
-                        apple_count += 1
+                                                    .format(cells_global_pos[cell], global_tree_id ))
 
+            apple_count = int(apples_per_group[tree_groups].sum())
+            grass_count = int(grass_per_group[tree_groups].sum())
             if apple_count > 0 or grass_count > 0:      
                 list_trees_observations.append("Observed tree {} at position {}. This tree has {} apples remaining and {} grass for apples growing on the observed map. The tree might have more apples and grass on the global map."
                                                 .format(global_tree_id, list(global_tree_data['center']), apple_count, grass_count))
         return list_trees_observations
     
 
-def get_observed_changes( observed_map: str, last_observed_map: str | None, agent_local_position: tuple, agent_global_position: tuple, agent_last_global_position: tuple, agent_orientation: int, agent_last_orientation: int, game_time: str, players_names:dict, agent_name: str, self_symbol:str) -> list[tuple[str, str]]:
+def get_observed_changes( observed_map: str, last_observed_map: str | None, agent_local_position: tuple, agent_global_position: tuple, agent_last_global_position: tuple, agent_orientation: int, agent_last_orientation: int, game_time: str, players_names:dict, agent_name: str, self_symbol:str, avatar_ids: tuple | None = None) -> list[tuple[str, str]]:
     """
     Create a list of observations of the changes in the environment by comparing the current and last observed maps.
 
@@ -197,6 +233,7 @@ def get_observed_changes( observed_map: str, last_observed_map: str | None, agen
         player_names (dict): Dictionary with the names of the players.
         agent_name (str): Name of the agent.
         self_symbol (str): Symbol of the agent.
+        avatar_ids (tuple | None, optional): Layers of avatar ids of the last and the current global maps. Defaults to None.
 
     Returns:
         list[tuple[str, str]]: List of tuples with the changes in the environment and the game time.
@@ -225,57 +262,28 @@ def get_observed_changes( observed_map: str, last_observed_map: str | None, agen
     )
 
 
-    for index in np.ndindex(curr_m.shape):
-        curr_el = curr_m[index]
-        last_el = last_m[index]
-        if curr_el != last_el:
-            # If someone attacked nearby
-            if curr_el == pad_token or last_el == pad_token:
-                pass
-            elif last_el.isnumeric() and curr_el == 'B':
-                el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-                agent_name = players_names[int(last_el)]
-                # If agent attacked the agent did not move
-                if agent_moved or agent_turned:
-                    observations.append((f"{agent_name} was attacked at position {el_pos}.", game_time))
-                else:
-                    if agent_local_position[0] >= 3 and curr_m[agent_local_position[0]-3,agent_local_position[1]] == 'B' and curr_m[agent_local_position[0],agent_local_position[1]-1] == 'B' and curr_m[agent_local_position[0],agent_local_position[1]+1] == 'B':
-                        observations.append((f"I successfully attacked {agent_name} at position {el_pos}.", game_time))
-                    else:
-                        observations.append((f"{agent_name} was attacked at position {el_pos}.", game_time))
-            # Ignore this observation for now to avoid generating multiple observations about the position where the ray beam hit
-            # elif curr_el == 'B':
-            #     # If agent attacked the agent did not move
-            #     if original_shape == curr_m.shape and agent_local_position[0] >= 3 and curr_m[agent_local_position[0]-3,agent_local_position[1]] == 'B' and curr_m[agent_local_position[0],agent_local_position[1]-1] == 'B' and curr_m[agent_local_position[0],agent_local_position[1]+1] == 'B':
-            #         pass
-            #     else:
-            #         el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-            #         observations.append((f"Observed a ray beam from an attack at position {el_pos}.", game_time))
-            elif last_el == 'B':
-                pass
-            # If an apple was taken
-            elif last_el == 'A' and curr_el != 'B':
-                el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-                if (curr_el == self_symbol):
-                    observations.append((f"I took an apple from position {el_pos}.", game_time))
-                else:
-                    agent_id = int(curr_el)
-                    agent_name = players_names[agent_id]
-                    observations.append((f"Observed that agent {agent_name} took an apple from position {el_pos}.", game_time))
-            # If grass desappeared
-            elif last_el == 'G' and curr_el == 'F':
-                el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-                observations.append((f"Observed that the grass at position {el_pos} disappeared.", game_time))
-            # If grass appeared
-            elif last_el == 'F' and curr_el == 'G':
-                el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-                observations.append((f"Observed that grass to grow apples appeared at position {el_pos}.", game_time))
-            # If an apple appeared
-            elif last_el == 'G' and curr_el == 'A':
-                el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-                observations.append((f"Observed that an apple grew at position {el_pos}.", game_time))
-
-    return observations
+    def describe_apple_taken(last_el: str, curr_el: str, el_pos: list[int]) -> str:
+        if curr_el == self_symbol:
+            return f"I took an apple from position {el_pos}."
+        agent_name = players_names[int(curr_el)]
+        return f"Observed that agent {agent_name} took an apple from position {el_pos}."
+
+    rules = [
+        # If someone attacked nearby
+        (DIGITS, 'B', get_attack_description(players_names, curr_m, agent_local_position, agent_moved, agent_turned)),
+        # Ignore the ray beams to avoid generating multiple observations about the position where the ray beam hit
+        ('B', None, None),
+        ('A', 'B', None),
+        # If an apple was taken
+        ('A', None, describe_apple_taken),
+        # If grass desappeared
+        ('G', 'F', "Observed that the grass at position {position} disappeared."),
+        # If grass appeared
+        ('F', 'G', "Observed that grass to grow apples appeared at position {position}."),
+        # If an apple appeared
+        ('G', 'A', "Observed that an apple grew at position {position}."),
+    ]
+    return get_observed_changes_by_rules(curr_m, last_m, rules, agent_local_position, agent_global_position, agent_orientation, game_time, pad_token, avatar_ids=avatar_ids)
 
 
 
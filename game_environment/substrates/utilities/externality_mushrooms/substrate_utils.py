@@ -1,11 +1,13 @@
 from agent.memory_structures.short_term_memory import ShortTermMemory
-from game_environment.utils import connected_elems_map, get_element_global_pos, check_agent_out_of_game, get_matrix, process_observed_matrices
+from game_environment.utils import connected_elems_map, get_element_global_pos, check_agent_out_of_game, get_matrix, process_observed_matrices, get_observed_changes_by_rules, get_attack_description, get_local_entities, DIGITS
 import numpy as np
 from game_environment.server import get_scenario_map
 
 substrate_name = "externality_mushrooms"
 scenario_obstacles = {"impassable_obstacles": ["W", "$", "n","S"] + [str(i) for i in range(10)],
                       "passable_obstacles": ["F", "H", "Z", "N"]}
+# Elements described in the observations, the observations generator takes them from the global map once per step
+entities_symbols = ["F", "H", "Z", "N"]
 
 def load_scenario_info(players_context: list[str]):
     """
@@ -114,7 +116,7 @@ def get_connected_elements(global_map: str):
     
     
     
-def get_specific_substrate_obs(local_map:str, local_position:tuple, global_position:tuple, agent_orientation:int, connected_elements:dict, symbols:dict, scene_description: dict):
+def get_specific_substrate_obs(local_map:str, local_position:tuple, global_position:tuple, agent_orientation:int, connected_elements:dict, symbols:dict, scene_description: dict, visible_entities: list | None = None):
         
     """
     Description: Returns a list with the descriptions of the mushrooms observed by the agent
@@ -125,6 +127,7 @@ def get_specific_substrate_obs(local_map:str, local_position:tuple, global_posit
         global_position (tuple): Global position of the agent
         agent_orientation (int): Orientation of the agent
         scene_description (dict): The complete scene description
+        visible_entities (list | None, optional): Entities in the observation window of the agent. Defaults to None, the local map is read.
         
     Returns:
         list: List with the descriptions of the mushrooms observed by the agent
@@ -140,19 +143,20 @@ def get_specific_substrate_obs(local_map:str, local_position:tuple, global_posit
     if not scene_description['is_movement_allowed']:
         observations.append("I am frozen and can't move while digesting a mushroom I ate")
 
-    for i, row in enumerate(local_map.split('\n')):
-        for j, char in enumerate(row):
-            if char in mushroom_symbols:
-                # Fetching the description from the symbols dictionary
-                mushroom_desc = mushroom_symbols[char]
-                mushroom_global_pos = get_element_global_pos((i, j), local_position, global_position, agent_orientation)
-                observations.append(f"Observed a {mushroom_desc} mushroom at position {mushroom_global_pos}")
+    if visible_entities is None:
+        visible_entities = get_local_entities(local_map, entities_symbols, local_position, global_position, agent_orientation)
+
+    for char, _, mushroom_global_pos in visible_entities:
+        if char in mushroom_symbols:
+            # Fetching the description from the symbols dictionary
+            mushroom_desc = mushroom_symbols[char]
+            observations.append(f"Observed a {mushroom_desc} mushroom at position {mushroom_global_pos}")
                 
     return observations    
 
 
 
-def get_observed_changes( observed_map: str, last_observed_map: str | None, agent_local_position: tuple, agent_global_position: tuple, agent_last_global_position: tuple, agent_orientation: int, agent_last_orientation: int, game_time: str, players_names:dict, agent_name: str, self_symbol:str) -> list[tuple[str, str]]:
+def get_observed_changes( observed_map: str, last_observed_map: str | None, agent_local_position: tuple, agent_global_position: tuple, agent_last_global_position: tuple, agent_orientation: int, agent_last_orientation: int, game_time: str, players_names:dict, agent_name: str, self_symbol:str, avatar_ids: tuple | None = None) -> list[tuple[str, str]]:
     """
     Create a list of observations of the changes in the environment by comparing the current and last observed maps.
 
@@ -168,6 +172,7 @@ def get_observed_changes( observed_map: str, last_observed_map: str | None, agen
         player_names (dict): Dictionary with the names of the players.
         agent_name (str): Name of the agent.
         self_symbol (str): Symbol of the agent.
+        avatar_ids (tuple | None, optional): Layers of avatar ids of the last and the current global maps. Defaults to None.
 
     Returns:
         list[tuple[str, str]]: List of tuples with the changes in the environment and the game time.
@@ -197,51 +202,32 @@ def get_observed_changes( observed_map: str, last_observed_map: str | None, agen
     
     mushroom_type = {'F': 'red', 'H': 'green', 'Z': 'blue', 'N': 'orange'}
 
-    for index in np.ndindex(curr_m.shape):
-        curr_el = curr_m[index]
-        last_el = last_m[index]
-
-        # Skip if the elements are the same
-        if curr_el == last_el:
-            continue
-    
+    def describe_mushroom_taken(last_el: str, curr_el: str, el_pos: list[int]) -> str:
+        mushroom_taken = mushroom_type[last_el]
+        pre = "an" if mushroom_taken[0].lower() in "aeiou" else "a"
+        element_taken = f"{pre} {mushroom_taken} mushroom"
+        if curr_el == self_symbol:
+            return f"I took {element_taken} from position {el_pos}."
+        elif curr_el.isdigit():
+            agent_name = players_names[int(curr_el)]
+            return f"Observed that agent {agent_name} took {element_taken} from position {el_pos}."
+        # If no player took it, it disappeared
+        return f"Observed that {mushroom_type[last_el]} mushroom spoiled and disappeared from position {el_pos}."
+
+    def describe_mushroom_appeared(last_el: str, curr_el: str, el_pos: list[int]) -> str:
+        mushroom = mushroom_type[curr_el]
+        pre = "an" if mushroom[0].lower() in "aeiou" else "a"
+        return f"Observed that {pre} {mushroom} mushroom grew at position {el_pos}."
+
+    mushrooms = ''.join(mushroom_type)
+    rules = [
         # If someone attacked nearby
-        if curr_el == pad_token or last_el == pad_token:
-            pass
-        elif last_el.isnumeric() and curr_el == 'B':
-            el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-            agent_name = players_names[int(last_el)]
-            # If agent attacked the agent did not move
-            if agent_moved or agent_turned:
-                observations.append((f"{agent_name} was attacked at position {el_pos}.", game_time))
-            else:
-                if agent_local_position[0] >= 3 and curr_m[agent_local_position[0]-3,agent_local_position[1]] == 'B' and curr_m[agent_local_position[0],agent_local_position[1]-1] == 'B' and curr_m[agent_local_position[0],agent_local_position[1]+1] == 'B':
-                    observations.append((f"I successfully attacked {agent_name} at position {el_pos}.", game_time))
-                else:
-                    observations.append((f"{agent_name} was attacked at position {el_pos}.", game_time))
-                    
-        elif last_el == 'B':
-            pass
+        (DIGITS, 'B', get_attack_description(players_names, curr_m, agent_local_position, agent_moved, agent_turned)),
+        ('B', None, None),
+        (mushrooms, 'B', None),
         # If a mushroom was taken
-        elif last_el in mushroom_type and curr_el != "B":
-            el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-            mushroom_taken = mushroom_type[last_el]
-            pre = "an" if mushroom_taken[0].lower() in "aeiou" else "a"
-            element_taken = f"{pre} {mushroom_taken} mushroom"
-            if (curr_el == self_symbol):
-                observations.append((f"I took {element_taken} from position {el_pos}.", game_time))
-            elif curr_el.isdigit():
-                agent_id = int(curr_el)
-                agent_name = players_names[agent_id]
-                observations.append((f"Observed that agent {agent_name} took {element_taken} from position {el_pos}.", game_time))
-            else:
-                # If no player took it, it disappeared
-                observations.append((f"Observed that {mushroom_type[last_el]} mushroom spoiled and disappeared from position {el_pos}.", game_time))
+        (mushrooms, None, describe_mushroom_taken),
         # If a mushroom appeared
-        elif last_el == 'D' and curr_el in mushroom_type:
-            el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-            mushroom = mushroom_type[curr_el]
-            pre = "an" if mushroom[0].lower() in "aeiou" else "a"
-            element_appeared = f"{pre} {mushroom} mushroom"
-            observations.append((f"Observed that {element_appeared} grew at position {el_pos}.", game_time))
-    return observations
\ No newline at end of file
+        ('D', mushrooms, describe_mushroom_appeared),
+    ]
+    return get_observed_changes_by_rules(curr_m, last_m, rules, agent_local_position, agent_global_position, agent_orientation, game_time, pad_token, avatar_ids=avatar_ids)
\ No newline at end of file
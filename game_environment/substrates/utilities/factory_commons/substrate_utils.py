@@ -1,5 +1,5 @@
 from agent.memory_structures.short_term_memory import ShortTermMemory
-from game_environment.utils import connected_elems_map, get_element_global_pos, check_agent_out_of_game, get_matrix
+from game_environment.utils import connected_elems_map, get_element_global_pos, check_agent_out_of_game, get_matrix, get_observed_changes_by_rules, DIGITS
 import numpy as np
 from game_environment.server import get_scenario_map
 
@@ -126,7 +126,7 @@ def get_specific_substrate_obs(local_map:str, local_position:tuple, global_posit
 
 
 
-def get_observed_changes(observed_map: str, last_observed_map: str | None, agent_local_position: tuple, agent_global_position: tuple, agent_orientation: int, game_time: str, players_names: dict, agent_name:str) -> list[tuple[str, str]]:
+def get_observed_changes(observed_map: str, last_observed_map: str | None, agent_local_position: tuple, agent_global_position: tuple, agent_orientation: int, game_time: str, players_names: dict, agent_name:str, avatar_ids: tuple | None = None) -> list[tuple[str, str]]:
     """Create a list of observations of the changes in the environment
     
     Args:
@@ -136,6 +136,7 @@ def get_observed_changes(observed_map: str, last_observed_map: str | None, agent
         agent_global_position (tuple): Global position of the agent
         agent_orientation (int): Orientation of the agent
         game_time (str): Current game time
+        avatar_ids (tuple | None, optional): Layers of avatar ids of the last and the current global maps. Defaults to None.
 
     Returns:
         list[tuple[str, str]]: List of tuples with the changes in the environment, and the game time
@@ -149,18 +150,10 @@ def get_observed_changes(observed_map: str, last_observed_map: str | None, agent
     
     curr_m = get_matrix(observed_map)
     last_m = get_matrix(last_observed_map)
-    for index in np.ndindex(curr_m.shape):
-        curr_el = curr_m[index]
-        last_el = last_m[index]
-        if curr_el != last_el:
-            # If someone attacked nearby
-            if last_el.isnumeric() and curr_el == 'B':
-                el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-                observations.append((f"Someone was attacked at position {el_pos}.", game_time))
-            elif curr_el == 'B':
-                el_pos = get_element_global_pos(index, agent_local_position, agent_global_position, agent_orientation)
-                observations.append((f"Observed a ray beam from an attack at position {el_pos}.", game_time))
-            elif last_el == 'B':
-                pass
-
-    return observations
+    rules = [
+        # If someone attacked nearby
+        (DIGITS, 'B', "Someone was attacked at position {position}."),
+        (None, 'B', "Observed a ray beam from an attack at position {position}."),
+        ('B', None, None),
+    ]
+    return get_observed_changes_by_rules(curr_m, last_m, rules, agent_local_position, agent_global_position, agent_orientation, game_time, avatar_ids=avatar_ids)
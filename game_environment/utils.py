@@ -1,11 +1,8 @@
 import json
 import numpy as np
 from copy import deepcopy
-from scipy.ndimage import label, center_of_mass
-from collections import defaultdict
+from scipy.ndimage import label, center_of_mass, find_objects
 from importlib import import_module
-from agent.agent import Agent
-import inflect
 
 
 def parse_string_to_matrix(input_string:str):
@@ -28,15 +25,77 @@ def matrix_to_string(matrix:np.array):
     Description: Converts a matrix into a string
 
     Args:
-        matrix (np.array): Matrix to convert
+        matrix (np.array): Matrix to convert, of characters or a symbols grid
 
     Returns:
         str: String
     """
+    if isinstance(matrix, np.ndarray) and matrix.dtype == np.uint8:
+        return grid_to_string(matrix)
     rows = [''.join(row) for row in matrix]
     return '\n'.join(rows)
 
 
+def parse_string_to_grid(input_string:str):
+    """
+    Description: Parses a map into a grid of symbols, with the ascii code of the symbol of every cell.
+    The grid uses one byte per cell and is built from the bytes of the map without splitting it in rows
+
+    Args:
+        input_string (str): Map in ascii format, with rows of the same length
+
+    Returns:
+        np.array: Grid of uint8 symbols
+    """
+    data = bytearray(input_string.strip().encode('ascii'))
+    rows = data.count(b'\n') + 1
+    data.extend(b'\n')
+    # Every row ends with a new line, the last column is dropped without copying the grid
+    return np.frombuffer(data, dtype=np.uint8).reshape(rows, -1)[:, :-1]
+
+
+def grid_to_string(grid:np.array):
+    """
+    Description: Converts a grid of symbols into a string
+
+    Args:
+        grid (np.array): Grid of uint8 symbols
+
+    Returns:
+        str: String
+    """
+    rows = np.empty((grid.shape[0], grid.shape[1] + 1), dtype=np.uint8)
+    rows[:, :-1] = grid
+    rows[:, -1] = ord('\n')
+    return rows.tobytes()[:-1].decode('ascii')
+
+
+def grid_to_matrix(grid:np.array):
+    """
+    Description: Converts a grid of symbols into a matrix of characters
+
+    Args:
+        grid (np.array): Grid of uint8 symbols
+
+    Returns:
+        np.array: Matrix of characters
+    """
+    return np.ascontiguousarray(grid).view('S1').astype('U1')
+
+
+def matrix_to_grid(matrix:np.array):
+    """
+    Description: Converts a matrix of characters into a grid of symbols
+
+    Args:
+        matrix (np.array): Matrix of characters
+
+    Returns:
+        np.array: Grid of uint8 symbols
+    """
+    return matrix.astype('S1').view(np.uint8)
+
+
 def get_defined_valid_actions(game_name:str = 'commons_harvest_open'):
 
     """
@@ -135,6 +194,27 @@ def get_element_global_pos( element_local_pos, local_position, global_position,
     return list(element_global)
 
 
+def get_elements_global_pos(elements_local_pos: np.ndarray, local_position, global_position, agent_orientation=0) -> np.ndarray:
+    """
+    Description: Vectorized version of get_element_global_pos, returns the global positions of several elements at once
+
+    Args:
+        elements_local_pos (np.ndarray): Local positions of the elements, an array of shape (n, 2)
+        local_position (tuple): Local position of the agent
+        global_position (tuple): Global position of the agent
+        agent_orientation (int, optional): Orientation of the agent. Defaults to 0.
+
+    Returns:
+        np.ndarray: Global positions of the elements, an array of shape (n, 2)
+    """
+    elements_local_pos = np.asarray(elements_local_pos, dtype=int).reshape(-1, 2)
+    delta_row = elements_local_pos[:, 0] - local_position[0]
+    delta_col = elements_local_pos[:, 1] - local_position[1]
+    # Rows and columns offsets of the element in the global map for each orientation
+    rotations = {0: (delta_row, delta_col), 1: (delta_col, -delta_row), 2: (-delta_row, -delta_col), 3: (-delta_col, delta_row)}
+    global_row, global_col = rotations[agent_orientation]
+    return np.stack([global_row + global_position[0], global_col + global_position[1]], axis=1)
+
 
 def check_agent_out_of_game(observations:list[str]):
    """
@@ -151,44 +231,175 @@ def check_agent_out_of_game(observations:list[str]):
 
 
 
-def connected_elems_map(ascci_map: str | list[list[str]], elements_to_find):
+class ComponentIndex:
+    """
+    Index of the connected components formed by some elements of a map. The components are found in one pass
+    with label, find_objects and a labelled center_of_mass, so a position can be mapped to its component and the
+    resources left in every component can be counted without building a mask per component. When the map changes,
+    only the bounding boxes of the components touched by the changes are labelled again.
+    """
+
+    def __init__(self, ascci_map: str | list[list[str]] | None, elements_to_find: list[str]):
         """
-        Returns a dictionary with the connected components of the map and their elements
+        Builds the index of the connected components of a map
 
         Args:
-            ascci_map (str | list[list[str]]): Map in ascci format
-            elements_to_find (list): List of elements to find in the map
+            ascci_map (str | list[list[str]] | None): Map in ascci format. A missing map has no components
+            elements_to_find (list[str]): Elements that form the components
+        """
+        self.elements_to_find = list(elements_to_find)
+        self.matrix = self._to_matrix(ascci_map)
+        self.labels, num_components = label(self._get_mask(self.matrix))
+        self.slices = {}
+        self.centers = {}
+        self._next_id = 1
+        self._add_components(self.labels, num_components, (0, 0))
+
+    @staticmethod
+    def _to_matrix(ascci_map: str | list[list[str]] | None) -> np.ndarray:
+        """Converts a map in ascci format into a matrix of characters, a missing or empty map has no cells"""
+        if ascci_map is None or len(ascci_map) == 0:
+            return np.empty((0, 0), dtype='<U1')
+        if isinstance(ascci_map, str):
+            return np.array([list(row) for row in ascci_map.split('\n') if row != ''])
+        return np.array(ascci_map)
+
+    def _get_mask(self, matrix: np.ndarray) -> np.ndarray:
+        """Mask of the cells that belong to a component"""
+        return np.isin(matrix, self.elements_to_find)
+
+    def _add_components(self, region_labels: np.ndarray, num_components: int, offset: tuple[int, int]):
+        """
+        Registers the components labelled in a region of the map. The labels of the region are shifted to new ids
+
+        Args:
+            region_labels (np.ndarray): Labels of the region, from 1 to num_components
+            num_components (int): Number of components of the region
+            offset (tuple[int, int]): Position of the region in the map
+        """
+        if num_components == 0:
+            return
+        first_id = self._next_id
+        if first_id > 1:
+            region_labels[region_labels > 0] += first_id - 1
+        indexes = range(first_id, first_id + num_components)
+        centers = center_of_mass(region_labels > 0, region_labels, indexes)
+        objects = find_objects(region_labels)[first_id - 1:]
+        for component_id, center, (rows, cols) in zip(indexes, centers, objects):
+            self.slices[component_id] = (slice(rows.start + offset[0], rows.stop + offset[0]), slice(cols.start + offset[1], cols.stop + offset[1]))
+            self.centers[component_id] = (int(center[0] + offset[0]), int(center[1] + offset[1]))
+        self._next_id += num_components
+
+    def update(self, ascci_map: str | list[list[str]]):
+        """
+        Updates the index with the new state of the map. The components whose cells were not touched by the changes
+        keep their ids, the ones that were touched are labelled again with new ids
+
+        Args:
+            ascci_map (str | list[list[str]]): New state of the map
+        """
+        matrix = self._to_matrix(ascci_map)
+        mask = self._get_mask(matrix)
+        dirty = mask != (self.labels > 0)
+        self.matrix = matrix
+        if not dirty.any():
+            # Only the resources changed, the components are the same
+            return
+
+        # Grow the dirty bounding box until it contains the whole components it touches
+        rows, cols = np.nonzero(dirty)
+        top, bottom = max(rows.min() - 1, 0), rows.max() + 2
+        left, right = max(cols.min() - 1, 0), cols.max() + 2
+        touched = set()
+        while True:
+            region_ids = set(np.unique(self.labels[top:bottom, left:right]).tolist()) - {0}
+            if region_ids <= touched:
+                break
+            touched |= region_ids
+            for component_id in region_ids:
+                component_rows, component_cols = self.slices[component_id]
+                top, bottom = min(top, component_rows.start), max(bottom, component_rows.stop)
+                left, right = min(left, component_cols.start), max(right, component_cols.stop)
+
+        for component_id in touched:
+            del self.slices[component_id]
+            del self.centers[component_id]
+        region_labels, num_components = label(mask[top:bottom, left:right])
+        self._add_components(region_labels, num_components, (top, left))
+        self.labels[top:bottom, left:right] = region_labels
+
+    def get_component(self, position: tuple[int, int]) -> int | None:
+        """
+        Gets the component that contains a position
+
+        Args:
+            position (tuple[int, int]): Position in the map
 
         Returns:
-            dict: Dictionary with the connected components of the map and their elements
+            int | None: Id of the component, None if the position does not belong to any component
         """
+        component_id = int(self.labels[position[0], position[1]])
+        return component_id or None
 
-        if isinstance(ascci_map, str):
-            # Convierte la matriz en una matriz numpy
-            matrix = np.array([list(row) for row in ascci_map.split('\n') if row != ''])
-        else:
-            matrix = np.array(ascci_map)
+    def get_elements(self, component_id: int) -> list[list[int]]:
+        """
+        Gets the positions of the elements of a component, ordered by row and column
 
-        # Generate mask
-        mask = (matrix == elements_to_find[0])
-        for elem in elements_to_find[1:]:
-            mask |= (matrix == elem)
+        Args:
+            component_id (int): Id of the component
 
-        # Encontrar componentes conectados
-        labeled_matrix, num_features = label(mask)
+        Returns:
+            list[list[int]]: Positions of the elements of the component
+        """
+        rows, cols = self.slices[component_id]
+        elements = np.argwhere(self.labels[rows, cols] == component_id) + (rows.start, cols.start)
+        return elements.tolist()
 
-        # Inicializa un diccionario para almacenar los centros de los componentes y sus elementos
-        component_data = defaultdict(list)
+    def count(self, element: str, ascci_map: str | list[list[str]] | None = None) -> dict[int, int]:
+        """
+        Counts the cells of every component that hold an element, for example the apples left in every tree
 
-        # Calcula el centro de cada componente y almacena sus elementos
-        for i in range(1, num_features + 1):
-            component_mask = labeled_matrix == i
-            center = center_of_mass(component_mask)
-            center_coords = (int(center[0]), int(center[1]))
-            component_elements = np.argwhere(component_mask)
-            component_data[i] = {'center': center_coords, 'elements': component_elements.tolist()}
+        Args:
+            element (str): Element to count
+            ascci_map (str | list[list[str]] | None, optional): Map where the elements are counted, with the same shape
+                as the indexed map. Defaults to the indexed map.
 
-        return dict(component_data)
+        Returns:
+            dict[int, int]: Number of cells with the element by component id
+        """
+        if not self.slices:
+            return {}
+        matrix = self.matrix if ascci_map is None else self._to_matrix(ascci_map)
+        counts = np.bincount(self.labels[matrix == element], minlength=self._next_id)
+        return {component_id: int(counts[component_id]) for component_id in self.slices}
+
+    def get_components(self) -> dict:
+        """
+        Gets the connected components with their centers and elements
+
+        Returns:
+            dict: Dictionary with the center and the elements of every component by id
+        """
+        positions = np.argwhere(self.labels > 0)
+        component_ids = self.labels[self.labels > 0]
+        order = np.argsort(component_ids, kind='stable')
+        ids, starts = np.unique(component_ids[order], return_index=True)
+        groups = np.split(positions[order], starts[1:])
+        return {int(component_id): {'center': self.centers[component_id], 'elements': elements.tolist()} for component_id, elements in zip(ids, groups)}
+
+
+def connected_elems_map(ascci_map: str | list[list[str]], elements_to_find):
+        """
+        Returns a dictionary with the connected components of the map and their elements
+
+        Args:
+            ascci_map (str | list[list[str]]): Map in ascci format
+            elements_to_find (list): List of elements to find in the map
+
+        Returns:
+            dict: Dictionary with the connected components of the map and their elements
+        """
+        return ComponentIndex(ascci_map, elements_to_find).get_components()
 
 def get_local_position_of_element(current_map: list[list[str]], element: str) -> tuple[int, int] | None:
     """
@@ -230,6 +441,7 @@ def number_to_words(number: int) -> str:
     Returns:
         str: Number in words
     """
+    import inflect # inflect takes seconds to import, it is only loaded when it is needed
     p = inflect.engine()
     words = p.number_to_words(number)
     return words
@@ -364,6 +576,130 @@ def process_observed_matrices(curr_m: np.ndarray, last_m: np.ndarray, agent_loca
 
     return curr_m, last_m, agent_local_position, agent_moved, agent_turned
 
+
+DIGITS = '0123456789'
+
+def get_avatar_symbol(avatar_id: int) -> str:
+    """
+    Returns the symbol of an avatar in the map of characters. Every cell has a single character, so the avatars are drawn
+    with the last digit of their id and the id of the avatar in a cell is kept in a separate layer of avatar ids
+
+    Args:
+        avatar_id (int): Id of the avatar
+
+    Returns:
+        str: Symbol of the avatar
+    """
+    return DIGITS[avatar_id % 10]
+
+def get_avatar_id(symbol: str, global_position: list[int], avatar_ids_map: np.ndarray | None = None) -> str:
+    """
+    Returns the id of the avatar drawn with a symbol at a position of the map
+
+    Args:
+        symbol (str): Symbol of the cell
+        global_position (list[int]): Global position of the cell
+        avatar_ids_map (np.ndarray | None, optional): Layer of avatar ids of the map, -1 where there is no avatar. Defaults to None.
+
+    Returns:
+        str: Id of the avatar, or the symbol if it is not an avatar or the layer of avatar ids is not given
+    """
+    if avatar_ids_map is None or symbol not in DIGITS:
+        return symbol
+    row, col = global_position
+    if 0 <= row < avatar_ids_map.shape[0] and 0 <= col < avatar_ids_map.shape[1] and avatar_ids_map[row, col] >= 0:
+        return str(avatar_ids_map[row, col])
+    return symbol
+
+def get_observed_changes_by_rules(curr_m: np.ndarray, last_m: np.ndarray, rules: list[tuple], agent_local_position: tuple, agent_global_position: tuple, agent_orientation: int, game_time: str, pad_token: str | None = None, avatar_ids: tuple | None = None) -> list[tuple[str, str]]:
+    """
+    Describes the changes between the current and the last observed matrices with a table of rules.
+    The changed cells are found at once with numpy, each changed cell is described by the first rule that matches
+    its transition, and the cells are described in row-major order.
+
+    Args:
+        curr_m (np.ndarray): Current observed matrix, aligned with the last one by process_observed_matrices.
+        last_m (np.ndarray): Last observed matrix.
+        rules (list[tuple]): Ordered rules as (last_symbols, curr_symbols, description). The symbols are strings with
+            the symbols that match the transition, None matches any symbol. The description is a template with a
+            {position} field, a function that receives the last symbol, the current symbol and the global position
+            and returns the description, or None to ignore the change. The functions can also return None.
+        agent_local_position (tuple): Position of the agent on the observed matrices.
+        agent_global_position (tuple): Global position of the agent.
+        agent_orientation (int): Orientation of the agent. 0: North, 1: East, 2: South, 3: West.
+        game_time (str): Current game time.
+        pad_token (str | None, optional): Token used to pad the matrices, the cells with padding are ignored. Defaults to None.
+        avatar_ids (tuple | None, optional): Layers of avatar ids of the last and the current global maps. If they are given,
+            the functions receive the id of the avatars instead of their symbol. Defaults to None.
+
+    Returns:
+        list[tuple[str, str]]: List of tuples with the changes in the environment and the game time.
+    """
+    last_avatar_ids, curr_avatar_ids = avatar_ids or (None, None)
+    rows, columns = min(curr_m.shape[0], last_m.shape[0]), min(curr_m.shape[1], last_m.shape[1])
+    curr_m, last_m = curr_m[:rows, :columns], last_m[:rows, :columns]
+    changed = curr_m != last_m
+    if pad_token is not None:
+        changed &= (curr_m != pad_token) & (last_m != pad_token)
+    changed_indexes = np.argwhere(changed)
+    if len(changed_indexes) == 0:
+        return []
+
+    curr_elements = curr_m[changed]
+    last_elements = last_m[changed]
+    # Index of the first rule that matches each changed cell
+    cells_rules = np.full(len(changed_indexes), -1)
+    for rule_index, (last_symbols, curr_symbols, _) in enumerate(rules):
+        matches = cells_rules == -1
+        if last_symbols is not None:
+            matches &= np.isin(last_elements, list(last_symbols))
+        if curr_symbols is not None:
+            matches &= np.isin(curr_elements, list(curr_symbols))
+        cells_rules[matches] = rule_index
+
+    described = cells_rules >= 0
+    described[described] = [rules[rule_index][2] is not None for rule_index in cells_rules[described]]
+    positions = get_elements_global_pos(changed_indexes[described], agent_local_position, agent_global_position, agent_orientation).tolist()
+
+    observations = []
+    for cell, el_pos in zip(np.flatnonzero(described), positions):
+        description = rules[cells_rules[cell]][2]
+        if callable(description):
+            last_el = get_avatar_id(str(last_elements[cell]), el_pos, last_avatar_ids)
+            curr_el = get_avatar_id(str(curr_elements[cell]), el_pos, curr_avatar_ids)
+            description = description(last_el, curr_el, el_pos)
+            if description is None:
+                continue
+        else:
+            description = description.format(position=el_pos)
+        observations.append((description, game_time))
+    return observations
+
+def get_attack_description(players_names: dict, curr_m: np.ndarray, agent_local_position: tuple, agent_moved: bool, agent_turned: bool):
+    """
+    Returns the rule description of an agent that was attacked, for the transition of a player symbol to a ray beam.
+    The attack was done by the agent if it did not move or turn and the ray beam surrounds it.
+
+    Args:
+        players_names (dict): Names of the players by id.
+        curr_m (np.ndarray): Current observed matrix.
+        agent_local_position (tuple): Position of the agent on the observed matrix.
+        agent_moved (bool): Whether the agent moved.
+        agent_turned (bool): Whether the agent turned.
+
+    Returns:
+        Callable: Function that describes the attack.
+    """
+    row, col = agent_local_position
+
+    def describe_attack(last_el: str, curr_el: str, el_pos: list[int]) -> str:
+        agent_name = players_names[int(last_el)]
+        if not (agent_moved or agent_turned) and row >= 3 and curr_m[row-3, col] == 'B' and curr_m[row, col-1] == 'B' and curr_m[row, col+1] == 'B':
+            return f"I successfully attacked {agent_name} at position {el_pos}."
+        return f"{agent_name} was attacked at position {el_pos}."
+
+    return describe_attack
+
 def get_local_position_from_global(orientation: int, global_dest_pos: tuple[int, int], global_self_pos: tuple[int, int], local_self_pos: tuple[int, int]) -> tuple[int, int]:
     """Get the local position of an element given its global position on the map.
 
@@ -393,4 +729,144 @@ def get_local_position_from_global(orientation: int, global_dest_pos: tuple[int,
         element_local =      (global_dest_pos[1] - global_self_pos[1]) + local_self_pos[0], \
                         -1 * (global_dest_pos[0] - global_self_pos[0]) + local_self_pos[1]
 
-    return element_local
\ No newline at end of file
+    return element_local
+
+def get_sprites_colors(map_rgb: np.ndarray, map_shape: tuple[int, int], positions: np.ndarray, palette: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the color of the sprites drawn at some cells of the map. The sprites of all the cells are taken at once from
+    the RGB map and their pixels are matched against the palette by broadcasting. The color of a sprite is the one
+    of the first pixel of the palette in the right-most column that has any, the last row and column of the sprite are skipped
+
+    Args:
+        map_rgb (np.ndarray): RGB map, pixels of the map in [R, G, B] format
+        map_shape (tuple[int, int]): Shape of the map of characters
+        positions (np.ndarray): Positions (row, column) of the cells in the map of characters
+        palette (np.ndarray): Colors to look for, in [R, G, B] format
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Index in the palette of the color of every sprite, -1 if the sprite has none of the colors,
+            and the position in the RGB map of the pixel that sets the color
+    """
+    positions = np.asarray(positions, dtype=int).reshape(-1, 2)
+    scale_y = map_rgb.shape[0] / map_shape[0]
+    scale_x = map_rgb.shape[1] / map_shape[1]
+
+    # Pixels of the sprite of every cell
+    row_start = (positions[:, 0] * scale_y).astype(int)
+    col_start = (positions[:, 1] * scale_x).astype(int)
+    row_end = ((positions[:, 0] + 1) * scale_y).astype(int) - 1
+    col_end = ((positions[:, 1] + 1) * scale_x).astype(int) - 1
+    height = max(int((row_end - row_start).max(initial=0)), 0)
+    width = max(int((col_end - col_start).max(initial=0)), 0)
+    if len(positions) == 0 or height == 0 or width == 0:
+        return np.full(len(positions), -1), np.stack([row_start, col_start], axis=1)
+    rows = row_start[:, None] + np.arange(height)
+    cols = col_start[:, None] + np.arange(width)
+    valid = (rows < row_end[:, None])[:, :, None] & (cols < col_end[:, None])[:, None, :]
+    valid &= ((row_start < map_rgb.shape[0]) & (col_start < map_rgb.shape[1]))[:, None, None]
+    sprites = map_rgb[np.clip(rows, 0, map_rgb.shape[0] - 1)[:, :, None], np.clip(cols, 0, map_rgb.shape[1] - 1)[:, None, :]]
+
+    matches = (sprites[..., None, :] == palette).all(axis=-1) & valid[..., None]
+    colored = matches.any(axis=-1)
+
+    # Right-most column with a colored pixel and the first colored pixel of that column
+    colored_cols = colored.any(axis=1)
+    has_color = colored_cols.any(axis=1)
+    col = width - 1 - colored_cols[:, ::-1].argmax(axis=1)
+    row = colored[np.arange(len(positions)), :, col].argmax(axis=1)
+    colors = np.where(has_color, matches[np.arange(len(positions)), row, col].argmax(axis=-1), -1)
+    return colors, np.stack([row_start + row, col_start + col], axis=1)
+
+
+def get_elements_local_pos(elements_global_pos: np.ndarray, local_position, global_position, agent_orientation=0) -> np.ndarray:
+    """
+    Description: Inverse of get_elements_global_pos, returns the local positions of several elements in the observation window of an agent
+
+    Args:
+        elements_global_pos (np.ndarray): Global positions of the elements, an array of shape (n, 2)
+        local_position (tuple): Local position of the agent
+        global_position (tuple): Global position of the agent
+        agent_orientation (int, optional): Orientation of the agent. Defaults to 0.
+
+    Returns:
+        np.ndarray: Local positions of the elements, an array of shape (n, 2)
+    """
+    elements_global_pos = np.asarray(elements_global_pos, dtype=int).reshape(-1, 2)
+    delta_row = elements_global_pos[:, 0] - global_position[0]
+    delta_col = elements_global_pos[:, 1] - global_position[1]
+    # Rows and columns offsets of the element in the observation window for each orientation
+    rotations = {0: (delta_row, delta_col), 1: (-delta_col, delta_row), 2: (-delta_row, -delta_col), 3: (delta_col, -delta_row)}
+    local_row, local_col = rotations[agent_orientation]
+    return np.stack([local_row + local_position[0], local_col + local_position[1]], axis=1)
+
+
+def get_global_entities(global_map: np.ndarray, entities_symbols: list[str], avatar_ids_map: np.ndarray | None = None) -> dict:
+    """
+    Description: Scans the global map once and returns the entities of the step, every cell with one of the symbols
+
+    Args:
+        global_map (np.ndarray): Global map of characters
+        entities_symbols (list[str]): Symbols of the entities, for example apples, mushrooms, coins or agents
+        avatar_ids_map (np.ndarray | None, optional): Layer of avatar ids of the map, -1 where there is no avatar. If it is given,
+            the avatars are entities with their id as symbol. Defaults to None.
+
+    Returns:
+        dict: Global positions (row-major order) and symbols of the entities
+    """
+    global_map = np.asarray(global_map)
+    mask = np.isin(global_map, entities_symbols)
+    if avatar_ids_map is not None:
+        mask |= avatar_ids_map >= 0
+    positions = np.argwhere(mask)
+    symbols = global_map[positions[:, 0], positions[:, 1]]
+    if avatar_ids_map is not None:
+        avatars = avatar_ids_map[positions[:, 0], positions[:, 1]]
+        symbols = np.where(avatars >= 0, avatars.astype(str), symbols)
+    return {'positions': positions, 'symbols': symbols}
+
+
+def get_visible_entities(entities: dict, local_position, global_position, agent_orientation: int, window_shape: tuple[int, int]) -> list[tuple[str, tuple[int, int], list[int]]]:
+    """
+    Description: Filters the entities of the step that are inside the observation window of an agent. The agent itself is left out,
+    as it is the self symbol in its observation
+
+    Args:
+        entities (dict): Entities of the step, as returned by get_global_entities
+        local_position (tuple): Local position of the agent
+        global_position (tuple): Global position of the agent
+        agent_orientation (int): Orientation of the agent
+        window_shape (tuple[int, int]): Shape of the observation window of the agent
+
+    Returns:
+        list[tuple[str, tuple[int, int], list[int]]]: Symbol, local position and global position of the visible entities,
+            in the order the observation window is read, row by row
+    """
+    local_pos = get_elements_local_pos(entities['positions'], local_position, global_position, agent_orientation)
+    visible = np.all((local_pos >= 0) & (local_pos < window_shape), axis=1)
+    visible &= np.any(local_pos != local_position, axis=1)
+    visible = np.flatnonzero(visible)
+    visible = visible[np.argsort(np.ravel_multi_index(local_pos[visible].T, window_shape))]
+    return [(symbol, tuple(local), position) for symbol, local, position
+            in zip(entities['symbols'][visible].tolist(), local_pos[visible].tolist(), entities['positions'][visible].tolist())]
+
+
+def get_local_entities(local_map: str, entities_symbols: list[str], local_position, global_position, agent_orientation: int) -> list[tuple[str, tuple[int, int], list[int]]]:
+    """
+    Description: Scans the observation window of an agent for some entities, when the entities of the step are not available
+
+    Args:
+        local_map (str): Local map in ascci format
+        entities_symbols (list[str]): Symbols of the entities
+        local_position (tuple): Local position of the agent
+        global_position (tuple): Global position of the agent
+        agent_orientation (int): Orientation of the agent
+
+    Returns:
+        list[tuple[str, tuple[int, int], list[int]]]: Symbol, local position and global position of the entities, in the order the window is read
+    """
+    entities = []
+    for i, row in enumerate(local_map.split('\n')):
+        for j, char in enumerate(row):
+            if char in entities_symbols:
+                entities.append((char, (i, j), get_element_global_pos((i, j), local_position, global_position, agent_orientation)))
+    return entities
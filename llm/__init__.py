@@ -1,7 +1,34 @@
-from llm.openai import GPT4oMini, GPT4o, Embedding
-# from llm.groq import Llama31_8B
-from llm.friendli import Llama31_8B, Llama31_70B
+import os
+
 from llm.base_llm import BaseLLM
+from llm.model_registry import ModelRegistry
+from llm.model_router import ModelRouter
+
+LLM_BACKENDS = ('online', 'offline')
+_llm_backend = None
+
+def set_llm_backend(backend: str | None) -> None:
+    """Select the backend of the models. It must be called before the first LLMModels instance is created.
+    Args:
+        backend (str | None): online to use the apis of the providers, offline to use the local stand-in models. If None, the LLM_BACKEND environment variable is used
+    """
+    global _llm_backend
+    if backend is not None and backend not in LLM_BACKENDS:
+        raise ValueError(f"Invalid LLM backend {backend}, valid backends are: {', '.join(LLM_BACKENDS)}")
+    _llm_backend = backend
+
+_routes_path = None
+_substrate_name = None
+
+def set_model_routes(routes_path: str | None = None, substrate_name: str | None = None) -> None:
+    """Select the routing table of the models used by the cognitive modules. It must be called before the first LLMModels instance is created.
+    Args:
+        routes_path (str | None, optional): Path of the routing table. If None, the LLM_ROUTES_PATH environment variable or config/model_routes.json is used. Defaults to None.
+        substrate_name (str | None, optional): Name of the substrate, it selects the routes defined for the substrate. Defaults to None.
+    """
+    global _routes_path, _substrate_name
+    _routes_path = routes_path
+    _substrate_name = substrate_name
 
 class LLMModels():
     """Class to define the available LLM models"""
@@ -11,19 +38,51 @@ class LLMModels():
         # Singleton pattern
         if not hasattr(self, 'instance'):
             self.instance = super(LLMModels, self).__new__(self)
-            self.instance.llm_models: dict[str, BaseLLM] = {
-            # "llama3.1-8B": Llama31_8B(),
-            "llama3.1_70B": Llama31_70B(),
-            # "gpt-4o": GPT4o(),
-            # "gpt4o-mini": GPT4oMini(),
-            "embedding": Embedding()
-            }
+            backend = _llm_backend or os.getenv("LLM_BACKEND", "online")
+            # The models are created on first use, the clients of the providers are only loaded if they are needed
+            if backend == 'offline':
+                self.instance.llm_models: ModelRegistry = ModelRegistry({
+                "offline": "llm.offline:OfflineLLM",
+                "offline_embedding": "llm.offline:OfflineEmbedding"
+                })
+                self.instance.main_model = "offline"
+                self.instance.best_model = "offline"
+                self.instance.longer_context_fallback = "offline"
+                self.instance.embedding_model = "offline_embedding"
+                self.instance.router = self.instance._create_router()
+                return self.instance
+
+            self.instance.llm_models: ModelRegistry = ModelRegistry({
+            "llama3.1-8B": "llm.friendli:Llama31_8B",
+            # "llama3.1-8B": "llm.groq:Llama31_8B",
+            "llama3.1_70B": "llm.friendli:Llama31_70B",
+            "gpt-4o": "llm.openai:GPT4o",
+            "gpt4o-mini": "llm.openai:GPT4oMini",
+            "embedding": "llm.openai:Embedding"
+            })
             self.instance.main_model = "llama3.1_70B"
             self.instance.best_model = "llama3.1_70B"
             self.instance.longer_context_fallback = "llama3.1_70B"
             self.instance.embedding_model = "embedding"
+            self.instance.router = self.instance._create_router()
         return self.instance
 
+    def _create_router(self) -> ModelRouter:
+        """Create the router of the models used by the cognitive modules. The modules without a route use the main model
+        and the longer context fallback when the prompt is too long
+        Returns:
+            ModelRouter: Router of the models
+        """
+        fallback_models = list(dict.fromkeys([self.main_model, self.longer_context_fallback]))
+        return ModelRouter.from_file(self.llm_models, _routes_path, _substrate_name, fallback_models)
+
+    def get_router(self) -> ModelRouter:
+        """Get the router of the models used by the cognitive modules
+        Returns:
+            ModelRouter: Router of the models
+        """
+        return self.router
+
     def get_main_model(self) -> BaseLLM:
         """Get the main model
         Returns:
@@ -59,7 +118,7 @@ class LLMModels():
         """
         costs = {}
         total_cost = 0
-        for model_name, model in self.llm_models.items():
+        for model_name, model in self.llm_models.loaded().items():
             model_cost = model.cost_manager.get_costs()['total_cost']
             costs[model_name] = model_cost
             total_cost += model_cost
@@ -75,11 +134,45 @@ class LLMModels():
         """
         tokens = {}
         total_tokens = 0
-        for model_name, model in self.llm_models.items():
+        for model_name, model in self.llm_models.loaded().items():
             model_tokens = model.cost_manager.get_tokens()['total_tokens']
             tokens[model_name] = model_tokens
             total_tokens += model_tokens
 
         tokens['total'] = total_tokens
 
-        return tokens
\ No newline at end of file
+        return tokens
+
+    def get_coalesced_stats(self) -> dict:
+        """Get the requests that shared the response of an identical request in flight
+        Returns:
+            dict: Coalesced requests and saved cost by model
+        """
+        stats = {}
+        total_requests, total_saved_cost = 0, 0
+        for model_name, model in self.llm_models.loaded().items():
+            model_stats = model.cost_manager.get_coalesced_stats()
+            stats[model_name] = model_stats
+            total_requests += model_stats['coalesced_requests']
+            total_saved_cost += model_stats['saved_cost']
+
+        stats['total'] = {'coalesced_requests': total_requests, 'saved_cost': total_saved_cost}
+
+        return stats
+
+    def get_cache_stats(self) -> dict:
+        """Get the responses read from the cache by the models
+        Returns:
+            dict: Cache hits and saved cost by model
+        """
+        stats = {}
+        total_hits, total_saved_cost = 0, 0
+        for model_name, model in self.llm_models.loaded().items():
+            model_stats = model.cost_manager.get_cache_stats()
+            stats[model_name] = model_stats
+            total_hits += model_stats['cache_hits']
+            total_saved_cost += model_stats['saved_cost']
+
+        stats['total'] = {'cache_hits': total_hits, 'saved_cost': total_saved_cost}
+
+        return stats
@@ -1,8 +1,9 @@
 import os
+from typing import Callable, Iterator
 
 from llm.base_llm import BaseLLM
 import openai
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI
 import tiktoken
 
 class GPT35(BaseLLM):
@@ -23,6 +24,11 @@ class GPT35(BaseLLM):
             api_key=os.getenv("AZURE_OPENAI_KEY_GPT3"),  
             api_version=os.getenv("AZURE_OPENAI_API_VERSION")
         )
+        self.async_client = AsyncAzureOpenAI(
+            azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT_GPT3"), 
+            api_key=os.getenv("AZURE_OPENAI_KEY_GPT3"),  
+            api_version=os.getenv("AZURE_OPENAI_API_VERSION")
+        )
         self.deployment_name = os.getenv("AZURE_GPT_35_MODEL_ID")
         # Encoding to estimate the number of tokens
         self.encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
@@ -55,7 +61,35 @@ class GPT35(BaseLLM):
             prompt = system_prompt + prompt
             del kwargs["system_prompt"]
 
-        response = self.client.chat.completions.create(model=self.deployment_name, messages=prompt, **kwargs)
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
+        completion = response.choices[0].message.content
+        prompt_tokens = response.usage.prompt_tokens
+        response_tokens = response.usage.completion_tokens
+    
+        return completion, prompt_tokens, response_tokens
+    
+    async def __acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Completion api for the GPT-3.5 model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = await self.async_client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
         completion = response.choices[0].message.content
         prompt_tokens = response.usage.prompt_tokens
         response_tokens = response.usage.completion_tokens
@@ -71,9 +105,64 @@ class GPT35(BaseLLM):
         Returns:
             tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
         """
-        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
         return wrapper(prompt, **kwargs)
     
+    async def _acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the async completion api with async retry and exponential backoff
+        
+        Args:
+            prompt (str): Prompt for the completion
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__acompletion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return await wrapper(prompt, **kwargs)
+    
+    def __stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Streaming completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            Iterator[str]: Chunks of text of the response. The generator returns the tokens in the prompt and in the response reported by the api
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, stream=True, extra_body={"stream_options": {"include_usage": True}}, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        stream = raw_response.parse()
+        usage = None
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                usage = self._get_stream_usage(chunk) or usage
+        finally:
+            # Closing the stream cancels the generation of the rest of the response
+            stream.close()
+        return usage
+
+    def _stream_completion(self, prompt: str, stop_when: Callable[[str], bool], **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the streaming completion api with retry and exponential backoff
+
+        Args:
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool]): Function that receives the text generated so far and returns True when the answer is complete
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.retry_with_exponential_backoff(self._read_stream, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return wrapper(self.__stream, prompt, stop_when, **kwargs)
+    
     def _calculate_tokens(self, prompt: str) -> int:
         """Calculate the number of tokens in the prompt
         Args:
@@ -106,6 +195,11 @@ class GPT35_16K(BaseLLM):
             api_key=os.getenv("AZURE_OPENAI_KEY_GPT3"),  
             api_version=os.getenv("AZURE_OPENAI_API_VERSION")
         )
+        self.async_client = AsyncAzureOpenAI(
+            azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT_GPT3"), 
+            api_key=os.getenv("AZURE_OPENAI_KEY_GPT3"),  
+            api_version=os.getenv("AZURE_OPENAI_API_VERSION")
+        )
         self.deployment_name = os.getenv("AZURE_GPT_35_16k_MODEL_ID")
         # Encoding to estimate the number of tokens
         self.encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
@@ -138,7 +232,35 @@ class GPT35_16K(BaseLLM):
             prompt = system_prompt + prompt
             del kwargs["system_prompt"]
 
-        response = self.client.chat.completions.create(model=self.deployment_name, messages=prompt, **kwargs)
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
+        completion = response.choices[0].message.content
+        prompt_tokens = response.usage.prompt_tokens
+        response_tokens = response.usage.completion_tokens
+    
+        return completion, prompt_tokens, response_tokens
+    
+    async def __acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Completion api for the GPT-3.5 model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = await self.async_client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
         completion = response.choices[0].message.content
         prompt_tokens = response.usage.prompt_tokens
         response_tokens = response.usage.completion_tokens
@@ -154,9 +276,64 @@ class GPT35_16K(BaseLLM):
         Returns:
             tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
         """
-        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
         return wrapper(prompt, **kwargs)
     
+    async def _acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the async completion api with async retry and exponential backoff
+        
+        Args:
+            prompt (str): Prompt for the completion
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__acompletion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return await wrapper(prompt, **kwargs)
+    
+    def __stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Streaming completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            Iterator[str]: Chunks of text of the response. The generator returns the tokens in the prompt and in the response reported by the api
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, stream=True, extra_body={"stream_options": {"include_usage": True}}, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        stream = raw_response.parse()
+        usage = None
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                usage = self._get_stream_usage(chunk) or usage
+        finally:
+            # Closing the stream cancels the generation of the rest of the response
+            stream.close()
+        return usage
+
+    def _stream_completion(self, prompt: str, stop_when: Callable[[str], bool], **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the streaming completion api with retry and exponential backoff
+
+        Args:
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool]): Function that receives the text generated so far and returns True when the answer is complete
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.retry_with_exponential_backoff(self._read_stream, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return wrapper(self.__stream, prompt, stop_when, **kwargs)
+    
     def _calculate_tokens(self, prompt: str) -> int:
         """Calculate the number of tokens in the prompt
         Args:
@@ -189,6 +366,11 @@ class GPT4(BaseLLM):
             api_key=os.getenv("AZURE_OPENAI_KEY_GPT4"),  
             api_version=os.getenv("AZURE_OPENAI_API_VERSION")
         )
+        self.async_client = AsyncAzureOpenAI(
+            azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT_GPT4"), 
+            api_key=os.getenv("AZURE_OPENAI_KEY_GPT4"),  
+            api_version=os.getenv("AZURE_OPENAI_API_VERSION")
+        )
         self.deployment_name = os.getenv("AZURE_GPT_4_MODEL_ID")
         self.logger.info("Deployment name: " + self.deployment_name)
         # Encoding to estimate the number of tokens
@@ -222,7 +404,35 @@ class GPT4(BaseLLM):
             prompt = system_prompt + prompt
             del kwargs["system_prompt"]
 
-        response = self.client.chat.completions.create(model=self.deployment_name, messages=prompt, **kwargs)
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
+        completion = response.choices[0].message.content
+        prompt_tokens = response.usage.prompt_tokens
+        response_tokens = response.usage.completion_tokens
+    
+        return completion, prompt_tokens, response_tokens
+    
+    async def __acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Completion api for the GPT-4 model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = await self.async_client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
         completion = response.choices[0].message.content
         prompt_tokens = response.usage.prompt_tokens
         response_tokens = response.usage.completion_tokens
@@ -238,9 +448,64 @@ class GPT4(BaseLLM):
         Returns:
             tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
         """
-        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
         return wrapper(prompt, **kwargs)
     
+    async def _acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the async completion api with async retry and exponential backoff
+        
+        Args:
+            prompt (str): Prompt for the completion
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__acompletion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return await wrapper(prompt, **kwargs)
+    
+    def __stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Streaming completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            Iterator[str]: Chunks of text of the response. The generator returns the tokens in the prompt and in the response reported by the api
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, stream=True, extra_body={"stream_options": {"include_usage": True}}, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        stream = raw_response.parse()
+        usage = None
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                usage = self._get_stream_usage(chunk) or usage
+        finally:
+            # Closing the stream cancels the generation of the rest of the response
+            stream.close()
+        return usage
+
+    def _stream_completion(self, prompt: str, stop_when: Callable[[str], bool], **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the streaming completion api with retry and exponential backoff
+
+        Args:
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool]): Function that receives the text generated so far and returns True when the answer is complete
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.retry_with_exponential_backoff(self._read_stream, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return wrapper(self.__stream, prompt, stop_when, **kwargs)
+    
     def _calculate_tokens(self, prompt: str) -> int:
         """Calculate the number of tokens in the prompt
         Args:
@@ -273,6 +538,11 @@ class Ada(BaseLLM):
             api_version = os.getenv("AZURE_OPENAI_API_VERSION"),
             azure_endpoint =os.getenv("AZURE_OPENAI_ENDPOINT_GPT3") 
         )
+        self.async_client = AsyncAzureOpenAI(
+            api_key = os.getenv("AZURE_OPENAI_KEY_GPT3"),  
+            api_version = os.getenv("AZURE_OPENAI_API_VERSION"),
+            azure_endpoint =os.getenv("AZURE_OPENAI_ENDPOINT_GPT3") 
+        )
         self.deployment_name = os.getenv("AZURE_TEXT_EMMBEDDING_MODEL_ID")
         # Encoding to estimate the number of tokens
         self.encoding = tiktoken.encoding_for_model("text-embedding-ada-002")
@@ -289,7 +559,28 @@ class Ada(BaseLLM):
             tuple(list[float], int, int): A tuple with the embedded text, the number of tokens in the prompt and the number of tokens in the response
         """
         # response = get_embedding(text, engine=self.deployment_name, **kwargs)
-        response = self.client.embeddings.create(input = [text], model=self.deployment_name)
+        raw_response = self.client.embeddings.with_raw_response.create(input = [text], model=self.deployment_name)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
+
+        embedding = response.data[0].embedding
+        prompt_tokens = response.usage.total_tokens
+        response_tokens = 0
+    
+        return embedding, prompt_tokens, response_tokens
+    
+    async def __aembed(self, text: str, **kwargs) -> tuple[list[float], int, int]:
+        """Async embedding api for the Ada model
+        Args:
+            text (str): Text to embed
+        Returns:
+            tuple(list[float], int, int): A tuple with the embedded text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        raw_response = await self.async_client.embeddings.with_raw_response.create(input = [text], model=self.deployment_name)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
 
         embedding = response.data[0].embedding
         prompt_tokens = response.usage.total_tokens
@@ -306,9 +597,21 @@ class Ada(BaseLLM):
         Returns:
             tuple(list[float], int, int): A tuple with the embedded text, the number of tokens in the prompt and the number of tokens in the response
         """
-        wrapper = BaseLLM.retry_with_exponential_backoff(self.__embed, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+        wrapper = BaseLLM.retry_with_exponential_backoff(self.__embed, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
         return wrapper(text, **kwargs)
     
+    async def _acompletion(self, text: str, **kwargs) -> tuple[list[float], int, int]:
+        """Wrapper for the async completion api with async retry and exponential backoff
+        
+        Args:
+            text (str): Text to embed
+
+        Returns:
+            tuple(list[float], int, int): A tuple with the embedded text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__aembed, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return await wrapper(text, **kwargs)
+    
     def _calculate_tokens(self, text: str) -> int:
         """Calculate the number of tokens in the text
         Args:
@@ -331,8 +634,14 @@ class Ada(BaseLLM):
         tokens = self._calculate_tokens(text)
         if tokens > self.max_tokens * self.max_tokens_ratio_per_input:
             raise ValueError("Text is too long to embed")
+
+        cache_key, cached_response = self._get_cached_response(text, {})
+        if cached_response:
+            self.cost_manager.update_cached_costs(cached_response[1], cached_response[2])
+            return cached_response[0]
         
-        embedding, prompt_tokens, response_tokens = self._completion(text)
+        embedding, prompt_tokens, response_tokens = self._call_with_rate_limit(self._completion, text)
+        self._store_response(cache_key, embedding, prompt_tokens, response_tokens)
 
         # Update the cost of the prompt and response
         self._update_costs(prompt_tokens, response_tokens)
@@ -1,30 +1,58 @@
 from abc import ABC, abstractmethod
+import asyncio
+from concurrent.futures import Future
+from functools import partial
 import logging
 import os
 import time
 import random
 import re
+import threading
+from typing import Callable, Iterator
 
+from llm.rate_limiter import RateLimiter, get_rate_limiter, is_rate_limit_error
+from llm.response_cache import ResponseCache, get_response_cache
 from utils.llm_cost import CostManager
 from utils.logging import CustomAdapter
 
+class InterruptedRequestError(Exception):
+    """The identical request in flight was interrupted before it finished, for example cancelled, so the request must be sent again"""
+
+
 class BaseLLM(ABC):
     """Base class for all LLM classes. It defines the api to use the LLMs"""
 
-    def __init__(self, prompt_token_cost: float, response_token_cost: float, max_tokens: int, max_tokens_ratio_per_input: float = 0.7):
+    # Requests in flight by key, shared by all the models of the process. Identical concurrent requests wait for the same call
+    _in_flight_requests: dict[str, Future] = {}
+    _in_flight_lock = threading.Lock()
+
+    def __init__(self, prompt_token_cost: float, response_token_cost: float, max_tokens: int, max_tokens_ratio_per_input: float = 0.7,
+                 requests_per_minute: int | None = None, tokens_per_minute: int | None = None, max_concurrency: int = 16):
         """Constructor for the BaseLLM class
         Args:
             prompt_token_cost (float): Cost of a token in the prompt
             response_token_cost (float): Cost of a token in the response
             max_tokens (int): Maximum number of tokens
             max_tokens_ratio_per_input (int): Maximum ratio of tokens per input in the prompt, to avoid the LLM to use all the tokens in the prompt for just the input
+            requests_per_minute (int | None, optional): Maximum number of requests per minute to the model. None means no limit. Defaults to None.
+            tokens_per_minute (int | None, optional): Maximum number of tokens per minute to the model. None means no limit. Defaults to None.
+            max_concurrency (int, optional): Maximum number of requests in flight to the model. Defaults to 16.
         """
         self.cost_manager = CostManager(prompt_token_cost, response_token_cost)
         self.max_tokens = max_tokens
         self.max_tokens_ratio_per_input = max_tokens_ratio_per_input
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.coalesce_requests = os.getenv("LLM_COALESCE_REQUESTS", "true").lower() != "false"
         self.logger = logging.getLogger(__name__)
         self.logger = CustomAdapter(self.logger)
 
+    @property
+    def rate_limiter(self) -> RateLimiter:
+        """Rate limiter of the model, shared by all the instances of the same model in the process"""
+        return get_rate_limiter(self._get_model_id(), self.requests_per_minute, self.tokens_per_minute, self.max_concurrency)
+
     @abstractmethod
     def _calculate_tokens(self, prompt:str) -> int:
         """Abstract method for calculating the number of tokens in the prompt
@@ -46,15 +74,36 @@ class BaseLLM(ABC):
         """
         self.cost_manager.update_costs(prompt_tokens, response_tokens)
 
+    @staticmethod
+    def _get_retry_wait(error: Exception, delay: float, jitter: bool, rate_limiter: RateLimiter | None) -> float:
+        """Get the time to wait before retrying a request
+        Args:
+            error (Exception): Error raised by the request
+            delay (float): Current delay of the exponential backoff
+            jitter (bool): Add jitter to the delay, so the requests that failed together do not retry at the same time
+            rate_limiter (RateLimiter | None): Rate limiter of the model
+        Returns:
+            float: Seconds to wait
+        """
+        wait = delay * (1 + jitter * random.random())
+        # After a rate limit error wait for the cool down shared by all the requests of the model, with the jitter on top
+        # of it so the requests that were waiting for the same cool down do not retry at the same time
+        if rate_limiter is not None and is_rate_limit_error(error):
+            cooldown = rate_limiter.on_rate_limit(error)
+            wait = cooldown + delay * jitter * random.random() if jitter else max(wait, cooldown)
+        return wait
+
     @staticmethod
     def retry_with_exponential_backoff(
         func,
         logger: logging.Logger,
         errors: tuple,
         initial_delay: float = 1,
-        exponential_base: float = 1,
+        exponential_base: float = 2,
         jitter: bool = True,
         max_retries: int = 5,
+        max_delay: float = 60,
+        rate_limiter: RateLimiter | None = None,
     ):
         """Retry a function with exponential backoff.
         
@@ -66,6 +115,8 @@ class BaseLLM(ABC):
             exponential_base (float, optional): Exponential base. Defaults to 2.
             jitter (bool, optional): Add jitter to the delay. Defaults to True.
             max_retries (int, optional): Maximum number of retries. Defaults to 5.
+            max_delay (float, optional): Maximum delay between retries. Defaults to 60.
+            rate_limiter (RateLimiter | None, optional): Rate limiter of the model, it is notified of the rate limit errors and the retries reserve their budget in it. Defaults to None.
 
         Raises:
             Exception: Maximum number of retries exceeded
@@ -96,19 +147,86 @@ class BaseLLM(ABC):
                             f"Maximum number of retries ({max_retries}) exceeded."
                         )
                     
+                    wait = BaseLLM._get_retry_wait(e, delay, jitter, rate_limiter)
                     # Increment the delay
-                    delay *= exponential_base * (1 + jitter * random.random())
+                    delay = min(delay * exponential_base, max_delay)
 
-                    logger.warning("Error in the llm: %s. Retrying for the %s time. Waiting %.2f seconds", e, num_retries, delay)
+                    logger.warning("Error in the llm: %s. Retrying for the %s time. Waiting %.2f seconds", e, num_retries, wait)
     
-                    # Sleep for the delay
-                    time.sleep(delay)
+                    # Sleep for the delay, the retry reserves its budget again in the rate limiter
+                    reserved_tokens = rate_limiter.release_for_retry() if rate_limiter is not None else None
+                    time.sleep(wait)
+                    if reserved_tokens is not None:
+                        rate_limiter.acquire(reserved_tokens)
     
                 # Raise exceptions for any errors not specified
                 except Exception as e:
                     raise e
     
         return wrapper
+
+    @staticmethod
+    def async_retry_with_exponential_backoff(
+        func,
+        logger: logging.Logger,
+        errors: tuple,
+        initial_delay: float = 1,
+        exponential_base: float = 2,
+        jitter: bool = True,
+        max_retries: int = 5,
+        max_delay: float = 60,
+        rate_limiter: RateLimiter | None = None,
+    ):
+        """Retry a coroutine function with exponential backoff. The waits are done with asyncio.sleep,
+        so other requests can keep running on the event loop while a request is waiting to be retried.
+        
+        Args:
+            func (function): Coroutine function to retry
+            logger (logging.Logger): Logger
+            errors (tuple): Tuple of type of errors to retry
+            initial_delay (float, optional): Initial delay. Defaults to 1.
+            exponential_base (float, optional): Exponential base. Defaults to 2.
+            jitter (bool, optional): Add jitter to the delay. Defaults to True.
+            max_retries (int, optional): Maximum number of retries. Defaults to 5.
+            max_delay (float, optional): Maximum delay between retries. Defaults to 60.
+            rate_limiter (RateLimiter | None, optional): Rate limiter of the model, it is notified of the rate limit errors and the retries reserve their budget in it. Defaults to None.
+
+        Raises:
+            Exception: Maximum number of retries exceeded
+            Exception: Any other exception raised by the function that is not specified in the errors tuple
+
+        Returns:
+            function: Coroutine function to retry with exponential backoff
+        """
+
+        async def wrapper(*args, **kwargs):
+            num_retries = 0
+            delay = initial_delay
+
+            while True:
+                try:
+                    return await func(*args, **kwargs)
+
+                # Retry on specific errors
+                except errors as e:
+                    num_retries += 1
+
+                    if num_retries > max_retries:
+                        raise Exception(
+                            f"Maximum number of retries ({max_retries}) exceeded."
+                        )
+
+                    wait = BaseLLM._get_retry_wait(e, delay, jitter, rate_limiter)
+                    delay = min(delay * exponential_base, max_delay)
+
+                    logger.warning("Error in the llm: %s. Retrying for the %s time. Waiting %.2f seconds", e, num_retries, wait)
+
+                    reserved_tokens = rate_limiter.release_for_retry() if rate_limiter is not None else None
+                    await asyncio.sleep(wait)
+                    if reserved_tokens is not None:
+                        await rate_limiter.aacquire(reserved_tokens)
+
+        return wrapper
     
     @abstractmethod
     def _completion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
@@ -120,6 +238,148 @@ class BaseLLM(ABC):
         """
         pass
 
+    async def _acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Async completion api. Models with an async client override this method, by default
+        the blocking completion is executed in a thread to avoid blocking the event loop.
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        return await asyncio.to_thread(self._completion, prompt, **kwargs)
+
+    def _stream_completion(self, prompt: str, stop_when: Callable[[str], bool], **kwargs) -> tuple[str, int, int]:
+        """Streaming completion api that stops as soon as the stop condition is met. Models with a streaming api override
+        this method, by default the full completion is requested.
+        Args:
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool]): Function that receives the text generated so far and returns True when the answer is complete
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        return self._completion(prompt, **kwargs)
+
+    async def _astream_completion(self, prompt: str, stop_when: Callable[[str], bool], **kwargs) -> tuple[str, int, int]:
+        """Async streaming completion api, by default the streaming completion is executed in a thread
+        Args:
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool]): Function that receives the text generated so far and returns True when the answer is complete
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        return await asyncio.to_thread(self._stream_completion, prompt, stop_when, **kwargs)
+
+    def _read_stream(self, stream_func: Callable[..., Iterator[str]], prompt: str, stop_when: Callable[[str], bool], **kwargs) -> tuple[str, int, int]:
+        """Read the chunks of a streaming completion until the stream ends or the stop condition is met.
+        When the condition is met the stream is closed, so the api stops generating the rest of the response.
+        Args:
+            stream_func (Callable[..., Iterator[str]]): Generator function of the model that yields the chunks of text of the response
+                and returns the tokens in the prompt and in the response reported by the api, or None if they were not reported
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool]): Function that receives the text generated so far and returns True when the answer is complete
+        Returns:
+            tuple(str, int, int): A tuple with the generated text, the number of tokens in the prompt and the number of tokens generated
+        """
+        response = ""
+        usage = None
+        chunks = stream_func(prompt, **kwargs)
+        try:
+            while True:
+                try:
+                    chunk = next(chunks)
+                except StopIteration as end:
+                    usage = end.value
+                    break
+                response += chunk
+                if stop_when(response):
+                    self.logger.info("Stream stopped early, the answer is complete")
+                    break
+        finally:
+            chunks.close()
+
+        if usage is not None:
+            return response, *usage
+        # The usage is not reported when the stream is cancelled, the tokens are estimated with the tokenizer of the model
+        prompt_tokens = self._calculate_tokens(prompt)
+        if "system_prompt" in kwargs:
+            prompt_tokens += self._calculate_tokens(kwargs["system_prompt"])
+        return response, prompt_tokens, self._calculate_tokens(response)
+
+    @staticmethod
+    def _get_stream_usage(chunk) -> tuple[int, int] | None:
+        """Get the tokens used by a streaming completion from a chunk of the stream. The apis report them in the last chunk
+        when the usage is requested with the stream_options
+        Args:
+            chunk: Chunk of the stream
+        Returns:
+            tuple(int, int) | None: The number of tokens in the prompt and in the response, None if the chunk does not report them
+        """
+        def get(obj, name: str):
+            return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+        usage = get(chunk, 'usage') or get(get(chunk, 'x_groq') or {}, 'usage')
+        if not usage:
+            return None
+        return get(usage, 'prompt_tokens') or 0, get(usage, 'completion_tokens') or 0
+
+    def _get_completion_function(self, stop_when: Callable[[str], bool] | None = None) -> Callable:
+        """Get the completion function to call for a request
+        Args:
+            stop_when (Callable[[str], bool] | None, optional): Stop condition of the response. If given, the response is streamed. Defaults to None.
+        Returns:
+            Callable: Completion function
+        """
+        if stop_when is None:
+            return self._completion
+        return partial(self._stream_completion, stop_when=stop_when)
+
+    def _get_async_completion_function(self, stop_when: Callable[[str], bool] | None = None) -> Callable:
+        """Get the async completion function to call for a request
+        Args:
+            stop_when (Callable[[str], bool] | None, optional): Stop condition of the response. If given, the response is streamed. Defaults to None.
+        Returns:
+            Callable: Async completion function
+        """
+        if stop_when is None:
+            return self._acompletion
+        return partial(self._astream_completion, stop_when=stop_when)
+
+    def _call_with_rate_limit(self, func, prompt: str, **kwargs) -> tuple:
+        """Call the api reserving its budget in the rate limiter of the model
+        Args:
+            func (function): Completion function of the model
+            prompt (str): Prompt or text of the request
+        Returns:
+            tuple: Result of the completion function, the response, the tokens in the prompt and the tokens in the response
+        """
+        reserved_tokens = self._calculate_tokens(prompt) + kwargs.get('max_tokens', 0)
+        used_tokens = None
+        self.rate_limiter.acquire(reserved_tokens)
+        try:
+            result = func(prompt, **kwargs)
+            used_tokens = result[1] + result[2]
+            return result
+        finally:
+            self.rate_limiter.release(reserved_tokens, used_tokens)
+
+    async def _acall_with_rate_limit(self, func, prompt: str, **kwargs) -> tuple:
+        """Call the async api reserving its budget in the rate limiter of the model
+        Args:
+            func (function): Async completion function of the model
+            prompt (str): Prompt or text of the request
+        Returns:
+            tuple: Result of the completion function, the response, the tokens in the prompt and the tokens in the response
+        """
+        reserved_tokens = self._calculate_tokens(prompt) + kwargs.get('max_tokens', 0)
+        used_tokens = None
+        await self.rate_limiter.aacquire(reserved_tokens)
+        try:
+            result = await func(prompt, **kwargs)
+            used_tokens = result[1] + result[2]
+            return result
+        finally:
+            self.rate_limiter.release(reserved_tokens, used_tokens)
+
     def _load_prompt(self, prompt: str) -> str:
         """Load the prompt from a file or return the prompt if it is a string
         Args:
@@ -163,15 +423,15 @@ class BaseLLM(ABC):
             raise ValueError("Not enough inputs passed to the prompt")
         return prompt
 
-    def completion(self, prompt: str, **kwargs) -> str:
-        """Method for the completion api. It updates the cost of the prompt and response and log the tokens and prompts
+    def _prepare_prompt(self, prompt: str, kwargs: dict) -> str:
+        """Load the prompt, replace its inputs and check that it fits in the context of the model.
+        The inputs are removed from the kwargs to avoid passing them to the completion api
         Args:
             prompt (str): Prompt file or string for the completion
-            inputs (list[str]): List of inputs to replace the <input{number}> in the prompt. For example: ["This is the first input", "This is the second input"]
+            kwargs (dict): Arguments of the completion
         Returns:
-            str: Completed text
+            str: Prompt ready to be sent to the model
         """
-
         prompt = self._load_prompt(prompt)
         prompt = self._replace_inputs_in_prompt(prompt, kwargs.get("inputs", []))
 
@@ -181,11 +441,252 @@ class BaseLLM(ABC):
         
         self.logger.info(f"Prompt: {prompt}")
         kwargs.pop("inputs", None) # Remove the inputs from the kwargs to avoid passing them to the completion api
-        response, prompt_tokens, response_tokens = self._completion(prompt, **kwargs)
+        return prompt
+
+    def _register_response(self, response: str, prompt_tokens: int, response_tokens: int, cached: bool = False, coalesced: bool = False) -> None:
+        """Log the response and update the costs of the model
+        Args:
+            response (str): Completed text
+            prompt_tokens (int): Number of tokens in the prompt
+            response_tokens (int): Number of tokens in the response
+            cached (bool, optional): Whether the response was read from the cache. Cached responses are reported apart and do not add cost. Defaults to False.
+            coalesced (bool, optional): Whether the response was shared by an identical request in flight. Its cost was already paid by that request. Defaults to False.
+        """
+        if cached:
+            self.logger.info(f"Response (cached): {response}")
+            self.cost_manager.update_cached_costs(prompt_tokens, response_tokens)
+            return
+        if coalesced:
+            self.logger.info(f"Response (shared with an identical request): {response}")
+            self.cost_manager.update_coalesced_costs(prompt_tokens, response_tokens)
+            return
+
         self.logger.info(f"Response: {response}")
 
         self._update_costs(prompt_tokens, response_tokens)
         self.logger.info(f"Prompt tokens: {prompt_tokens}")
         self.logger.info(f"Response tokens: {response_tokens}")
 
-        return response
\ No newline at end of file
+    def _get_model_id(self) -> str:
+        """Get the identifier of the model used in the cache keys
+        Returns:
+            str: Class of the model and name of the deployment
+        """
+        model_name = getattr(self, 'deployment_name', None) or getattr(self, 'model_name', None)
+        return f"{type(self).__name__}:{model_name}"
+
+    def _get_cached_response(self, prompt: str, kwargs: dict, validate: Callable[[str], bool] | None = None) -> tuple[str, tuple | None]:
+        """Look for the response of a request in the response cache
+        Args:
+            prompt (str): Rendered prompt of the request
+            kwargs (dict): Arguments of the completion, including the system prompt
+            validate (Callable[[str], bool] | None, optional): Check of the caller. A cached response it rejects is ignored,
+                except in replay mode where the recorded responses are always used. Defaults to None.
+        Returns:
+            tuple(str, tuple | None): The key of the request and the cached response with its tokens, or None if it is not cached
+        """
+        cache = get_response_cache()
+        key = ResponseCache.make_key(self._get_model_id(), prompt, kwargs)
+        cached_response = cache.get(key)
+        if cached_response and validate is not None and cache.mode != 'replay' and not validate(cached_response[0]):
+            return key, None
+        return key, cached_response
+
+    def _store_response(self, key: str, response, prompt_tokens: int, response_tokens: int, validate: Callable[[str], bool] | None = None) -> None:
+        """Store a response in the response cache
+        Args:
+            key (str): Key of the request
+            response (Any): Response of the model
+            prompt_tokens (int): Number of tokens in the prompt
+            response_tokens (int): Number of tokens in the response
+            validate (Callable[[str], bool] | None, optional): Check of the caller, the responses it rejects are not stored,
+                so a request sent again gets a new response. Defaults to None.
+        """
+        if validate is not None and not validate(response):
+            return
+        get_response_cache().set(key, self._get_model_id(), response, prompt_tokens, response_tokens)
+
+    def _join_in_flight_request(self, key: str) -> tuple[Future, bool]:
+        """Join an identical request in flight or register a new one
+        Args:
+            key (str): Key of the request, it includes the model, the prompt and the kwargs
+        Returns:
+            tuple(Future, bool): The future with the result of the request and True if the caller must execute the request
+        """
+        with BaseLLM._in_flight_lock:
+            future = BaseLLM._in_flight_requests.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            # A running future can not be cancelled by the requests waiting for it, only the owner resolves it
+            future.set_running_or_notify_cancel()
+            BaseLLM._in_flight_requests[key] = future
+            return future, True
+
+    def _finish_in_flight_request(self, key: str, future: Future, result: tuple | None = None, error: BaseException | None = None) -> None:
+        """Publish the result of a request to the identical requests waiting for it
+        Args:
+            key (str): Key of the request
+            future (Future): Future of the request
+            result (tuple | None, optional): Result of the request. Defaults to None.
+            error (BaseException | None, optional): Error raised by the request. Defaults to None. The interruptions, as a
+                cancellation or a KeyboardInterrupt, are published as an InterruptedRequestError, so the waiting requests are sent again.
+        """
+        with BaseLLM._in_flight_lock:
+            BaseLLM._in_flight_requests.pop(key, None)
+        if error is not None:
+            future.set_exception(error if isinstance(error, Exception) else InterruptedRequestError(repr(error)))
+        else:
+            future.set_result(result)
+
+    def _coalesced_completion(self, key: str, prompt: str, stop_when: Callable[[str], bool] | None = None, validate: Callable[[str], bool] | None = None, **kwargs) -> tuple[str, int, int, bool]:
+        """Call the completion api only once for identical requests in flight at the same time and store the response in the cache
+        Args:
+            key (str): Key of the request
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool] | None, optional): Stop condition of the streamed response. Defaults to None.
+            validate (Callable[[str], bool] | None, optional): Check of the caller, only the valid responses are stored in the cache. Defaults to None.
+        Returns:
+            tuple(str, int, int, bool): The completed text, the number of tokens in the prompt and in the response, and True if the response was shared by another request
+        """
+        if not self.coalesce_requests:
+            result = self._call_with_rate_limit(self._get_completion_function(stop_when), prompt, **kwargs)
+            self._store_response(key, *result, validate=validate)
+            return *result, False
+
+        while True:
+            future, is_owner = self._join_in_flight_request(key)
+            if is_owner:
+                break
+            try:
+                return *future.result(), True
+            except InterruptedRequestError:
+                continue # The request was not finished, it is sent again
+        try:
+            result = self._call_with_rate_limit(self._get_completion_function(stop_when), prompt, **kwargs)
+            # Store the response before releasing the request, so the requests that arrive later find it in the cache
+            self._store_response(key, *result, validate=validate)
+        except BaseException as e:
+            self._finish_in_flight_request(key, future, error=e)
+            raise
+        self._finish_in_flight_request(key, future, result=result)
+        return *result, False
+
+    async def _acoalesced_completion(self, key: str, prompt: str, stop_when: Callable[[str], bool] | None = None, validate: Callable[[str], bool] | None = None, **kwargs) -> tuple[str, int, int, bool]:
+        """Call the async completion api only once for identical requests in flight at the same time
+        Args:
+            key (str): Key of the request
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool] | None, optional): Stop condition of the streamed response. Defaults to None.
+            validate (Callable[[str], bool] | None, optional): Check of the caller, only the valid responses are stored in the cache. Defaults to None.
+        Returns:
+            tuple(str, int, int, bool): The completed text, the number of tokens in the prompt and in the response, and True if the response was shared by another request
+        """
+        if not self.coalesce_requests:
+            result = await self._acall_with_rate_limit(self._get_async_completion_function(stop_when), prompt, **kwargs)
+            self._store_response(key, *result, validate=validate)
+            return *result, False
+
+        while True:
+            future, is_owner = self._join_in_flight_request(key)
+            if is_owner:
+                break
+            try:
+                return *(await asyncio.wrap_future(future)), True
+            except InterruptedRequestError:
+                continue # The request was not finished, it is sent again
+        try:
+            result = await self._acall_with_rate_limit(self._get_async_completion_function(stop_when), prompt, **kwargs)
+            self._store_response(key, *result, validate=validate)
+        except BaseException as e:
+            self._finish_in_flight_request(key, future, error=e)
+            raise
+        self._finish_in_flight_request(key, future, result=result)
+        return *result, False
+
+    def completion(self, prompt: str, **kwargs) -> str:
+        """Method for the completion api. It updates the cost of the prompt and response and log the tokens and prompts
+        Args:
+            prompt (str): Prompt file or string for the completion
+            inputs (list[str]): List of inputs to replace the <input{number}> in the prompt. For example: ["This is the first input", "This is the second input"]
+            stop_when (Callable[[str], bool], optional): Function that receives the text generated so far and returns True when the answer is complete.
+                If given, the response is streamed and the generation stops as soon as the answer is complete. See utils.llm for the available conditions.
+            validate (Callable[[str], bool], optional): Function that returns True if the caller can use a response. The responses it rejects
+                are not stored in the cache and are not read from it, so the caller can send the request again and get a new response.
+        Returns:
+            str: Completed text
+        """
+        prompt = self._prepare_prompt(prompt, kwargs)
+        stop_when = kwargs.pop("stop_when", None)
+        validate = kwargs.pop("validate", None)
+        # A response cut by a stop condition is only reused by requests with the same condition
+        cache_kwargs = {**kwargs, "stop_when": stop_when.__name__} if stop_when else kwargs
+        cache_key, cached_response = self._get_cached_response(prompt, cache_kwargs, validate)
+        if cached_response:
+            self._register_response(*cached_response, cached=True)
+            return cached_response[0]
+
+        response, prompt_tokens, response_tokens, coalesced = self._coalesced_completion(cache_key, prompt, stop_when, validate, **kwargs)
+        self._register_response(response, prompt_tokens, response_tokens, coalesced=coalesced)
+
+        return response
+
+    async def acompletion(self, prompt: str, **kwargs) -> str:
+        """Async version of the completion api. Many requests can be awaited at the same time on one event loop
+        Args:
+            prompt (str): Prompt file or string for the completion
+            inputs (list[str]): List of inputs to replace the <input{number}> in the prompt. For example: ["This is the first input", "This is the second input"]
+            stop_when (Callable[[str], bool], optional): Function that receives the text generated so far and returns True when the answer is complete.
+                If given, the response is streamed and the generation stops as soon as the answer is complete. See utils.llm for the available conditions.
+            validate (Callable[[str], bool], optional): Function that returns True if the caller can use a response. The responses it rejects
+                are not stored in the cache and are not read from it, so the caller can send the request again and get a new response.
+        Returns:
+            str: Completed text
+        """
+        prompt = self._prepare_prompt(prompt, kwargs)
+        stop_when = kwargs.pop("stop_when", None)
+        validate = kwargs.pop("validate", None)
+        # A response cut by a stop condition is only reused by requests with the same condition
+        cache_kwargs = {**kwargs, "stop_when": stop_when.__name__} if stop_when else kwargs
+        cache_key, cached_response = self._get_cached_response(prompt, cache_kwargs, validate)
+        if cached_response:
+            self._register_response(*cached_response, cached=True)
+            return cached_response[0]
+
+        response, prompt_tokens, response_tokens, coalesced = await self._acoalesced_completion(cache_key, prompt, stop_when, validate, **kwargs)
+        self._register_response(response, prompt_tokens, response_tokens, coalesced=coalesced)
+
+        return response
+
+    async def aget_embedding(self, text: str) -> list[float]:
+        """Get the embedding of a text asynchronously. Only available for the embedding models
+        Args:
+            text (str): Text to embed
+        Returns:
+            list[float]: Embedding of the text
+        """
+        # Check that the prompt is not too long
+        tokens = self._calculate_tokens(text)
+        if tokens > self.max_tokens * self.max_tokens_ratio_per_input:
+            raise ValueError("Text is too long to embed")
+
+        cache_key, cached_response = self._get_cached_response(text, {})
+        if cached_response:
+            self.cost_manager.update_cached_costs(cached_response[1], cached_response[2])
+            return cached_response[0]
+
+        embedding, prompt_tokens, response_tokens = await self._acall_with_rate_limit(self._acompletion, text)
+        self._store_response(cache_key, embedding, prompt_tokens, response_tokens)
+
+        # Update the cost of the prompt and response
+        self._update_costs(prompt_tokens, response_tokens)
+        return embedding
+
+    async def aget_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """Get the embeddings of a list of texts asynchronously. All the texts are embedded concurrently
+        Args:
+            texts (list[str]): List of texts to embed
+        Returns:
+            list[list[float]]: List of embeddings of the texts in the same order
+        """
+        return list(await asyncio.gather(*(self.aget_embedding(text) for text in texts)))
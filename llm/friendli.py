@@ -1,10 +1,11 @@
 import os
+from typing import Callable, Iterator
 
 import friendli.errors
 
 from llm.base_llm import BaseLLM
 import tiktoken
-from friendli import Friendli
+from friendli import Friendli, AsyncFriendli
 import friendli
 
 
@@ -22,6 +23,7 @@ class Llama31_8B(BaseLLM):
         self.logger.info("Loading Llama3.1 8B model...")
         # Load the model
         self.client = Friendli(token=os.getenv("FRIENDLI_TOKEN"))
+        self.async_client = AsyncFriendli(token=os.getenv("FRIENDLI_TOKEN"))
 
         self.model_name = 'meta-llama-3.1-8b-instruct'
         # Encoding to estimate the number of tokens
@@ -63,6 +65,29 @@ class Llama31_8B(BaseLLM):
     
         return completion, prompt_tokens, response_tokens
     
+    async def __acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Async completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+
+        response = await self.async_client.chat.completions.create(model=self.model_name, messages=prompt, stream=False, **kwargs)
+        completion = response.choices[0].message.content
+        prompt_tokens = response.usage.prompt_tokens
+        response_tokens = response.usage.completion_tokens
+    
+        return completion, prompt_tokens, response_tokens
+    
     def _completion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
         """Wrapper for the completion api with retry and exponential backoff
         
@@ -72,9 +97,61 @@ class Llama31_8B(BaseLLM):
         Returns:
             tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
         """
-        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(friendli.errors.APIError, friendli.errors.RequestTimeoutError, friendli.errors.FriendliInternalError, friendli.errors.InvalidGenerationError, friendli.errors.NotSupportedError))
+        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(friendli.errors.APIError, friendli.errors.RequestTimeoutError, friendli.errors.FriendliInternalError, friendli.errors.InvalidGenerationError, friendli.errors.NotSupportedError), rate_limiter=self.rate_limiter)
         return wrapper(prompt, **kwargs)
     
+    async def _acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the async completion api with async retry and exponential backoff
+        
+        Args:
+            prompt (str): Prompt for the completion
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__acompletion, self.logger, errors=(friendli.errors.APIError, friendli.errors.RequestTimeoutError, friendli.errors.FriendliInternalError, friendli.errors.InvalidGenerationError, friendli.errors.NotSupportedError), rate_limiter=self.rate_limiter)
+        return await wrapper(prompt, **kwargs)
+    
+    def __stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Streaming completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            Iterator[str]: Chunks of text of the response. The generator returns the tokens in the prompt and in the response reported by the api
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        stream = self.client.chat.completions.create(model=self.model_name, messages=prompt, stream=True, **kwargs)
+        usage = None
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                usage = self._get_stream_usage(chunk) or usage
+        finally:
+            # Closing the stream cancels the generation of the rest of the response
+            stream.close()
+        return usage
+
+    def _stream_completion(self, prompt: str, stop_when: Callable[[str], bool], **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the streaming completion api with retry and exponential backoff
+
+        Args:
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool]): Function that receives the text generated so far and returns True when the answer is complete
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.retry_with_exponential_backoff(self._read_stream, self.logger, errors=(friendli.errors.APIError, friendli.errors.RequestTimeoutError, friendli.errors.FriendliInternalError, friendli.errors.InvalidGenerationError, friendli.errors.NotSupportedError), rate_limiter=self.rate_limiter)
+        return wrapper(self.__stream, prompt, stop_when, **kwargs)
+    
     def _calculate_tokens(self, prompt: str) -> int:
         """Calculate the number of tokens in the prompt
         Args:
@@ -104,6 +181,7 @@ class Llama31_70B(BaseLLM):
         self.logger.info("Loading Llama3.1 70B model...")
         # Load the model
         self.client = Friendli(token=os.getenv("FRIENDLI_TOKEN"))
+        self.async_client = AsyncFriendli(token=os.getenv("FRIENDLI_TOKEN"))
 
         self.model_name = 'meta-llama-3.1-70b-instruct'
         # Encoding to estimate the number of tokens
@@ -145,6 +223,29 @@ class Llama31_70B(BaseLLM):
     
         return completion, prompt_tokens, response_tokens
     
+    async def __acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Async completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+
+        response = await self.async_client.chat.completions.create(model=self.model_name, messages=prompt, stream=False, **kwargs)
+        completion = response.choices[0].message.content
+        prompt_tokens = response.usage.prompt_tokens
+        response_tokens = response.usage.completion_tokens
+    
+        return completion, prompt_tokens, response_tokens
+    
     def _completion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
         """Wrapper for the completion api with retry and exponential backoff
         
@@ -154,9 +255,61 @@ class Llama31_70B(BaseLLM):
         Returns:
             tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
         """
-        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(friendli.errors.APIError, friendli.errors.RequestTimeoutError, friendli.errors.FriendliInternalError, friendli.errors.InvalidGenerationError, friendli.errors.NotSupportedError))
+        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(friendli.errors.APIError, friendli.errors.RequestTimeoutError, friendli.errors.FriendliInternalError, friendli.errors.InvalidGenerationError, friendli.errors.NotSupportedError), rate_limiter=self.rate_limiter)
         return wrapper(prompt, **kwargs)
     
+    async def _acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the async completion api with async retry and exponential backoff
+        
+        Args:
+            prompt (str): Prompt for the completion
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__acompletion, self.logger, errors=(friendli.errors.APIError, friendli.errors.RequestTimeoutError, friendli.errors.FriendliInternalError, friendli.errors.InvalidGenerationError, friendli.errors.NotSupportedError), rate_limiter=self.rate_limiter)
+        return await wrapper(prompt, **kwargs)
+    
+    def __stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Streaming completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            Iterator[str]: Chunks of text of the response. The generator returns the tokens in the prompt and in the response reported by the api
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        stream = self.client.chat.completions.create(model=self.model_name, messages=prompt, stream=True, **kwargs)
+        usage = None
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                usage = self._get_stream_usage(chunk) or usage
+        finally:
+            # Closing the stream cancels the generation of the rest of the response
+            stream.close()
+        return usage
+
+    def _stream_completion(self, prompt: str, stop_when: Callable[[str], bool], **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the streaming completion api with retry and exponential backoff
+
+        Args:
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool]): Function that receives the text generated so far and returns True when the answer is complete
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.retry_with_exponential_backoff(self._read_stream, self.logger, errors=(friendli.errors.APIError, friendli.errors.RequestTimeoutError, friendli.errors.FriendliInternalError, friendli.errors.InvalidGenerationError, friendli.errors.NotSupportedError), rate_limiter=self.rate_limiter)
+        return wrapper(self.__stream, prompt, stop_when, **kwargs)
+    
     def _calculate_tokens(self, prompt: str) -> int:
         """Calculate the number of tokens in the prompt
         Args:
@@ -1,8 +1,9 @@
 import os
+from typing import Callable, Iterator
 
 from llm.base_llm import BaseLLM
 import tiktoken
-from groq import Groq
+from groq import Groq, AsyncGroq
 import groq
 
 
@@ -22,6 +23,9 @@ class Llama31_8B(BaseLLM):
         self.client = Groq(
             api_key=os.getenv("GROQ_API_KEY"),
         )
+        self.async_client = AsyncGroq(
+            api_key=os.getenv("GROQ_API_KEY"),
+        )
         self.model_name = 'llama-3.1-8b-instant'
         # Encoding to estimate the number of tokens
         self.encoding = tiktoken.encoding_for_model("gpt-4o")
@@ -55,7 +59,36 @@ class Llama31_8B(BaseLLM):
             del kwargs["system_prompt"]
 
 
-        response = self.client.chat.completions.create(model=self.model_name, messages=prompt, stream=False, **kwargs)
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.model_name, messages=prompt, stream=False, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
+        completion = response.choices[0].message.content
+        prompt_tokens = response.usage.prompt_tokens
+        response_tokens = response.usage.completion_tokens
+    
+        return completion, prompt_tokens, response_tokens
+    
+    async def __acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Async completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+
+        raw_response = await self.async_client.chat.completions.with_raw_response.create(model=self.model_name, messages=prompt, stream=False, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
         completion = response.choices[0].message.content
         prompt_tokens = response.usage.prompt_tokens
         response_tokens = response.usage.completion_tokens
@@ -71,9 +104,64 @@ class Llama31_8B(BaseLLM):
         Returns:
             tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
         """
-        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(groq.RateLimitError))
+        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(groq.RateLimitError), rate_limiter=self.rate_limiter)
         return wrapper(prompt, **kwargs)
     
+    async def _acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the async completion api with async retry and exponential backoff
+        
+        Args:
+            prompt (str): Prompt for the completion
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__acompletion, self.logger, errors=(groq.RateLimitError), rate_limiter=self.rate_limiter)
+        return await wrapper(prompt, **kwargs)
+    
+    def __stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Streaming completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            Iterator[str]: Chunks of text of the response. The generator returns the tokens in the prompt and in the response reported by the api
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.model_name, messages=prompt, stream=True, extra_body={"stream_options": {"include_usage": True}}, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        stream = raw_response.parse()
+        usage = None
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                usage = self._get_stream_usage(chunk) or usage
+        finally:
+            # Closing the stream cancels the generation of the rest of the response
+            stream.close()
+        return usage
+
+    def _stream_completion(self, prompt: str, stop_when: Callable[[str], bool], **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the streaming completion api with retry and exponential backoff
+
+        Args:
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool]): Function that receives the text generated so far and returns True when the answer is complete
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.retry_with_exponential_backoff(self._read_stream, self.logger, errors=(groq.RateLimitError), rate_limiter=self.rate_limiter)
+        return wrapper(self.__stream, prompt, stop_when, **kwargs)
+    
     def _calculate_tokens(self, prompt: str) -> int:
         """Calculate the number of tokens in the prompt
         Args:
@@ -0,0 +1,53 @@
+from collections.abc import Mapping
+from importlib import import_module
+import threading
+
+from llm.base_llm import BaseLLM
+
+
+class ModelRegistry(Mapping):
+    """Models by name that are created on first use. Importing a provider loads its client library and creating a model
+    loads its tokenizer, so the models that are never used in a simulation do not slow down the startup.
+    """
+
+    def __init__(self, factories: dict[str, str]):
+        """Constructor for the ModelRegistry class
+        Args:
+            factories (dict[str, str]): Class of every model by name, as "module:class". For example: {"embedding": "llm.openai:Embedding"}
+        """
+        self._factories = factories
+        self._models: dict[str, BaseLLM] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> BaseLLM:
+        """Get a model, it is created the first time it is requested
+        Args:
+            name (str): Name of the model
+        Returns:
+            BaseLLM: Model
+        """
+        if name not in self._factories:
+            raise KeyError(name)
+        with self._lock:
+            if name not in self._models:
+                module_name, class_name = self._factories[name].split(':')
+                self._models[name] = getattr(import_module(module_name), class_name)()
+            return self._models[name]
+
+    def __contains__(self, name: object) -> bool:
+        """Check if a model is available without creating it"""
+        return name in self._factories
+
+    def __iter__(self):
+        return iter(self._factories)
+
+    def __len__(self) -> int:
+        return len(self._factories)
+
+    def loaded(self) -> dict[str, BaseLLM]:
+        """Get the models that have been created
+        Returns:
+            dict[str, BaseLLM]: Created models by name
+        """
+        with self._lock:
+            return dict(self._models)
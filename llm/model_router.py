@@ -0,0 +1,276 @@
+from collections import defaultdict, deque
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable
+
+import numpy as np
+
+from llm.base_llm import BaseLLM
+from utils.logging import CustomAdapter
+
+logger = logging.getLogger(__name__)
+logger = CustomAdapter(logger)
+
+DEFAULT_ROUTES_PATH = os.path.join("config", "model_routes.json")
+
+
+class ModelRouter:
+    """Chooses the model used by each cognitive module. The routes are read from a json table with the candidate models
+    of every module, ordered from the smallest to the biggest model, and optional budgets. The default table routes every
+    module to the main model, the smaller models are opt-in as in config/model_routes.small_models.json. For example:
+        {
+            "default": {"models": ["llama3.1_70B"]},
+            "modules": {
+                "should_react": {"models": ["llama3.1-8B", "llama3.1_70B"], "max_p95_latency": 3, "max_cost": 0.001}
+            },
+            "substrates": {
+                "clean_up": {"modules": {"should_react": {"models": ["llama3.1_70B"]}}}
+            }
+        }
+    The first candidate whose context fits the prompt and that meets the p95 latency (seconds) and the cost budget (per request)
+    of the route is used. If the response of a model cannot be parsed, the request is escalated to the next bigger model.
+    The candidates are only created when they are considered, and a model excluded by its latency is probed again periodically.
+    """
+
+    def __init__(self, models: dict[str, BaseLLM], routes: dict | None = None, substrate_name: str | None = None, fallback_models: list[str] | None = None, latency_window: int = 200,
+                 probe_interval: float | None = None):
+        """Constructor for the ModelRouter class
+        Args:
+            models (dict[str, BaseLLM]): Available models by name
+            routes (dict | None, optional): Routing table. Defaults to None.
+            substrate_name (str | None, optional): Name of the substrate, it selects the routes defined for the substrate. Defaults to None.
+            fallback_models (list[str] | None, optional): Models used by the modules without a route. Defaults to the first model.
+            latency_window (int, optional): Number of recent latencies kept by model to estimate the p95 latency. Defaults to 200.
+            probe_interval (float | None, optional): Seconds after which a model excluded by the latency budget receives a request again.
+                The latency of that request replaces the previous ones. Defaults to the LLM_ROUTER_PROBE_INTERVAL environment variable or 60.
+        """
+        self.models = models
+        self.routes = routes or {}
+        self.substrate_name = substrate_name
+        self.fallback_models = fallback_models or list(models)[:1]
+        self._latencies = defaultdict(lambda: deque(maxlen=latency_window))
+        self._stats = defaultdict(lambda: {'requests': defaultdict(int), 'escalations': 0})
+        self.probe_interval = probe_interval if probe_interval is not None else float(os.getenv("LLM_ROUTER_PROBE_INTERVAL", 60))
+        self._excluded_since: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, models: dict[str, BaseLLM], routes_path: str | None = None, substrate_name: str | None = None, fallback_models: list[str] | None = None) -> 'ModelRouter':
+        """Create a router with the routing table of a json file. If the file does not exist, every module uses the fallback models
+        Args:
+            models (dict[str, BaseLLM]): Available models by name
+            routes_path (str | None, optional): Path of the routing table. Defaults to the LLM_ROUTES_PATH environment variable or config/model_routes.json.
+            substrate_name (str | None, optional): Name of the substrate. Defaults to None.
+            fallback_models (list[str] | None, optional): Models used by the modules without a route. Defaults to None.
+        Returns:
+            ModelRouter: Router of the models
+        """
+        routes_path = routes_path or os.getenv("LLM_ROUTES_PATH", DEFAULT_ROUTES_PATH)
+        routes = {}
+        if os.path.isfile(routes_path):
+            with open(routes_path) as f:
+                routes = json.load(f)
+        else:
+            logger.warning("Routing table %s not found, all the modules use the models %s", routes_path, fallback_models)
+        return cls(models, routes, substrate_name, fallback_models)
+
+    def get_route(self, module: str) -> dict:
+        """Get the route of a module. The routes of the substrate take precedence over the general ones
+        Args:
+            module (str): Name of the cognitive module
+        Returns:
+            dict: Route with the candidate models and the budgets
+        """
+        substrate_routes = self.routes.get('substrates', {}).get(self.substrate_name, {})
+        for routes in (substrate_routes.get('modules', {}), self.routes.get('modules', {})):
+            if module in routes:
+                return routes[module]
+        return substrate_routes.get('default') or self.routes.get('default') or {'models': self.fallback_models}
+
+    def get_p95_latency(self, model_name: str) -> float | None:
+        """Get the p95 latency of the recent requests of a model
+        Args:
+            model_name (str): Name of the model
+        Returns:
+            float | None: p95 latency in seconds, None if the model has not been used yet
+        """
+        with self._lock:
+            latencies = list(self._latencies[model_name])
+        if not latencies:
+            return None
+        return float(np.percentile(latencies, 95))
+
+    def _fits(self, model: BaseLLM, prompt_tokens: int) -> bool:
+        """Check if a prompt fits in the context of a model"""
+        return prompt_tokens <= model.max_tokens * model.max_tokens_ratio_per_input
+
+    def _meets_latency_budget(self, route: dict, model_name: str) -> bool:
+        """Check if a model meets the latency budget of a route. It only needs the name of the model, so the model is not created
+        Args:
+            route (dict): Route of the module
+            model_name (str): Name of the model
+        Returns:
+            bool: True if the model meets the budget. Models without latency data meet the budget, and an excluded model meets it
+                once every probe interval, so its latency is measured again
+        """
+        max_latency = route.get('max_p95_latency')
+        p95_latency = self.get_p95_latency(model_name)
+        if max_latency is None or p95_latency is None or p95_latency <= max_latency:
+            with self._lock:
+                self._excluded_since.pop(model_name, None)
+            return True
+        now = time.time()
+        with self._lock:
+            excluded_since = self._excluded_since.setdefault(model_name, now)
+            if now - excluded_since < self.probe_interval:
+                return False
+            self._excluded_since[model_name] = now
+        return True
+
+    def _meets_cost_budget(self, route: dict, model: BaseLLM, prompt_tokens: int) -> bool:
+        """Check if a model meets the cost budget of a route
+        Args:
+            route (dict): Route of the module
+            model (BaseLLM): Model
+            prompt_tokens (int): Tokens of the prompt
+        Returns:
+            bool: True if the model meets the budget
+        """
+        max_cost = route.get('max_cost')
+        if max_cost is None:
+            return True
+        cost = prompt_tokens * model.cost_manager.prompt_token_cost + route.get('expected_response_tokens', 500) * model.cost_manager.response_token_cost
+        return cost <= max_cost
+
+    def _count_tokens(self, model: BaseLLM, prompt: str, inputs: list[str] | None) -> int:
+        """Count the tokens of a prompt for a model"""
+        return model._calculate_tokens(model._replace_inputs_in_prompt(model._load_prompt(prompt), inputs or []))
+
+    def _get_candidates(self, module: str, prompt: str, inputs: list[str] | None) -> list[str]:
+        """Get the models that can answer a request, starting by the selected one and followed by the bigger models to escalate to.
+        The latency budget is checked by name, so only the models that are considered are created
+        Args:
+            module (str): Name of the cognitive module
+            prompt (str): Prompt file or string
+            inputs (list[str] | None): Inputs of the prompt
+        Returns:
+            list[str]: Names of the candidates
+        """
+        route = self.get_route(module)
+        names = [model_name for model_name in route.get('models', self.fallback_models) if model_name in self.models]
+        for i, model_name in enumerate(names):
+            if i < len(names) - 1 and not self._meets_latency_budget(route, model_name):
+                continue
+            model = self.models[model_name]
+            prompt_tokens = self._count_tokens(model, prompt, inputs)
+            if self._fits(model, prompt_tokens) and (i == len(names) - 1 or self._meets_cost_budget(route, model, prompt_tokens)):
+                return names[i:]
+
+        # No candidate meets the budgets, the biggest model whose context fits the prompt is used
+        for i in reversed(range(len(names))):
+            if self._fits(self.models[names[i]], self._count_tokens(self.models[names[i]], prompt, inputs)):
+                return names[i:]
+        # No candidate of the route is available, use the fallback models
+        return [model_name for model_name in self.fallback_models if model_name in self.models]
+
+    def _register_request(self, module: str, model_name: str, latency: float, escalated: bool) -> None:
+        """Register the latency and the model used by a request"""
+        with self._lock:
+            if model_name in self._excluded_since:
+                # The new latency of an excluded model replaces the latencies that excluded it
+                self._latencies[model_name].clear()
+            self._latencies[model_name].append(latency)
+            self._stats[module]['requests'][model_name] += 1
+            if escalated:
+                self._stats[module]['escalations'] += 1
+
+    @staticmethod
+    def _parse(parse: Callable[[str], Any] | None, response: str) -> tuple[Any, bool]:
+        """Parse a response
+        Returns:
+            tuple(Any, bool): The parsed response and True if it could be parsed
+        """
+        if parse is None:
+            return response, True
+        try:
+            parsed = parse(response)
+        except Exception:
+            return None, False
+        return parsed, bool(parsed)
+
+    def completion(self, module: str, prompt: str, parse: Callable[[str], Any] | None = None, **kwargs) -> Any:
+        """Completion api of a cognitive module. The request is sent to the model selected by the route of the module
+        and escalated to the next model of the route when the response cannot be parsed or the prompt is too long
+        Args:
+            module (str): Name of the cognitive module. For example: should_react, plan, actions_sequence
+            prompt (str): Prompt file or string for the completion
+            parse (Callable[[str], Any] | None, optional): Function that parses the response. The response is not valid if it raises an exception
+                or returns an empty value. If None, the raw response is returned. Defaults to None.
+            inputs (list[str]): List of inputs to replace the <input{number}> in the prompt
+        Returns:
+            Any: Parsed response of the last model called
+        """
+        candidates = self._get_candidates(module, prompt, kwargs.get('inputs'))
+        # Only the responses that can be parsed are cached, so a request sent again after an invalid response gets a new one
+        validate = (lambda response: self._parse(parse, response)[1]) if parse is not None else None
+        parsed = None
+        for i, model_name in enumerate(candidates):
+            # The bigger models are only created when the request is escalated to them
+            model = self.models[model_name]
+            start = time.time()
+            try:
+                response = model.completion(prompt, validate=validate, **kwargs)
+            except ValueError as e:
+                if str(e) == 'Prompt is too long' and i < len(candidates) - 1:
+                    continue
+                raise e
+            self._register_request(module, model_name, time.time() - start, escalated=i > 0)
+            parsed, is_valid = self._parse(parse, response)
+            if is_valid:
+                return parsed
+            if i < len(candidates) - 1:
+                logger.warning("The response of %s for %s could not be parsed, escalating to %s", model_name, module, candidates[i + 1])
+        return parsed
+
+    async def acompletion(self, module: str, prompt: str, parse: Callable[[str], Any] | None = None, **kwargs) -> Any:
+        """Async version of the completion api of a cognitive module
+        Args:
+            module (str): Name of the cognitive module. For example: should_react, plan, actions_sequence
+            prompt (str): Prompt file or string for the completion
+            parse (Callable[[str], Any] | None, optional): Function that parses the response. Defaults to None.
+            inputs (list[str]): List of inputs to replace the <input{number}> in the prompt
+        Returns:
+            Any: Parsed response of the last model called
+        """
+        candidates = self._get_candidates(module, prompt, kwargs.get('inputs'))
+        # Only the responses that can be parsed are cached, so a request sent again after an invalid response gets a new one
+        validate = (lambda response: self._parse(parse, response)[1]) if parse is not None else None
+        parsed = None
+        for i, model_name in enumerate(candidates):
+            # The bigger models are only created when the request is escalated to them
+            model = self.models[model_name]
+            start = time.time()
+            try:
+                response = await model.acompletion(prompt, validate=validate, **kwargs)
+            except ValueError as e:
+                if str(e) == 'Prompt is too long' and i < len(candidates) - 1:
+                    continue
+                raise e
+            self._register_request(module, model_name, time.time() - start, escalated=i > 0)
+            parsed, is_valid = self._parse(parse, response)
+            if is_valid:
+                return parsed
+            if i < len(candidates) - 1:
+                logger.warning("The response of %s for %s could not be parsed, escalating to %s", model_name, module, candidates[i + 1])
+        return parsed
+
+    def get_stats(self) -> dict:
+        """Get the requests sent to every model and the escalations by module
+        Returns:
+            dict: Statistics by module
+        """
+        with self._lock:
+            return {module: {'requests': dict(stats['requests']), 'escalations': stats['escalations']} for module, stats in self._stats.items()}
@@ -0,0 +1,428 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from typing import Callable, Iterator
+
+import numpy as np
+
+from llm.base_llm import BaseLLM
+
+
+class OfflineLLMError(Exception):
+    """Error injected by the offline models to simulate a failure of the api"""
+    pass
+
+
+class LatencySampler:
+    """Samples the latency of the offline models from a distribution.
+    The distribution is defined as "name:param1,param2". Valid distributions are:
+        constant:seconds
+        uniform:min,max
+        normal:mean,std
+        lognormal:mu,sigma (parameters of the underlying normal distribution)
+        exponential:mean
+    """
+
+    def __init__(self, spec: str = "constant:0", seed: int | None = None):
+        """Constructor for the LatencySampler class
+        Args:
+            spec (str, optional): Definition of the distribution. Defaults to "constant:0".
+            seed (int | None, optional): Seed of the random generator. Defaults to None.
+        """
+        name, _, params = spec.partition(':')
+        self.name = name.strip()
+        self.params = [float(p) for p in params.split(',') if p.strip()]
+        self.random = random.Random(seed)
+        if self.name not in ('constant', 'uniform', 'normal', 'lognormal', 'exponential'):
+            raise ValueError(f"Invalid latency distribution {spec}")
+
+    def sample(self) -> float:
+        """Sample a latency
+        Returns:
+            float: Latency in seconds, it is never negative
+        """
+        if self.name == 'constant':
+            latency = self.params[0] if self.params else 0
+        elif self.name == 'uniform':
+            latency = self.random.uniform(*self.params)
+        elif self.name == 'normal':
+            latency = self.random.gauss(*self.params)
+        elif self.name == 'lognormal':
+            latency = self.random.lognormvariate(*self.params)
+        else:
+            latency = self.random.expovariate(1 / self.params[0])
+        return max(latency, 0)
+
+
+class OfflineLLM(BaseLLM):
+    """Local stand-in of a LLM. It does not need any api key or network access, it answers every prompt file
+    with a canned response that follows the schema expected by the cognitive modules.
+    It is meant to measure the overhead of the simulation pipeline and to test it without calling a real model.
+    """
+
+    def __init__(self, latency: str | None = None, error_rate: float | None = None, react_probability: float = 0.2, seed: int | None = None):
+        """Constructor for the OfflineLLM class. The parameters not given are read from the environment variables
+        OFFLINE_LLM_LATENCY, OFFLINE_LLM_ERROR_RATE and OFFLINE_LLM_SEED.
+        Args:
+            latency (str | None, optional): Latency distribution of the responses, see LatencySampler. Defaults to None.
+            error_rate (float | None, optional): Probability of a request failing with an OfflineLLMError. Defaults to None.
+            react_probability (float, optional): Probability of answering that the agent should react. Defaults to 0.2.
+            seed (int | None, optional): Seed of the random generator. Defaults to None.
+        """
+        super().__init__(0, 0, 128000, 0.87)
+        seed = seed if seed is not None else (int(os.getenv("OFFLINE_LLM_SEED")) if os.getenv("OFFLINE_LLM_SEED") else None)
+        self.latency = LatencySampler(latency or os.getenv("OFFLINE_LLM_LATENCY", "constant:0"), seed)
+        self.error_rate = error_rate if error_rate is not None else float(os.getenv("OFFLINE_LLM_ERROR_RATE", 0))
+        self.react_probability = react_probability
+        self.random = random.Random(seed)
+        self.model_name = 'offline'
+
+        # Canned responses by prompt file
+        self.responses = {
+            'react.txt': self._react_response,
+            'plan.txt': self._plan_response,
+            'act.txt': self._act_response,
+            'reflect_questions.txt': self._reflect_questions_response,
+            'reflect_insight.txt': self._reflect_insight_response,
+            'understanding.txt': self._understanding_response,
+            'world_understanding.txt': self._world_understanding_response,
+            'world_representation.txt': self._world_representation_response,
+            'world_rules.txt': self._world_rules_response,
+        }
+        self.logger.info("Offline model loaded")
+
+    def completion(self, prompt: str, **kwargs) -> str:
+        """Completion api. The name of the prompt file is passed down to select the canned response
+        Args:
+            prompt (str): Prompt file or string for the completion
+        Returns:
+            str: Completed text
+        """
+        return super().completion(prompt, prompt_name=os.path.basename(prompt), **kwargs)
+
+    async def acompletion(self, prompt: str, **kwargs) -> str:
+        """Async completion api. The name of the prompt file is passed down to select the canned response
+        Args:
+            prompt (str): Prompt file or string for the completion
+        Returns:
+            str: Completed text
+        """
+        return await super().acompletion(prompt, prompt_name=os.path.basename(prompt), **kwargs)
+
+    def _simulate_request(self) -> float:
+        """Sample the latency of the request and inject an error with the configured probability
+        Returns:
+            float: Latency of the request in seconds
+        """
+        if self.random.random() < self.error_rate:
+            raise OfflineLLMError("Injected error in the offline model")
+        return self.latency.sample()
+
+    def __completion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        time.sleep(self._simulate_request())
+        response = self._build_response(prompt, kwargs.get('prompt_name'))
+        return response, self._calculate_tokens(prompt), self._calculate_tokens(response)
+
+    async def __acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Async completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        await asyncio.sleep(self._simulate_request())
+        response = self._build_response(prompt, kwargs.get('prompt_name'))
+        return response, self._calculate_tokens(prompt), self._calculate_tokens(response)
+
+    def _completion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the completion api with retry and exponential backoff
+
+        Args:
+            prompt (str): Prompt for the completion
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(OfflineLLMError,), initial_delay=0.01, rate_limiter=self.rate_limiter)
+        return wrapper(prompt, **kwargs)
+
+    async def _acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the async completion api with async retry and exponential backoff
+
+        Args:
+            prompt (str): Prompt for the completion
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__acompletion, self.logger, errors=(OfflineLLMError,), initial_delay=0.01, rate_limiter=self.rate_limiter)
+        return await wrapper(prompt, **kwargs)
+
+    def __stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Streaming completion api for the model. The response is yielded word by word
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            Iterator[str]: Chunks of text of the response. The generator returns the tokens in the prompt and in the response, as the apis report them
+        """
+        time.sleep(self._simulate_request())
+        response = self._build_response(prompt, kwargs.get('prompt_name'))
+        yield from re.findall(r'\s*\S+\s*', response)
+        return self._calculate_tokens(prompt), self._calculate_tokens(response)
+
+    def _stream_completion(self, prompt: str, stop_when: Callable[[str], bool], **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the streaming completion api with retry and exponential backoff
+
+        Args:
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool]): Function that receives the text generated so far and returns True when the answer is complete
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.retry_with_exponential_backoff(self._read_stream, self.logger, errors=(OfflineLLMError,), initial_delay=0.01, rate_limiter=self.rate_limiter)
+        return wrapper(self.__stream, prompt, stop_when, **kwargs)
+
+    def _calculate_tokens(self, prompt: str) -> int:
+        """Estimate the number of tokens in the prompt, there is no tokenizer available offline
+        Args:
+            prompt (str): Prompt
+        Returns:
+            int: Number of tokens in the prompt
+        """
+        return len(prompt) // 4 + 6
+
+    def _build_response(self, prompt: str, prompt_name: str | None) -> str:
+        """Build the canned response for the prompt
+        Args:
+            prompt (str): Rendered prompt
+            prompt_name (str | None): Name of the prompt file
+        Returns:
+            str: Response following the schema of the prompt
+        """
+        build = self.responses.get(prompt_name)
+        if build is None:
+            return '```text\nOffline response.\n```'
+        return build(prompt)
+
+    @staticmethod
+    def _json_response(answers: dict) -> str:
+        """Format the answers as the json code snippet expected by extract_answers
+        Args:
+            answers (dict): Answers
+        Returns:
+            str: Response with the json code snippet
+        """
+        return f'```json\n{json.dumps(answers, indent=4)}\n```'
+
+    def _react_response(self, prompt: str) -> str:
+        should_react = self.random.random() < self.react_probability
+        return self._json_response({
+            'Reasoning': 'Offline reasoning about the current plan.',
+            'Answer': should_react
+        })
+
+    def _plan_response(self, prompt: str) -> str:
+        return self._json_response({
+            'Reasoning': 'Offline reasoning about the observations.',
+            'Goals': 'Collect apples while keeping the trees alive.',
+            'Plan': 'Go to the nearest apples and explore the map when there are no apples nearby.'
+        })
+
+    def _act_response(self, prompt: str) -> str:
+        # Go to one of the observed apples, or explore if there are no apples in the observations
+        positions = re.findall(r'apple at position \[(\d+), (\d+)\]', prompt)
+        if positions:
+            position = self.random.choice(positions)
+            action = f'go to position ({position[0]}, {position[1]})'
+        else:
+            action = 'explore'
+        return self._json_response({
+            'Opportunities': 'Offline opportunities.',
+            'Threats': 'Offline threats.',
+            'Options': 'Offline options.',
+            'Consequences': 'Offline consequences.',
+            'Final analysis': 'Offline analysis of the options.',
+            'Reasoning': 'Offline reasoning about the best action.',
+            'Answer': action
+        })
+
+    def _reflect_questions_response(self, prompt: str) -> str:
+        return self._json_response({
+            f'Question_{i}': {'Reasoning': 'Offline reasoning for the question.', 'Question': question}
+            for i, question in enumerate(['What happened to the apples?', 'What are the other agents doing?', 'How can I get more reward?'], start=1)
+        })
+
+    def _reflect_insight_response(self, prompt: str) -> str:
+        n_questions = max(len(re.findall(r'^Question \d+:', prompt, flags=re.MULTILINE)), 1)
+        return self._json_response({
+            f'Insight_{i}': {'Reasoning': 'Offline reasoning behind the insight.', 'Insight': f'Offline insight number {i}.'}
+            for i in range(1, n_questions + 1)
+        })
+
+    def _understanding_response(self, prompt: str) -> str:
+        return self._json_response({
+            'World_knowledge': 'Apples grow near other apples.',
+            'Remaining_doubts': 'None'
+        })
+
+    def _world_understanding_response(self, prompt: str) -> str:
+        return ('<reasoning>\nOffline reasoning about the observations.\n</reasoning>\n'
+                '<used_knowledge>\nNone\n</used_knowledge>\n'
+                '<new_world_knowledge>\n<1>Apples grow near other apples.</1>\n</new_world_knowledge>\n'
+                '<future_observations>\nThe apples will keep growing near the trees.\n</future_observations>')
+
+    def _world_representation_response(self, prompt: str) -> str:
+        return self._json_response({'Observations': 'Offline world representation.'})
+
+    def _world_rules_response(self, prompt: str) -> str:
+        return '```text\nOffline world rules.\n```'
+
+
+class OfflineEmbedding(BaseLLM):
+    """Local stand-in of an embedding model. The embeddings are deterministic hashed bags of words,
+    so texts sharing words are similar and the long term memory retrieval keeps working offline.
+    """
+
+    def __init__(self, latency: str | None = None, error_rate: float | None = None, seed: int | None = None, embedding_dimensions: int = 1536):
+        """Constructor for the OfflineEmbedding class. The parameters not given are read from the environment variables
+        OFFLINE_LLM_LATENCY, OFFLINE_LLM_ERROR_RATE and OFFLINE_LLM_SEED.
+        Args:
+            latency (str | None, optional): Latency distribution of the responses, see LatencySampler. Defaults to None.
+            error_rate (float | None, optional): Probability of a request failing with an OfflineLLMError. Defaults to None.
+            seed (int | None, optional): Seed of the random generator. Defaults to None.
+            embedding_dimensions (int, optional): Dimensions of the embeddings. Defaults to 1536.
+        """
+        super().__init__(0, 0, 8191, 1)
+        seed = seed if seed is not None else (int(os.getenv("OFFLINE_LLM_SEED")) if os.getenv("OFFLINE_LLM_SEED") else None)
+        self.latency = LatencySampler(latency or os.getenv("OFFLINE_LLM_LATENCY", "constant:0"), seed)
+        self.error_rate = error_rate if error_rate is not None else float(os.getenv("OFFLINE_LLM_ERROR_RATE", 0))
+        self.random = random.Random(seed)
+        self.model_name = 'offline_embedding'
+        self.embedding_dimensions = embedding_dimensions
+        self.logger.info("Offline embedding model loaded")
+
+    def _simulate_request(self) -> float:
+        """Sample the latency of the request and inject an error with the configured probability
+        Returns:
+            float: Latency of the request in seconds
+        """
+        if self.random.random() < self.error_rate:
+            raise OfflineLLMError("Injected error in the offline embedding model")
+        return self.latency.sample()
+
+    def _embed_text(self, text: str) -> list[float]:
+        """Build the embedding of a text hashing its words
+        Args:
+            text (str): Text to embed
+        Returns:
+            list[float]: Normalized embedding of the text
+        """
+        embedding = np.zeros(self.embedding_dimensions)
+        for word in re.findall(r'\w+', text.lower()):
+            index = int.from_bytes(hashlib.md5(word.encode('utf-8')).digest()[:4], 'little') % self.embedding_dimensions
+            embedding[index] += 1
+        norm = np.linalg.norm(embedding)
+        if norm == 0:
+            embedding[0] = 1
+            norm = 1
+        return (embedding / norm).tolist()
+
+    def __embed(self, text: str, **kwargs) -> tuple[list[float], int, int]:
+        """Embedding api for the model
+        Args:
+            text (str): Text to embed
+        Returns:
+            tuple(list[float], int, int): A tuple with the embedded text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        time.sleep(self._simulate_request())
+        return self._embed_text(text), self._calculate_tokens(text), 0
+
+    async def __aembed(self, text: str, **kwargs) -> tuple[list[float], int, int]:
+        """Async embedding api for the model
+        Args:
+            text (str): Text to embed
+        Returns:
+            tuple(list[float], int, int): A tuple with the embedded text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        await asyncio.sleep(self._simulate_request())
+        return self._embed_text(text), self._calculate_tokens(text), 0
+
+    def _completion(self, text: str, **kwargs) -> tuple[list[float], int, int]:
+        """Wrapper for the embedding api with retry and exponential backoff
+
+        Args:
+            text (str): Text to embed
+
+        Returns:
+            tuple(list[float], int, int): A tuple with the embedded text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.retry_with_exponential_backoff(self.__embed, self.logger, errors=(OfflineLLMError,), initial_delay=0.01, rate_limiter=self.rate_limiter)
+        return wrapper(text, **kwargs)
+
+    async def _acompletion(self, text: str, **kwargs) -> tuple[list[float], int, int]:
+        """Wrapper for the async embedding api with async retry and exponential backoff
+
+        Args:
+            text (str): Text to embed
+
+        Returns:
+            tuple(list[float], int, int): A tuple with the embedded text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__aembed, self.logger, errors=(OfflineLLMError,), initial_delay=0.01, rate_limiter=self.rate_limiter)
+        return await wrapper(text, **kwargs)
+
+    def _calculate_tokens(self, text: str) -> int:
+        """Estimate the number of tokens in the text, there is no tokenizer available offline
+        Args:
+            text (str): Text to embed
+        Returns:
+            int: Number of tokens in the text
+        """
+        return len(text) // 4 + 1
+
+    def get_embedding(self, text: str) -> list[float]:
+        """Get the embedding of a text
+        Args:
+            text (str): Text to embed
+        Returns:
+            list[float]: Embedding of the text
+        """
+        # Check that the prompt is not too long
+        tokens = self._calculate_tokens(text)
+        if tokens > self.max_tokens * self.max_tokens_ratio_per_input:
+            raise ValueError("Text is too long to embed")
+
+        cache_key, cached_response = self._get_cached_response(text, {})
+        if cached_response:
+            self.cost_manager.update_cached_costs(cached_response[1], cached_response[2])
+            return cached_response[0]
+
+        embedding, prompt_tokens, response_tokens = self._call_with_rate_limit(self._completion, text)
+        self._store_response(cache_key, embedding, prompt_tokens, response_tokens)
+
+        # Update the cost of the prompt and response
+        self._update_costs(prompt_tokens, response_tokens)
+        return embedding
+
+    def get_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """Get the embeddings of a list of texts
+        Args:
+            texts (list[str]): List of texts to embed
+        Returns:
+            list[list[float]]: List of embeddings of the texts
+        """
+        embeddings = []
+        for text in texts:
+            embeddings.append(self.get_embedding(text))
+        return embeddings
@@ -1,8 +1,9 @@
 import os
+from typing import Callable, Iterator
 
 from llm.base_llm import BaseLLM
 import openai
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import tiktoken
 
 class GPT4oMini(BaseLLM):
@@ -21,6 +22,9 @@ class GPT4oMini(BaseLLM):
         self.client = OpenAI(
             api_key=os.getenv("OPENAI_KEY_GPT35")
         )
+        self.async_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_KEY_GPT35")
+        )
         self.deployment_name = os.getenv("OPENAI_GPT4o_MINI_MODEL_ID")
         # Encoding to estimate the number of tokens
         self.encoding = tiktoken.encoding_for_model("gpt-4o")
@@ -53,7 +57,35 @@ class GPT4oMini(BaseLLM):
             prompt = system_prompt + prompt
             del kwargs["system_prompt"]
 
-        response = self.client.chat.completions.create(model=self.deployment_name, messages=prompt, **kwargs)
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
+        completion = response.choices[0].message.content
+        prompt_tokens = response.usage.prompt_tokens
+        response_tokens = response.usage.completion_tokens
+    
+        return completion, prompt_tokens, response_tokens
+    
+    async def __acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Async completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = await self.async_client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
         completion = response.choices[0].message.content
         prompt_tokens = response.usage.prompt_tokens
         response_tokens = response.usage.completion_tokens
@@ -69,9 +101,64 @@ class GPT4oMini(BaseLLM):
         Returns:
             tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
         """
-        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
         return wrapper(prompt, **kwargs)
     
+    async def _acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the async completion api with async retry and exponential backoff
+        
+        Args:
+            prompt (str): Prompt for the completion
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__acompletion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return await wrapper(prompt, **kwargs)
+    
+    def __stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Streaming completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            Iterator[str]: Chunks of text of the response. The generator returns the tokens in the prompt and in the response reported by the api
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, stream=True, extra_body={"stream_options": {"include_usage": True}}, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        stream = raw_response.parse()
+        usage = None
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                usage = self._get_stream_usage(chunk) or usage
+        finally:
+            # Closing the stream cancels the generation of the rest of the response
+            stream.close()
+        return usage
+
+    def _stream_completion(self, prompt: str, stop_when: Callable[[str], bool], **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the streaming completion api with retry and exponential backoff
+
+        Args:
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool]): Function that receives the text generated so far and returns True when the answer is complete
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.retry_with_exponential_backoff(self._read_stream, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return wrapper(self.__stream, prompt, stop_when, **kwargs)
+    
     def _calculate_tokens(self, prompt: str) -> int:
         """Calculate the number of tokens in the prompt
         Args:
@@ -102,6 +189,9 @@ class GPT4o(BaseLLM):
         self.client = OpenAI(
             api_key=os.getenv("OPENAI_KEY_GPT35")
         )
+        self.async_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_KEY_GPT35")
+        )
         self.deployment_name = os.getenv("OPENAI_GPT4o_MODEL_ID")
         # Encoding to estimate the number of tokens
         self.encoding = tiktoken.encoding_for_model("gpt-4o")
@@ -134,7 +224,35 @@ class GPT4o(BaseLLM):
             prompt = system_prompt + prompt
             del kwargs["system_prompt"]
 
-        response = self.client.chat.completions.create(model=self.deployment_name, messages=prompt, **kwargs)
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
+        completion = response.choices[0].message.content
+        prompt_tokens = response.usage.prompt_tokens
+        response_tokens = response.usage.completion_tokens
+    
+        return completion, prompt_tokens, response_tokens
+    
+    async def __acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Async completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = await self.async_client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
         completion = response.choices[0].message.content
         prompt_tokens = response.usage.prompt_tokens
         response_tokens = response.usage.completion_tokens
@@ -150,9 +268,64 @@ class GPT4o(BaseLLM):
         Returns:
             tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
         """
-        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
         return wrapper(prompt, **kwargs)
     
+    async def _acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the async completion api with async retry and exponential backoff
+        
+        Args:
+            prompt (str): Prompt for the completion
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__acompletion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return await wrapper(prompt, **kwargs)
+    
+    def __stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Streaming completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            Iterator[str]: Chunks of text of the response. The generator returns the tokens in the prompt and in the response reported by the api
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, stream=True, extra_body={"stream_options": {"include_usage": True}}, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        stream = raw_response.parse()
+        usage = None
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                usage = self._get_stream_usage(chunk) or usage
+        finally:
+            # Closing the stream cancels the generation of the rest of the response
+            stream.close()
+        return usage
+
+    def _stream_completion(self, prompt: str, stop_when: Callable[[str], bool], **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the streaming completion api with retry and exponential backoff
+
+        Args:
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool]): Function that receives the text generated so far and returns True when the answer is complete
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.retry_with_exponential_backoff(self._read_stream, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return wrapper(self.__stream, prompt, stop_when, **kwargs)
+    
     def _calculate_tokens(self, prompt: str) -> int:
         """Calculate the number of tokens in the prompt
         Args:
@@ -183,6 +356,9 @@ class GPT35(BaseLLM):
         self.client = OpenAI(
             api_key=os.getenv("OPENAI_KEY_GPT35")
         )
+        self.async_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_KEY_GPT35")
+        )
         self.deployment_name = os.getenv("OPENAI_GPT_35_16k_MODEL_ID")
         # Encoding to estimate the number of tokens
         self.encoding = tiktoken.encoding_for_model("gpt-3.5-turbo-0125")
@@ -215,7 +391,35 @@ class GPT35(BaseLLM):
             prompt = system_prompt + prompt
             del kwargs["system_prompt"]
 
-        response = self.client.chat.completions.create(model=self.deployment_name, messages=prompt, **kwargs)
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
+        completion = response.choices[0].message.content
+        prompt_tokens = response.usage.prompt_tokens
+        response_tokens = response.usage.completion_tokens
+    
+        return completion, prompt_tokens, response_tokens
+    
+    async def __acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Completion api for the GPT-3.5 model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = await self.async_client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
         completion = response.choices[0].message.content
         prompt_tokens = response.usage.prompt_tokens
         response_tokens = response.usage.completion_tokens
@@ -231,9 +435,64 @@ class GPT35(BaseLLM):
         Returns:
             tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
         """
-        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
         return wrapper(prompt, **kwargs)
     
+    async def _acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the async completion api with async retry and exponential backoff
+        
+        Args:
+            prompt (str): Prompt for the completion
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__acompletion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return await wrapper(prompt, **kwargs)
+    
+    def __stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Streaming completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            Iterator[str]: Chunks of text of the response. The generator returns the tokens in the prompt and in the response reported by the api
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, stream=True, extra_body={"stream_options": {"include_usage": True}}, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        stream = raw_response.parse()
+        usage = None
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                usage = self._get_stream_usage(chunk) or usage
+        finally:
+            # Closing the stream cancels the generation of the rest of the response
+            stream.close()
+        return usage
+
+    def _stream_completion(self, prompt: str, stop_when: Callable[[str], bool], **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the streaming completion api with retry and exponential backoff
+
+        Args:
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool]): Function that receives the text generated so far and returns True when the answer is complete
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.retry_with_exponential_backoff(self._read_stream, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return wrapper(self.__stream, prompt, stop_when, **kwargs)
+    
     def _calculate_tokens(self, prompt: str) -> int:
         """Calculate the number of tokens in the prompt
         Args:
@@ -264,6 +523,9 @@ class GPT35_16K(BaseLLM):
         self.client = OpenAI(
             api_key=os.getenv("OPENAI_KEY_GPT35")
         )
+        self.async_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_KEY_GPT35")
+        )
         self.deployment_name = os.getenv("OPENAI_GPT_35_16k_MODEL_ID")
         # Encoding to estimate the number of tokens
         self.encoding = tiktoken.encoding_for_model("gpt-3.5-turbo-0125")
@@ -296,7 +558,35 @@ class GPT35_16K(BaseLLM):
             prompt = system_prompt + prompt
             del kwargs["system_prompt"]
 
-        response = self.client.chat.completions.create(model=self.deployment_name, messages=prompt, **kwargs)
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
+        completion = response.choices[0].message.content
+        prompt_tokens = response.usage.prompt_tokens
+        response_tokens = response.usage.completion_tokens
+    
+        return completion, prompt_tokens, response_tokens
+    
+    async def __acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Completion api for the GPT-3.5 model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = await self.async_client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
         completion = response.choices[0].message.content
         prompt_tokens = response.usage.prompt_tokens
         response_tokens = response.usage.completion_tokens
@@ -312,9 +602,64 @@ class GPT35_16K(BaseLLM):
         Returns:
             tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
         """
-        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
         return wrapper(prompt, **kwargs)
     
+    async def _acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the async completion api with async retry and exponential backoff
+        
+        Args:
+            prompt (str): Prompt for the completion
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__acompletion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return await wrapper(prompt, **kwargs)
+    
+    def __stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Streaming completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            Iterator[str]: Chunks of text of the response. The generator returns the tokens in the prompt and in the response reported by the api
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, stream=True, extra_body={"stream_options": {"include_usage": True}}, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        stream = raw_response.parse()
+        usage = None
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                usage = self._get_stream_usage(chunk) or usage
+        finally:
+            # Closing the stream cancels the generation of the rest of the response
+            stream.close()
+        return usage
+
+    def _stream_completion(self, prompt: str, stop_when: Callable[[str], bool], **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the streaming completion api with retry and exponential backoff
+
+        Args:
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool]): Function that receives the text generated so far and returns True when the answer is complete
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.retry_with_exponential_backoff(self._read_stream, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return wrapper(self.__stream, prompt, stop_when, **kwargs)
+    
     def _calculate_tokens(self, prompt: str) -> int:
         """Calculate the number of tokens in the prompt
         Args:
@@ -344,6 +689,9 @@ class GPT4(BaseLLM):
         self.client = OpenAI(
             api_key=os.getenv("OPENAI_KEY_GPT4")
         )
+        self.async_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_KEY_GPT4")
+        )
         self.deployment_name = os.getenv("OPENAI_GPT_4_MODEL_ID")
         self.logger.info("Deployment name: " + self.deployment_name)
         # Encoding to estimate the number of tokens
@@ -377,7 +725,35 @@ class GPT4(BaseLLM):
             prompt = system_prompt + prompt
             del kwargs["system_prompt"]
 
-        response = self.client.chat.completions.create(model=self.deployment_name, messages=prompt, **kwargs)
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
+        completion = response.choices[0].message.content
+        prompt_tokens = response.usage.prompt_tokens
+        response_tokens = response.usage.completion_tokens
+    
+        return completion, prompt_tokens, response_tokens
+    
+    async def __acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Completion api for the GPT-4 model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = await self.async_client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
         completion = response.choices[0].message.content
         prompt_tokens = response.usage.prompt_tokens
         response_tokens = response.usage.completion_tokens
@@ -393,9 +769,64 @@ class GPT4(BaseLLM):
         Returns:
             tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
         """
-        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+        wrapper = BaseLLM.retry_with_exponential_backoff(self.__completion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
         return wrapper(prompt, **kwargs)
     
+    async def _acompletion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the async completion api with async retry and exponential backoff
+        
+        Args:
+            prompt (str): Prompt for the completion
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__acompletion, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return await wrapper(prompt, **kwargs)
+    
+    def __stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Streaming completion api for the model
+        Args:
+            prompt (str): Prompt for the completion
+        Returns:
+            Iterator[str]: Chunks of text of the response. The generator returns the tokens in the prompt and in the response reported by the api
+        """
+        prompt = self._format_prompt(prompt)
+
+        # Check if there is a system prompt
+        if "system_prompt" in kwargs:
+            system_prompt = self._format_prompt(kwargs["system_prompt"], role="system")
+            prompt = system_prompt + prompt
+            del kwargs["system_prompt"]
+
+        raw_response = self.client.chat.completions.with_raw_response.create(model=self.deployment_name, messages=prompt, stream=True, extra_body={"stream_options": {"include_usage": True}}, **kwargs)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        stream = raw_response.parse()
+        usage = None
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                usage = self._get_stream_usage(chunk) or usage
+        finally:
+            # Closing the stream cancels the generation of the rest of the response
+            stream.close()
+        return usage
+
+    def _stream_completion(self, prompt: str, stop_when: Callable[[str], bool], **kwargs) -> tuple[str, int, int]:
+        """Wrapper for the streaming completion api with retry and exponential backoff
+
+        Args:
+            prompt (str): Prompt for the completion
+            stop_when (Callable[[str], bool]): Function that receives the text generated so far and returns True when the answer is complete
+
+        Returns:
+            tuple(str, int, int): A tuple with the completed text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.retry_with_exponential_backoff(self._read_stream, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return wrapper(self.__stream, prompt, stop_when, **kwargs)
+    
     def _calculate_tokens(self, prompt: str) -> int:
         """Calculate the number of tokens in the prompt
         Args:
@@ -425,6 +856,9 @@ class Embedding(BaseLLM):
         self.client = OpenAI(
             api_key = os.getenv("OPENAI_KEY_GPT35"),  
         )
+        self.async_client = AsyncOpenAI(
+            api_key = os.getenv("OPENAI_KEY_GPT35"),  
+        )
         self.deployment_name = os.getenv("OPENAI_TEXT_EMBEDDING_MODEL_ID")
         # Encoding to estimate the number of tokens
         self.encoding = tiktoken.encoding_for_model("text-embedding-3-small")
@@ -441,7 +875,28 @@ class Embedding(BaseLLM):
             tuple(list[float], int, int): A tuple with the embedded text, the number of tokens in the prompt and the number of tokens in the response
         """
         # response = get_embedding(text, engine=self.deployment_name, **kwargs)
-        response = self.client.embeddings.create(input = [text], model=self.deployment_name)
+        raw_response = self.client.embeddings.with_raw_response.create(input = [text], model=self.deployment_name)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
+
+        embedding = response.data[0].embedding
+        prompt_tokens = response.usage.total_tokens
+        response_tokens = 0
+    
+        return embedding, prompt_tokens, response_tokens
+    
+    async def __aembed(self, text: str, **kwargs) -> tuple[list[float], int, int]:
+        """Async embedding api for the Ada model
+        Args:
+            text (str): Text to embed
+        Returns:
+            tuple(list[float], int, int): A tuple with the embedded text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        raw_response = await self.async_client.embeddings.with_raw_response.create(input = [text], model=self.deployment_name)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
 
         embedding = response.data[0].embedding
         prompt_tokens = response.usage.total_tokens
@@ -458,9 +913,21 @@ class Embedding(BaseLLM):
         Returns:
             tuple(list[float], int, int): A tuple with the embedded text, the number of tokens in the prompt and the number of tokens in the response
         """
-        wrapper = BaseLLM.retry_with_exponential_backoff(self.__embed, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+        wrapper = BaseLLM.retry_with_exponential_backoff(self.__embed, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
         return wrapper(text, **kwargs)
     
+    async def _acompletion(self, text: str, **kwargs) -> tuple[list[float], int, int]:
+        """Wrapper for the async completion api with async retry and exponential backoff
+        
+        Args:
+            text (str): Text to embed
+
+        Returns:
+            tuple(list[float], int, int): A tuple with the embedded text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__aembed, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return await wrapper(text, **kwargs)
+    
     def _calculate_tokens(self, text: str) -> int:
         """Calculate the number of tokens in the text
         Args:
@@ -483,8 +950,14 @@ class Embedding(BaseLLM):
         tokens = self._calculate_tokens(text)
         if tokens > self.max_tokens * self.max_tokens_ratio_per_input:
             raise ValueError("Text is too long to embed")
+
+        cache_key, cached_response = self._get_cached_response(text, {})
+        if cached_response:
+            self.cost_manager.update_cached_costs(cached_response[1], cached_response[2])
+            return cached_response[0]
         
-        embedding, prompt_tokens, response_tokens = self._completion(text)
+        embedding, prompt_tokens, response_tokens = self._call_with_rate_limit(self._completion, text)
+        self._store_response(cache_key, embedding, prompt_tokens, response_tokens)
 
         # Update the cost of the prompt and response
         self._update_costs(prompt_tokens, response_tokens)
@@ -518,6 +991,9 @@ class Ada(BaseLLM):
         self.client = OpenAI(
             api_key = os.getenv("OPENAI_KEY_GPT35"),  
         )
+        self.async_client = AsyncOpenAI(
+            api_key = os.getenv("OPENAI_KEY_GPT35"),  
+        )
         self.deployment_name = os.getenv("OPENAI_TEXT_EMBEDDING_MODEL_ID")
         # Encoding to estimate the number of tokens
         self.encoding = tiktoken.encoding_for_model("text-embedding-ada-002")
@@ -534,7 +1010,28 @@ class Ada(BaseLLM):
             tuple(list[float], int, int): A tuple with the embedded text, the number of tokens in the prompt and the number of tokens in the response
         """
         # response = get_embedding(text, engine=self.deployment_name, **kwargs)
-        response = self.client.embeddings.create(input = [text], model=self.deployment_name)
+        raw_response = self.client.embeddings.with_raw_response.create(input = [text], model=self.deployment_name)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
+
+        embedding = response.data[0].embedding
+        prompt_tokens = response.usage.total_tokens
+        response_tokens = 0
+    
+        return embedding, prompt_tokens, response_tokens
+    
+    async def __aembed(self, text: str, **kwargs) -> tuple[list[float], int, int]:
+        """Async embedding api for the Ada model
+        Args:
+            text (str): Text to embed
+        Returns:
+            tuple(list[float], int, int): A tuple with the embedded text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        raw_response = await self.async_client.embeddings.with_raw_response.create(input = [text], model=self.deployment_name)
+        # Adapt the rate limiter to the remaining budget reported by the api
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
 
         embedding = response.data[0].embedding
         prompt_tokens = response.usage.total_tokens
@@ -551,9 +1048,21 @@ class Ada(BaseLLM):
         Returns:
             tuple(list[float], int, int): A tuple with the embedded text, the number of tokens in the prompt and the number of tokens in the response
         """
-        wrapper = BaseLLM.retry_with_exponential_backoff(self.__embed, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+        wrapper = BaseLLM.retry_with_exponential_backoff(self.__embed, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
         return wrapper(text, **kwargs)
     
+    async def _acompletion(self, text: str, **kwargs) -> tuple[list[float], int, int]:
+        """Wrapper for the async completion api with async retry and exponential backoff
+        
+        Args:
+            text (str): Text to embed
+
+        Returns:
+            tuple(list[float], int, int): A tuple with the embedded text, the number of tokens in the prompt and the number of tokens in the response
+        """
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__aembed, self.logger, errors=(openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError), rate_limiter=self.rate_limiter)
+        return await wrapper(text, **kwargs)
+    
     def _calculate_tokens(self, text: str) -> int:
         """Calculate the number of tokens in the text
         Args:
@@ -576,8 +1085,14 @@ class Ada(BaseLLM):
         tokens = self._calculate_tokens(text)
         if tokens > self.max_tokens * self.max_tokens_ratio_per_input:
             raise ValueError("Text is too long to embed")
+
+        cache_key, cached_response = self._get_cached_response(text, {})
+        if cached_response:
+            self.cost_manager.update_cached_costs(cached_response[1], cached_response[2])
+            return cached_response[0]
         
-        embedding, prompt_tokens, response_tokens = self._completion(text)
+        embedding, prompt_tokens, response_tokens = self._call_with_rate_limit(self._completion, text)
+        self._store_response(cache_key, embedding, prompt_tokens, response_tokens)
 
         # Update the cost of the prompt and response
         self._update_costs(prompt_tokens, response_tokens)
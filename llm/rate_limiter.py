@@ -0,0 +1,269 @@
+import asyncio
+from contextlib import contextmanager
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Mapping
+
+from utils.logging import CustomAdapter
+
+try:
+    import fcntl
+except ImportError: # fcntl is not available on Windows, the limits are only shared inside the process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+logger = CustomAdapter(logger)
+
+
+def parse_duration(duration: str) -> float:
+    """Parse a duration of the rate limit headers. For example: "1s", "6m0s", "20ms" or "0.5"
+    Args:
+        duration (str): Duration
+    Returns:
+        float: Duration in seconds
+    """
+    units = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|s|m|h)', duration)
+    if not parts:
+        return float(duration)
+    return sum(float(value) * units[unit] for value, unit in parts)
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Check if an error of the api is caused by a rate limit
+    Args:
+        error (Exception): Error raised by the api
+    Returns:
+        bool: True if the error is a rate limit error
+    """
+    status_code = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    if status_code == 429:
+        return True
+    return 'ratelimit' in type(error).__name__.lower() or '429' in str(error) or 'rate limit' in str(error).lower()
+
+
+class RateLimiter:
+    """Token bucket limiter of the requests and tokens per minute of a model, with an adaptive concurrency window.
+    The window is halved when the api answers with a rate limit error and grows slowly after every successful request.
+    After a rate limit error every request of the model waits for a shared cool down instead of retrying on its own.
+    The retries of a request reserve their budget again, so they count in the buckets and the concurrency window.
+    If a lock path is given the buckets are stored in that file and shared by all the processes using it.
+    """
+
+    def __init__(self, name: str, requests_per_minute: int | None = None, tokens_per_minute: int | None = None, max_concurrency: int = 16, lock_path: str | None = None):
+        """Constructor for the RateLimiter class
+        Args:
+            name (str): Name of the model
+            requests_per_minute (int | None, optional): Maximum number of requests per minute. None means no limit. Defaults to None.
+            tokens_per_minute (int | None, optional): Maximum number of tokens per minute. None means no limit. Defaults to None.
+            max_concurrency (int, optional): Maximum number of requests in flight at the same time. Defaults to 16.
+            lock_path (str | None, optional): Path of the file used to share the buckets between processes. Defaults to None.
+        """
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+        self.lock_path = lock_path if fcntl else None
+        self._lock = threading.Lock()
+        # Tokens reserved by the request of the current thread or task, so its retries can reserve them again
+        self._reservation = contextvars.ContextVar(f'rate_limiter_reservation_{name}', default=None)
+        self._state = {
+            'requests': float(requests_per_minute or 0),
+            'tokens': float(tokens_per_minute or 0),
+            'updated_at': time.time(),
+            'cooldown_until': 0.0,
+        }
+
+    @contextmanager
+    def _locked_state(self):
+        """Give access to the state of the buckets. If a lock path is defined, the state is read from and written to
+        that file while holding an exclusive lock, so the budget is shared between processes
+        """
+        if not self.lock_path:
+            yield self._state
+            return
+        with open(self.lock_path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                state = json.loads(content) if content else dict(self._state)
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refill(self, state: dict, now: float) -> None:
+        """Refill the buckets with the budget earned since the last update
+        Args:
+            state (dict): State of the buckets
+            now (float): Current time
+        """
+        elapsed = max(now - state['updated_at'], 0)
+        if self.requests_per_minute:
+            state['requests'] = min(self.requests_per_minute, state['requests'] + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            state['tokens'] = min(self.tokens_per_minute, state['tokens'] + elapsed * self.tokens_per_minute / 60)
+        state['updated_at'] = now
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Try to reserve a concurrency slot, a request and the tokens of a request
+        Args:
+            tokens (int): Estimated tokens of the request
+        Returns:
+            float: 0 if the budget was reserved, otherwise the seconds to wait before trying again
+        """
+        with self._lock:
+            if self.in_flight >= int(self.concurrency):
+                return 0.05
+            now = time.time()
+            with self._locked_state() as state:
+                self._refill(state, now)
+                wait = state['cooldown_until'] - now
+                if wait > 0:
+                    return wait
+                if self.requests_per_minute and state['requests'] < 1:
+                    wait = (1 - state['requests']) * 60 / self.requests_per_minute
+                if self.tokens_per_minute:
+                    # A request bigger than the bucket only waits for the bucket to be full
+                    tokens = min(tokens, self.tokens_per_minute)
+                    if state['tokens'] < tokens:
+                        wait = max(wait, (tokens - state['tokens']) * 60 / self.tokens_per_minute)
+                if wait > 0:
+                    return wait
+                if self.requests_per_minute:
+                    state['requests'] -= 1
+                if self.tokens_per_minute:
+                    state['tokens'] -= tokens
+            self.in_flight += 1
+            return 0
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Wait until there is budget for a request and reserve it
+        Args:
+            tokens (int, optional): Estimated tokens of the request. Defaults to 0.
+        """
+        while (wait := self._try_acquire(tokens)) > 0:
+            time.sleep(min(wait, 1))
+        self._reservation.set(tokens)
+
+    async def aacquire(self, tokens: int = 0) -> None:
+        """Wait until there is budget for a request and reserve it without blocking the event loop
+        Args:
+            tokens (int, optional): Estimated tokens of the request. Defaults to 0.
+        """
+        while (wait := self._try_acquire(tokens)) > 0:
+            await asyncio.sleep(min(wait, 1))
+        self._reservation.set(tokens)
+
+    def release(self, reserved_tokens: int = 0, used_tokens: int | None = None) -> None:
+        """Release the concurrency slot of a request and correct the tokens reserved with the tokens actually used
+        Args:
+            reserved_tokens (int, optional): Tokens reserved for the request. Defaults to 0.
+            used_tokens (int | None, optional): Tokens used by the request. None if the request failed. Defaults to None.
+        """
+        self._reservation.set(None)
+        with self._lock:
+            self.in_flight = max(self.in_flight - 1, 0)
+            if used_tokens is None:
+                return
+            # Additive increase of the concurrency window after a successful request
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            if self.tokens_per_minute:
+                with self._locked_state() as state:
+                    state['tokens'] = min(self.tokens_per_minute, state['tokens'] + min(reserved_tokens, self.tokens_per_minute) - used_tokens)
+
+    def release_for_retry(self) -> int | None:
+        """Release the concurrency slot of a failed attempt of the request of the current thread or task. The retry must
+        reserve the returned tokens again with acquire or aacquire once it has waited
+        Returns:
+            int | None: Tokens reserved by the request. None if the current thread or task has no reservation
+        """
+        tokens = self._reservation.get()
+        if tokens is not None:
+            self.release(tokens)
+        return tokens
+
+    def on_rate_limit(self, error: Exception | None = None) -> float:
+        """Register a rate limit error. The concurrency window is halved and all the requests wait for a cool down
+        Args:
+            error (Exception | None, optional): Rate limit error raised by the api. Its headers are used if available. Defaults to None.
+        Returns:
+            float: Seconds to wait before retrying
+        """
+        headers = getattr(getattr(error, 'response', None), 'headers', None)
+        retry_after = None
+        if headers:
+            self.update_from_headers(headers)
+            if headers.get('retry-after'):
+                retry_after = parse_duration(headers['retry-after'])
+        if retry_after is None:
+            retry_after = 60 / self.requests_per_minute if self.requests_per_minute else 1
+
+        with self._lock:
+            self.concurrency = max(1.0, self.concurrency / 2)
+            with self._locked_state() as state:
+                state['cooldown_until'] = max(state['cooldown_until'], time.time() + retry_after)
+                wait = state['cooldown_until'] - time.time()
+        logger.warning("Rate limit of %s reached, concurrency reduced to %d. Waiting %.2f seconds", self.name, int(self.concurrency), wait)
+        return wait
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """Update the buckets with the remaining budget reported by the rate limit headers of the api
+        Args:
+            headers (Mapping[str, str]): Headers of the response
+        """
+        try:
+            remaining_requests = headers.get('x-ratelimit-remaining-requests')
+            remaining_tokens = headers.get('x-ratelimit-remaining-tokens')
+            with self._lock, self._locked_state() as state:
+                now = time.time()
+                self._refill(state, now)
+                if remaining_requests is not None and self.requests_per_minute:
+                    state['requests'] = min(state['requests'], float(remaining_requests))
+                if remaining_tokens is not None and self.tokens_per_minute:
+                    state['tokens'] = min(state['tokens'], float(remaining_tokens))
+                # Wait for the reset of the limit when there is no budget left
+                for remaining, reset in ((remaining_requests, 'x-ratelimit-reset-requests'), (remaining_tokens, 'x-ratelimit-reset-tokens')):
+                    if remaining is not None and float(remaining) <= 0 and headers.get(reset):
+                        state['cooldown_until'] = max(state['cooldown_until'], now + parse_duration(headers[reset]))
+        except (ValueError, TypeError):
+            logger.debug("Could not parse the rate limit headers of %s: %s", self.name, headers)
+
+
+_rate_limiters: dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(name: str, requests_per_minute: int | None = None, tokens_per_minute: int | None = None, max_concurrency: int = 16) -> RateLimiter:
+    """Get the rate limiter of a model, shared by every instance of the model in the process.
+    The limits can be overridden with the LLM_RATE_LIMITS environment variable, a json object with the limits by model name.
+    For example: {"Llama31_70B:meta-llama-3.1-70b-instruct": {"requests_per_minute": 100, "tokens_per_minute": 100000}}
+    If the LLM_RATE_LIMIT_LOCK_DIR environment variable is defined, the budget is shared with other processes through a lock file in that folder.
+    Args:
+        name (str): Name of the model
+        requests_per_minute (int | None, optional): Default maximum number of requests per minute. Defaults to None.
+        tokens_per_minute (int | None, optional): Default maximum number of tokens per minute. Defaults to None.
+        max_concurrency (int, optional): Default maximum number of requests in flight. Defaults to 16.
+    Returns:
+        RateLimiter: Rate limiter of the model
+    """
+    with _rate_limiters_lock:
+        if name not in _rate_limiters:
+            limits = {'requests_per_minute': requests_per_minute, 'tokens_per_minute': tokens_per_minute, 'max_concurrency': max_concurrency}
+            limits.update(json.loads(os.getenv("LLM_RATE_LIMITS", "{}")).get(name, {}))
+            lock_path = None
+            lock_dir = os.getenv("LLM_RATE_LIMIT_LOCK_DIR")
+            if lock_dir:
+                os.makedirs(lock_dir, exist_ok=True)
+                lock_path = os.path.join(lock_dir, re.sub(r'[^\w.-]', '_', name) + '.lock')
+            _rate_limiters[name] = RateLimiter(name, lock_path=lock_path, **limits)
+        return _rate_limiters[name]
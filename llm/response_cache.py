@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any
+
+from utils.logging import CustomAdapter
+
+logger = logging.getLogger(__name__)
+logger = CustomAdapter(logger)
+
+# Valid modes of the cache
+#   off: The cache is not used
+#   read_write: Responses are read from the cache when available, otherwise the llm is called and the response is stored
+#   replay: Responses are only read from the cache, a missing response raises a CacheMissError. No request is sent to the llm
+#   record: The llm is always called and its response overwrites the one in the cache
+CACHE_MODES = ('off', 'read_write', 'replay', 'record')
+DEFAULT_CACHE_PATH = os.path.join('data', 'llm_cache.sqlite')
+
+
+class CacheMissError(Exception):
+    """Raised in replay mode when a response is not found in the cache"""
+    pass
+
+
+class ResponseCache:
+    """Persistent cache of the llm responses stored in a SQLite database.
+    The database is opened in WAL mode so several simulations running in parallel can share it.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_CACHE_PATH, mode: str = 'read_write'):
+        """Constructor for the ResponseCache class
+        Args:
+            db_path (str, optional): Path to the SQLite database. Defaults to data/llm_cache.sqlite.
+            mode (str, optional): Mode of the cache. One of off, read_write, replay or record. Defaults to read_write.
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Invalid cache mode {mode}, valid modes are: {', '.join(CACHE_MODES)}")
+        self.db_path = db_path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._connection = None
+        if self.mode != 'off':
+            self._connection = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database and create the responses table if it does not exist
+        Returns:
+            sqlite3.Connection: Connection to the database
+        """
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        connection = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, prompt_tokens INTEGER, response_tokens INTEGER, created_at REAL)"
+        )
+        connection.commit()
+        logger.info("LLM response cache opened at %s in %s mode", self.db_path, self.mode)
+        return connection
+
+    @property
+    def can_read(self) -> bool:
+        """Whether the responses can be read from the cache"""
+        return self.mode in ('read_write', 'replay')
+
+    @property
+    def can_write(self) -> bool:
+        """Whether the responses can be stored in the cache"""
+        return self.mode in ('read_write', 'record')
+
+    @staticmethod
+    def make_key(model: str, prompt: str, kwargs: dict) -> str:
+        """Build the key of a request. The system prompt is one of the kwargs of the completion
+        Args:
+            model (str): Name of the model
+            prompt (str): Fully rendered prompt
+            kwargs (dict): Generation arguments of the completion
+        Returns:
+            str: Key of the request
+        """
+        content = json.dumps({'model': model, 'prompt': prompt, 'kwargs': kwargs}, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> tuple[Any, int, int] | None:
+        """Get a response from the cache
+        Args:
+            key (str): Key of the request
+        Returns:
+            tuple(Any, int, int) | None: The response, the number of tokens in the prompt and in the response. None if the key is not in the cache
+        """
+        if not self.can_read:
+            return None
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response, prompt_tokens, response_tokens FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            if self.mode == 'replay':
+                raise CacheMissError(f"Response with key {key} not found in the cache {self.db_path}")
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def set(self, key: str, model: str, response: Any, prompt_tokens: int, response_tokens: int) -> None:
+        """Store a response in the cache
+        Args:
+            key (str): Key of the request
+            model (str): Name of the model
+            response (Any): Response of the model. It must be serializable to json
+            prompt_tokens (int): Number of tokens in the prompt
+            response_tokens (int): Number of tokens in the response
+        """
+        if not self.can_write:
+            return
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, json.dumps(response), prompt_tokens, response_tokens, time.time())
+            )
+            self._connection.commit()
+
+    def close(self) -> None:
+        """Close the connection to the database"""
+        if self._connection is not None:
+            with self._lock:
+                self._connection.close()
+                self._connection = None
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def configure_response_cache(mode: str | None = None, db_path: str | None = None) -> ResponseCache:
+    """Create the cache shared by all the models. It must be called before the models are created.
+    If the mode or the path are not given they are read from the LLM_CACHE_MODE and LLM_CACHE_PATH environment variables
+    Args:
+        mode (str | None, optional): Mode of the cache. Defaults to None.
+        db_path (str | None, optional): Path to the SQLite database. Defaults to None.
+    Returns:
+        ResponseCache: Shared response cache
+    """
+    global _response_cache
+    mode = mode or os.getenv("LLM_CACHE_MODE", "off")
+    db_path = db_path or os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH)
+    with _response_cache_lock:
+        if _response_cache is not None:
+            _response_cache.close()
+        _response_cache = ResponseCache(db_path, mode)
+    return _response_cache
+
+def get_response_cache() -> ResponseCache:
+    """Get the cache shared by all the models, creating it from the environment variables if it was not configured
+    Returns:
+        ResponseCache: Shared response cache
+    """
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH), os.getenv("LLM_CACHE_MODE", "off"))
+    return _response_cache
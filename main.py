@@ -1,3 +1,4 @@
+import copy
 from datetime import datetime
 from importlib import import_module
 import logging
@@ -5,14 +6,18 @@ import os
 from dotenv import load_dotenv
 import time
 import traceback
+from typing import Callable
 from utils.logging import setup_logging, CustomAdapter
 from game_environment.utils import generate_agent_actions_map, check_agent_out_of_game, get_defined_valid_actions
 from agent.agent import Agent
 from agent.baseline_agent.cot_agent import CoTAgent
 from game_environment.server import start_server, get_scenario_map,  default_agent_actions_map, condition_to_end_game
-from llm import LLMModels
+from llm import LLMModels, set_llm_backend, set_model_routes
+from llm.response_cache import configure_response_cache
 from utils.queue_utils import new_empty_queue
 from utils.args_handler import get_args
+from utils.round_executor import RoundExecutor
+from utils.background_worker import BackgroundWorker
 from utils.files import extract_players, get_players_contexts, persist_short_term_memories, create_directory_if_not_exists
 
 # Set up logging timestamp
@@ -23,18 +28,28 @@ load_dotenv(override=True)
 logger = logging.getLogger(__name__)
 rounds_count = 0
 
-def game_loop(agents: list[Agent], substrate_name:str, persist_memories:bool) -> None:
+def game_loop(agents: list[Agent], substrate_name:str, persist_memories:bool, max_concurrent_agents:int = None, pipelined:bool = False) -> None:
     """Main game loop. The game loop is executed until the game ends or the maximum number of steps is reached.
+    On every round the agents decide their actions concurrently over the same observations of the environment,
+    then all the actions are executed in the same step.
+    In pipelined mode the recording of a step, the memories and the history file are written by a background worker
+    while the agents already observe and think about the next step, so the environment step is the only point where
+    the rounds wait for each other.
 
     Args:
         agents (list[Agent]): List of agents.
         substrate_name (str): Name of the substrate.
         persist_memories (bool): Whether to persist the agents memories to the logs folder.
+        max_concurrent_agents (int, optional): Maximum number of agents deciding their actions at the same time. If None, all the agents think concurrently. Defaults to None.
+        pipelined (bool, optional): Whether to write the records of each step in the background. Defaults to False.
     Returns:
         None
     """
     global rounds_count
     actions = None
+    round_executor = RoundExecutor(max_workers=max_concurrent_agents)
+    background_worker = BackgroundWorker(name='recorder') if pipelined else None
+    env.set_background_worker(background_worker)
 
     # Define bots number of steps per action
     rounds_count, steps_count, max_rounds = 0, 0, 1000
@@ -47,28 +62,32 @@ def game_loop(agents: list[Agent], substrate_name:str, persist_memories:bool) ->
     while rounds_count < max_rounds and not condition_to_end_game(substrate_name, env.get_current_global_map()):
         # Reset the actions for each agent
         actions = {player_name: default_agent_actions_map() for player_name in env.player_prefixes}
-        # Execute an action for every agent in one step
+        # Take a snapshot of the environment for every agent before any agent moves
+        current_global_map = env.get_current_global_map()
+        game_time = env.get_time()
+        agents_moves = []
         for agent in agents:
             # Updates the observations for the current agent
             all_observations =  env.get_observations_by_player(agent.name)
             observations = all_observations['curr_state']
             scene_description = all_observations['scene_description']
             state_changes = all_observations['state_changes']
-            # Get the current observations and environment information
-            game_time = env.get_time()
             logger.info("\n\n" + f"Agent's {agent.name} turn".center(50, '#') + "\n")
             logger.info('%s Observations: %s, Scene descriptions: %s', agent.name, observations, scene_description)
             # Get the steps for the agent to execute a high level action
             agent_reward = env.score[agent.name]
+            move_kwargs = {}
             if check_agent_out_of_game(observations):
                 logger.info('Agent %s was taken out of the game', agent.name)
-                step_action = agent.move(observations, scene_description, state_changes, env.get_current_global_map(), game_time, agent_reward, agent_is_out=True)
-            else:
-                step_action = agent.move(observations, scene_description, state_changes, env.get_current_global_map(), game_time, agent_reward)
-
+                move_kwargs['agent_is_out'] = True
+            move_args = (observations, scene_description, state_changes, current_global_map, game_time, agent_reward)
+            agents_moves.append((agent.name, agent.move, move_args, move_kwargs))
 
+        # Execute an action for every agent in one step
+        steps_actions = round_executor.run(agents_moves)
+        for agent in agents:
             # Update the actions map for the agent
-            actions[agent.name] = generate_agent_actions_map(step_action, default_agent_actions_map())
+            actions[agent.name] = generate_agent_actions_map(steps_actions[agent.name], default_agent_actions_map())
             logger.info('Agent %s action map: %s', agent.name, actions[agent.name] )
 
         # Execute a move for the bots
@@ -93,12 +112,38 @@ def game_loop(agents: list[Agent], substrate_name:str, persist_memories:bool) ->
         # Persist the short term memories of the agents
         if persist_memories:
             memories = {agent.name: agent.stm.get_memories().copy() for agent in agents}
-            persist_short_term_memories(memories, rounds_count, steps_count, logger_timestamp)
+            if pipelined:
+                # The agents keep updating their memories while the worker writes them
+                memories = copy.deepcopy(memories)
+            run_in_background(background_worker, persist_short_term_memories, memories, rounds_count, steps_count, logger_timestamp)
 
         rounds_count += 1
         logger.info('Round %s completed. Every agent executed an action.', rounds_count)
-        env.update_history_file(logger_timestamp, rounds_count, steps_count)
-        time.sleep(0.01)
+        run_in_background(background_worker, env.update_history_file, logger_timestamp, rounds_count, steps_count)
+        if not pipelined:
+            time.sleep(0.01)
+
+    round_executor.shutdown()
+    if background_worker is not None:
+        # The records must be complete before the game ends and the logs are saved
+        env.set_background_worker(None)
+        background_worker.shutdown()
+        background_worker.wait()
+
+def run_in_background(background_worker: BackgroundWorker | None, func: Callable, *args) -> None:
+    """Runs a function in the background worker, or right away if there is no worker.
+
+    Args:
+        background_worker (BackgroundWorker | None): Worker of the pipelined mode.
+        func (Callable): Function to run.
+        *args: Arguments of the function.
+    Returns:
+        None
+    """
+    if background_worker is not None:
+        background_worker.submit(func, *args)
+    else:
+        func(*args)
 
 if __name__ == "__main__":
     args = get_args()
@@ -106,6 +151,11 @@ if __name__ == "__main__":
     logger.info("Program started")
     start_time = time.time()
 
+    # The backend and the responses cache must be configured before the models are created
+    set_llm_backend(args.llm_backend)
+    configure_response_cache(args.llm_cache_mode, args.llm_cache_path)
+    set_model_routes(args.llm_routes, args.substrate)
+
     # Define the simulation mode
     mode = None # cooperative or None, if cooperative the agents will use the cooperative modules
 
@@ -151,12 +201,8 @@ if __name__ == "__main__":
     logger = CustomAdapter(logger, game_env=env)
     # We are setting args.prompts_source as a global variable to be used in the LLMModels class
     llm = LLMModels()
-    gpt_model = llm.get_main_model()
-    gpt_longer_context = llm.get_longer_context_fallback()
-    embedding_model = llm.get_embedding_model()
-    gpt_best_model = llm.get_best_model()
     try:
-        game_loop(agents, args.substrate, args.persist_memories)
+        game_loop(agents, args.substrate, args.persist_memories, args.max_concurrent_agents, args.pipelined)
     except KeyboardInterrupt:
         logger.info("Program interrupted. %s rounds executed.", rounds_count)
     except Exception as e:
@@ -173,6 +219,11 @@ if __name__ == "__main__":
     costs = llm.get_costs()
     tokens = llm.get_tokens()
     logger.info("LLM total cost: {:,.2f}, Cost by model: {}, Total tokens: {:,}, Tokens by model: {}".format(costs['total'], costs,  tokens['total'], tokens))
+    cache_stats = llm.get_cache_stats()
+    logger.info("LLM cache hits: {:,}, Cost saved: {:,.2f}, Cache stats by model: {}".format(cache_stats['total']['cache_hits'], cache_stats['total']['saved_cost'], cache_stats))
+    coalesced_stats = llm.get_coalesced_stats()
+    logger.info("LLM coalesced requests: {:,}, Cost saved: {:,.2f}".format(coalesced_stats['total']['coalesced_requests'], coalesced_stats['total']['saved_cost']))
+    logger.info("LLM requests by cognitive module: {}".format(llm.get_router().get_stats()))
 
     end_time = time.time()
     logger.info("Execution time: %.2f minutes", (end_time - start_time)/60)
@@ -163,10 +163,6 @@ if __name__ == "__main__":
     logger = CustomAdapter(logger, game_env=env)
     # We are setting args.prompts_source as a global variable to be used in the LLMModels class
     llm = LLMModels()
-    gpt_model = llm.get_main_model()
-    gpt_longer_context = llm.get_longer_context_fallback()
-    embedding_model = llm.get_embedding_model()
-    gpt_best_model = llm.get_best_model()
     try:
         game_loop(agents, args.substrate, args.persist_memories, gui)
     except KeyboardInterrupt:
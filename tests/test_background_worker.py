@@ -0,0 +1,47 @@
+import threading
+import time
+
+import pytest
+
+from utils.background_worker import BackgroundWorker
+
+
+def slow_write(records, delay, record):
+    time.sleep(delay)
+    records.append(record)
+
+def test_tasks_run_in_submission_order():
+    worker = BackgroundWorker()
+    records = []
+    # The first record is the slowest one
+    for step, delay in enumerate([0.05, 0.0, 0.01]):
+        worker.submit(slow_write, records, delay, step)
+    worker.wait()
+    worker.shutdown()
+
+    assert records == [0, 1, 2]
+
+def test_submit_does_not_block_the_caller():
+    worker = BackgroundWorker()
+    release = threading.Event()
+    start = time.time()
+    worker.submit(release.wait)
+    assert time.time() - start < 0.05
+    release.set()
+    worker.shutdown()
+
+def test_wait_raises_the_first_error():
+    worker = BackgroundWorker()
+    records = []
+    def fail(message):
+        raise ValueError(message)
+
+    worker.submit(fail, 'first')
+    worker.submit(slow_write, records, 0, 'after error')
+    worker.submit(fail, 'second')
+    with pytest.raises(ValueError, match='first'):
+        worker.wait()
+    worker.shutdown()
+
+    # The error does not stop the next tasks
+    assert records == ['after error']
@@ -1,5 +1,6 @@
 from game_environment.recorder.recorder import Recorder
 from game_environment.substrates.utilities.commons_harvest_open.recorder import get_nearest_apple, is_apple_the_last_of_tree, record_game_state_before_actions, record_elements_status
+from utils.route_plan import DistanceFieldCache
 
 def test_get_nearest_apple():
     # Test 1: Find the only apple in the map
@@ -50,6 +51,21 @@ def test_get_nearest_apple():
     nearest_apple, distance = get_nearest_apple(game_map, position)
     assert nearest_apple == [4, 4], "The nearest apple should be at position [4, 4]"
 
+def test_get_nearest_apple_with_distance_fields():
+    # The nearest apple by manhattan distance is behind a wall
+    game_map = [
+        ['A', 'W', '0', 'F', 'F'],
+        ['F', 'W', 'F', 'F', 'F'],
+        ['F', 'W', 'F', 'F', 'A'],
+        ['F', 'F', 'F', 'F', 'F']
+    ]
+    position = (0, 2)
+    nearest_apple, distance = get_nearest_apple(game_map, position)
+    assert nearest_apple == [0, 0] and distance == 2
+    distance_fields = DistanceFieldCache(game_map, ['W', '$'])
+    nearest_apple, distance = get_nearest_apple(game_map, position, distance_fields, position, 0)
+    assert nearest_apple == [2, 4] and distance == 4, "The nearest apple walking around the wall should be at position [2, 4]"
+
 def test_is_apple_the_last_of_tree():
     # Test 1: The apple is the last of the tree
     game_map = [
@@ -207,4 +223,42 @@ def test_record_elements_status(mocker):
     ]
     record_elements_status(record_obj, None, current_map)
     # The record object should have the last_apple_object attribute with the right values for each agent
-    assert record_obj.last_apple_object == {'Ma': {'scenario_seen': 1, 'took_last_apple': 0, 'last_apple_pos': None, 'distance': 0, 'move_towards_last_apple': 0}, 'Mi': {'scenario_seen': 0, 'took_last_apple': 0, 'last_apple_pos': None, 'distance': 0, 'move_towards_last_apple': 0}, 'Mo': {'scenario_seen': 0, 'took_last_apple': 0, 'last_apple_pos': None, 'distance': 0, 'move_towards_last_apple': 0}}, "The last_apple_object attribute should have the right values for each agent"
\ No newline at end of file
+    assert record_obj.last_apple_object == {'Ma': {'scenario_seen': 1, 'took_last_apple': 0, 'last_apple_pos': None, 'distance': 0, 'move_towards_last_apple': 0}, 'Mi': {'scenario_seen': 0, 'took_last_apple': 0, 'last_apple_pos': None, 'distance': 0, 'move_towards_last_apple': 0}, 'Mo': {'scenario_seen': 0, 'took_last_apple': 0, 'last_apple_pos': None, 'distance': 0, 'move_towards_last_apple': 0}}, "The last_apple_object attribute should have the right values for each agent"
+
+def test_record_elements_status_with_distance_fields(mocker):
+    class RecorderMock:
+        def __init__(self, names, last_apple_object):
+            self.player_names = names
+            self.agents_ids = {name: str(agent_id) for agent_id, name in enumerate(names)}
+            self.last_apple_object = last_apple_object
+            self.log_path = ''
+            self.step = 1
+
+    mocker.patch('builtins.open') # Mock the open function to do not create a file
+    initial_map = [
+        ['A', 'W', 'F'],
+        ['F', 'W', 'F'],
+        ['F', 'F', 'F']
+    ]
+    # The last apple is 6 steps away walking around the wall, the manhattan distance is 2
+    record_obj = RecorderMock(['Ma'], {'Ma': {'scenario_seen': 1, 'took_last_apple': 0, 'last_apple_pos': [0, 0], 'distance': 6, 'move_towards_last_apple': 0}})
+    record_obj.distance_fields = DistanceFieldCache(initial_map, ['W', '$'])
+
+    # Test 1: The agent does not move, so it did not move towards the last apple
+    current_map = [
+        ['A', 'W', '0'],
+        ['F', 'W', 'F'],
+        ['F', 'F', 'F']
+    ]
+    record_elements_status(record_obj, initial_map, current_map)
+    assert record_obj.last_apple_object['Ma']['move_towards_last_apple'] == 0, "The agent should not move towards the last apple"
+
+    # Test 2: The agent moves around the wall, the manhattan distance grows but the walking distance is shorter
+    record_obj.last_apple_object['Ma'].update({'last_apple_pos': [0, 0], 'distance': 6})
+    current_map = [
+        ['A', 'W', 'F'],
+        ['F', 'W', '0'],
+        ['F', 'F', 'F']
+    ]
+    record_elements_status(record_obj, initial_map, current_map)
+    assert record_obj.last_apple_object['Ma']['move_towards_last_apple'] == 1, "The agent should move towards the last apple"
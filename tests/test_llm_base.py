@@ -0,0 +1,230 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm.base_llm import BaseLLM
+from llm.response_cache import CacheMissError, configure_response_cache
+from utils.llm import json_answer_complete
+
+
+class EchoLLM(BaseLLM):
+    """Model that answers with the same prompt it receives"""
+
+    def __init__(self):
+        super().__init__(1, 2, 100, 1)
+
+    def _calculate_tokens(self, prompt: str) -> int:
+        return len(prompt.split())
+
+    def _completion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        self.calls = getattr(self, 'calls', 0) + 1
+        return prompt, self._calculate_tokens(prompt), 1
+
+
+class SlowEchoLLM(EchoLLM):
+    """Echo model that takes some time to answer, so concurrent requests overlap"""
+
+    def _completion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        time.sleep(0.1)
+        return super()._completion(prompt, **kwargs)
+
+
+class StreamingLLM(EchoLLM):
+    """Model that streams a json answer followed by trailing text"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks_sent = 0
+
+    def __stream(self, prompt: str, **kwargs):
+        for chunk in ['Thinking ', '```json\n', '{"Answer": ', '"yes"}', '\n```', ' trailing', ' text', ' never', ' used']:
+            self.chunks_sent += 1
+            yield chunk
+
+    def _completion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        self.calls = getattr(self, 'calls', 0) + 1
+        response = ''.join(self.__stream(prompt))
+        return response, self._calculate_tokens(prompt), self._calculate_tokens(response)
+
+    def _stream_completion(self, prompt: str, stop_when, **kwargs) -> tuple[str, int, int]:
+        return self._read_stream(self.__stream, prompt, stop_when, **kwargs)
+
+
+class UsageStreamingLLM(EchoLLM):
+    """Model that streams a json answer and reports the usage at the end of the stream"""
+
+    def __stream(self, prompt: str, **kwargs):
+        yield from ['```json\n', '{"Answer": ', '"yes"}', '\n```', ' trailing text']
+        return 7, 3
+
+    def _stream_completion(self, prompt: str, stop_when, **kwargs) -> tuple[str, int, int]:
+        return self._read_stream(self.__stream, prompt, stop_when, **kwargs)
+
+
+class FlakyEmbedding(EchoLLM):
+    """Embedding model that fails the first request of every text"""
+
+    def __init__(self):
+        super().__init__()
+        self.failed = set()
+
+    async def __aembed(self, text: str, **kwargs) -> tuple[list[float], int, int]:
+        await asyncio.sleep(0)
+        if text not in self.failed:
+            self.failed.add(text)
+            raise ConnectionError("Temporary error")
+        return [float(len(text))], 1, 0
+
+    async def _acompletion(self, text: str, **kwargs) -> tuple[list[float], int, int]:
+        wrapper = BaseLLM.async_retry_with_exponential_backoff(self.__aembed, self.logger, errors=(ConnectionError,), initial_delay=0.001)
+        return await wrapper(text, **kwargs)
+
+
+def test_acompletion_replaces_inputs_and_updates_costs():
+    llm = EchoLLM()
+    response = asyncio.run(llm.acompletion("Hello <input1>", inputs=["world"]))
+
+    assert response == "Hello world"
+    assert llm.cost_manager.get_tokens() == {"prompt_tokens": 2, "response_tokens": 1, "total_tokens": 3}
+    assert llm.cost_manager.get_costs()["total_cost"] == 4
+
+def test_acompletion_checks_prompt_length():
+    llm = EchoLLM()
+    with pytest.raises(ValueError):
+        asyncio.run(llm.acompletion("word " * 101))
+
+def test_aget_embeddings_retries_and_keeps_order():
+    llm = FlakyEmbedding()
+    embeddings = asyncio.run(llm.aget_embeddings(["a", "abc", "ab"]))
+
+    assert embeddings == [[1.0], [3.0], [2.0]]
+    assert llm.cost_manager.get_tokens()["prompt_tokens"] == 3
+
+def test_async_retry_raises_after_max_retries():
+    async def always_fails():
+        raise ConnectionError("Temporary error")
+
+    llm = EchoLLM()
+    wrapper = BaseLLM.async_retry_with_exponential_backoff(always_fails, llm.logger, errors=(ConnectionError,), initial_delay=0.001, max_retries=2)
+    with pytest.raises(Exception, match="Maximum number of retries"):
+        asyncio.run(wrapper())
+
+@pytest.fixture
+def cache_path(tmp_path):
+    yield str(tmp_path / "llm_cache.sqlite")
+    configure_response_cache("off")
+
+def test_cache_read_write_and_replay(cache_path):
+    configure_response_cache("read_write", cache_path)
+    llm = EchoLLM()
+    assert llm.completion("Hello <input1>", inputs=["world"]) == "Hello world"
+    assert llm.completion("Hello <input1>", inputs=["world"]) == "Hello world"
+    assert llm.calls == 1
+    assert llm.cost_manager.get_cache_stats() == {"cache_hits": 1, "cached_prompt_tokens": 2, "cached_response_tokens": 1, "saved_cost": 4}
+    assert llm.cost_manager.get_costs()["total_cost"] == 4
+
+    # The system prompt is part of the key
+    llm.completion("Hello world", system_prompt="Be kind")
+    assert llm.calls == 2
+
+    # Replay reads the responses stored by another process without calling the model
+    configure_response_cache("replay", cache_path)
+    replay_llm = EchoLLM()
+    assert replay_llm.completion("Hello world") == "Hello world"
+    assert getattr(replay_llm, 'calls', 0) == 0
+    assert replay_llm.cost_manager.get_costs()["total_cost"] == 0
+    with pytest.raises(CacheMissError):
+        replay_llm.completion("Not cached")
+
+def test_cache_record_mode_always_calls_the_model(cache_path):
+    configure_response_cache("record", cache_path)
+    llm = EchoLLM()
+    llm.completion("Hello")
+    llm.completion("Hello")
+    assert llm.calls == 2
+    assert llm.cost_manager.get_cache_stats()["cache_hits"] == 0
+
+def test_identical_requests_in_flight_are_coalesced():
+    llm = SlowEchoLLM()
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(llm.completion("Hello <input1>", inputs=["world"]))) for _ in range(4)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+
+    assert responses == ["Hello world"] * 4
+    assert llm.calls == 1
+    # Only the request that called the model pays for it
+    assert llm.cost_manager.get_costs()["total_cost"] == 4
+    assert llm.cost_manager.get_coalesced_stats() == {"coalesced_requests": 3, "coalesced_prompt_tokens": 6, "coalesced_response_tokens": 3, "saved_cost": 12}
+    assert not BaseLLM._in_flight_requests
+
+def test_async_requests_are_coalesced_and_share_errors():
+    llm = SlowEchoLLM()
+
+    async def complete_all():
+        return await asyncio.gather(llm.acompletion("Hello"), llm.acompletion("Hello"), llm.acompletion("Bye"))
+
+    assert asyncio.run(complete_all()) == ["Hello", "Hello", "Bye"]
+    assert llm.calls == 2
+    assert llm.cost_manager.get_coalesced_stats()["coalesced_requests"] == 1
+
+    class FailingLLM(SlowEchoLLM):
+        def _completion(self, prompt: str, **kwargs):
+            super()._completion(prompt, **kwargs)
+            raise RuntimeError("Unexpected error")
+
+    failing_llm = FailingLLM()
+    async def fail_all():
+        return await asyncio.gather(failing_llm.acompletion("Hello"), failing_llm.acompletion("Hello"), return_exceptions=True)
+
+    errors = asyncio.run(fail_all())
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert failing_llm.calls == 1
+    assert not BaseLLM._in_flight_requests
+
+def test_coalesced_requests_are_sent_again_when_the_owner_is_cancelled():
+    llm = SlowEchoLLM()
+
+    async def cancel_owner():
+        owner = asyncio.create_task(llm.acompletion("Hello"))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(llm.acompletion("Hello"))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return await asyncio.wait_for(follower, 5)
+
+    assert asyncio.run(cancel_owner()) == "Hello"
+    assert llm.calls == 2
+    assert not BaseLLM._in_flight_requests
+
+def test_streamed_completion_stops_when_the_answer_is_complete(cache_path):
+    configure_response_cache("read_write", cache_path)
+    llm = StreamingLLM()
+    response = llm.completion("Hello", stop_when=json_answer_complete)
+    assert response == 'Thinking ```json\n{"Answer": "yes"}\n```'
+    assert llm.chunks_sent == 5
+    # Only the tokens generated before the stream was closed are paid
+    assert llm.cost_manager.get_tokens() == {"prompt_tokens": 1, "response_tokens": 5, "total_tokens": 6}
+
+    # The full response is cached apart from the streamed one
+    assert llm.completion("Hello").endswith("never used")
+    assert asyncio.run(llm.acompletion("Hello", stop_when=json_answer_complete)) == response
+    assert llm.cost_manager.get_cache_stats()["cache_hits"] == 1
+
+def test_streamed_completion_uses_the_reported_usage():
+    llm = UsageStreamingLLM()
+    # The stream ends normally, the usage reported by the api is used
+    assert llm.completion("Hello", stop_when=lambda response: False).endswith('trailing text')
+    assert llm.cost_manager.get_tokens() == {"prompt_tokens": 7, "response_tokens": 3, "total_tokens": 10}
+    # The stream is closed before the usage is reported, the tokens are estimated
+    llm = UsageStreamingLLM()
+    assert llm.completion("Hello", stop_when=json_answer_complete) == '```json\n{"Answer": "yes"}\n```'
+    assert llm.cost_manager.get_tokens() == {"prompt_tokens": 1, "response_tokens": 4, "total_tokens": 5}
+
+def test_stop_condition_is_ignored_by_models_without_streaming():
+    llm = EchoLLM()
+    assert llm.completion("Hello world", stop_when=json_answer_complete) == "Hello world"
@@ -0,0 +1,142 @@
+import pytest
+
+from llm.base_llm import BaseLLM
+from llm.model_registry import ModelRegistry
+from llm.model_router import ModelRouter
+from llm.response_cache import configure_response_cache
+from utils.llm import extract_answers
+
+
+class FixedLLM(BaseLLM):
+    """Model that always answers with the same response"""
+
+    def __init__(self, response: str, max_tokens: int = 100, prompt_token_cost: float = 1):
+        super().__init__(prompt_token_cost, prompt_token_cost, max_tokens, 1)
+        self.response = response
+        self.calls = 0
+
+    def _calculate_tokens(self, prompt: str) -> int:
+        return len(prompt.split())
+
+    def _completion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+        self.calls += 1
+        return self.response, self._calculate_tokens(prompt), 1
+
+
+def create_router(small_response: str, routes: dict | None = None, **kwargs) -> tuple[ModelRouter, FixedLLM, FixedLLM]:
+    small = FixedLLM(small_response, **kwargs)
+    big = FixedLLM('```json\n{"Answer": "big"}\n```', max_tokens=1000, prompt_token_cost=10)
+    routes = routes or {'modules': {'should_react': {'models': ['small', 'big']}}}
+    return ModelRouter({'small': small, 'big': big}, routes, fallback_models=['big']), small, big
+
+def test_routes_to_the_first_model():
+    router, small, big = create_router('```json\n{"Answer": "small"}\n```')
+    assert router.completion('should_react', 'Hello <input1>', parse=extract_answers, inputs=['world']) == {'Answer': 'small'}
+    assert (small.calls, big.calls) == (1, 0)
+    # The modules without a route use the fallback models
+    assert router.completion('plan', 'Hello', parse=extract_answers) == {'Answer': 'big'}
+
+def test_escalates_when_the_response_cannot_be_parsed():
+    router, small, big = create_router('I am not sure')
+    assert router.completion('should_react', 'Hello', parse=extract_answers) == {'Answer': 'big'}
+    assert (small.calls, big.calls) == (1, 1)
+    assert router.get_stats()['should_react'] == {'requests': {'small': 1, 'big': 1}, 'escalations': 1}
+
+def test_skips_models_by_prompt_size_and_budgets():
+    router, small, big = create_router('```json\n{"Answer": "small"}\n```', max_tokens=5)
+    assert router.completion('should_react', 'a long prompt for the small model') == '```json\n{"Answer": "big"}\n```'
+    assert small.calls == 0
+
+    routes = {'modules': {'should_react': {'models': ['small', 'big'], 'max_p95_latency': 1}}}
+    router, small, big = create_router('small', routes)
+    router._latencies['small'].extend([0.1] * 90 + [5] * 10)
+    router.completion('should_react', 'Hello')
+    assert (small.calls, big.calls) == (0, 1)
+
+    routes = {'modules': {'should_react': {'models': ['big', 'small'], 'max_cost': 100, 'expected_response_tokens': 10}}}
+    router, small, big = create_router('small', routes)
+    router.completion('should_react', 'Hello')
+    assert (small.calls, big.calls) == (1, 0)
+
+def test_raises_when_the_prompt_is_too_long_for_every_model():
+    routes = {'modules': {'should_react': {'models': ['small', 'big']}}}
+    router, small, big = create_router('small', routes, max_tokens=5)
+    big.max_tokens = 5
+    # No candidate fits the prompt, the fallback model raises the error
+    with pytest.raises(ValueError, match='Prompt is too long'):
+        router.completion('should_react', 'a long prompt for every model')
+
+    # Both models are candidates but none of them accepts the prompt
+    router._get_candidates = lambda *args: ['small', 'big']
+    with pytest.raises(ValueError, match='Prompt is too long'):
+        router.completion('should_react', 'a long prompt for every model')
+    assert (small.calls, big.calls) == (0, 0)
+
+def test_substrate_routes_take_precedence():
+    routes = {'modules': {'should_react': {'models': ['small']}}, 'substrates': {'clean_up': {'default': {'models': ['big']}, 'modules': {'should_react': {'models': ['big']}}}}}
+    router, small, big = create_router('small', routes)
+    router.substrate_name = 'clean_up'
+    router.completion('should_react', 'Hello')
+    router.completion('plan', 'Hello')
+    assert (small.calls, big.calls) == (0, 2)
+
+def test_models_are_created_on_first_use():
+    models = ModelRegistry({'offline': 'llm.offline:OfflineLLM', 'other': 'llm.offline:OfflineLLM'})
+    assert list(models) == ['offline', 'other']
+    assert models.loaded() == {}
+    assert models['offline'] is models['offline']
+    assert list(models.loaded()) == ['offline']
+
+def test_excluded_models_are_probed_again():
+    routes = {'modules': {'should_react': {'models': ['small', 'big'], 'max_p95_latency': 1}}}
+    router, small, big = create_router('small', routes)
+    router._latencies['small'].extend([5] * 10)
+    router.completion('should_react', 'Hello')
+    assert (small.calls, big.calls) == (0, 1)
+
+    # After the probe interval the small model receives a request, its latency replaces the old ones
+    router.probe_interval = 0
+    router.completion('should_react', 'Hello')
+    assert (small.calls, big.calls) == (1, 1)
+    assert router.get_p95_latency('small') < 1
+    router.probe_interval = 60
+    router.completion('should_react', 'Hello')
+    assert (small.calls, big.calls) == (2, 1)
+
+def test_only_the_selected_models_are_created():
+    models = ModelRegistry({'small': 'llm.offline:OfflineLLM', 'big': 'llm.offline:OfflineLLM'})
+    routes = {'modules': {'should_react': {'models': ['small', 'big'], 'max_p95_latency': 1}}}
+    router = ModelRouter(models, routes, fallback_models=['big'])
+    router._latencies['small'].extend([5] * 10)
+    router.completion('should_react', 'Hello')
+    assert list(models.loaded()) == ['big']
+
+def test_default_routes_use_the_main_model():
+    router = ModelRouter.from_file({}, 'config/model_routes.json')
+    for module in ['should_react', 'plan', 'actions_sequence', 'reflect_insights']:
+        assert router.get_route(module)['models'] == ['llama3.1_70B']
+
+def test_unparsable_responses_are_not_cached(tmp_path):
+    class SometimesUnsureLLM(FixedLLM):
+        def _completion(self, prompt: str, **kwargs) -> tuple[str, int, int]:
+            self.calls += 1
+            response = 'I am not sure' if self.calls < 3 else '```json\n{"Answer": "move up"}\n```'
+            return response, self._calculate_tokens(prompt), 1
+
+    configure_response_cache("read_write", str(tmp_path / "llm_cache.sqlite"))
+    try:
+        model = SometimesUnsureLLM('')
+        router = ModelRouter({'model': model}, {'modules': {'actions_sequence': {'models': ['model']}}})
+        # The caller sends the same request until it gets an answer, as the act module does
+        answers = {}
+        for _ in range(5):
+            answers = router.completion('actions_sequence', 'Hello', parse=extract_answers) or {}
+            if answers:
+                break
+        assert answers == {'Answer': 'move up'}
+        assert model.calls == 3
+        # The valid response is cached
+        assert router.completion('actions_sequence', 'Hello', parse=extract_answers) == {'Answer': 'move up'}
+        assert model.calls == 3
+    finally:
+        configure_response_cache("off")
@@ -0,0 +1,65 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from llm.offline import LatencySampler, OfflineEmbedding, OfflineLLM, OfflineLLMError
+from utils.llm import extract_answers, extract_tags
+
+llm = OfflineLLM(seed=0)
+
+def test_react_completion_from_prompt_file():
+    response = llm.completion('base_prompts_v1/react.txt', inputs=['Laura', 'context', 'observations', 'plan', 'actions', 'changes', '(1, 2)', 'bio'])
+    answers = extract_answers(response)
+    assert isinstance(answers['Answer'], bool)
+    assert answers['Reasoning']
+    assert llm.cost_manager.get_costs()['total_cost'] == 0
+
+def test_responses_follow_the_prompts_schema():
+    plan = extract_answers(llm._build_response('', 'plan.txt'))
+    assert plan['Plan'] and plan['Goals']
+
+    act = extract_answers(llm._build_response('Observed an apple at position [3, 4]. This apple belongs to tree 1.', 'act.txt').lower())
+    assert act['answer'] == 'go to position (3, 4)'
+    act = extract_answers(llm._build_response('You couldn\'t observe anything interesting.', 'act.txt').lower())
+    assert act['answer'] == 'explore'
+
+    questions = extract_answers(llm._build_response('', 'reflect_questions.txt'))
+    assert all(q['Question'] for q in questions.values())
+
+    insights = extract_answers(llm._build_response('Question 1: a\n\nQuestion 2: b\n\n', 'reflect_insight.txt'))
+    assert len([i['Insight'] for i in insights.values()]) == 2
+
+    understanding = extract_tags(llm._build_response('', 'world_understanding.txt'))
+    assert understanding['used_knowledge'] == 'None'
+    assert extract_tags(understanding['new_world_knowledge']) == {'1': 'Apples grow near other apples.'}
+    assert understanding['future_observations']
+
+def test_injected_errors_are_retried():
+    flaky_llm = OfflineLLM(error_rate=0.5, seed=1)
+    responses = [flaky_llm.completion('Hello') for _ in range(5)]
+    assert all(responses)
+
+    failing_llm = OfflineLLM(error_rate=1, seed=1)
+    with pytest.raises(Exception, match='Maximum number of retries'):
+        failing_llm._completion('Hello')
+    with pytest.raises(OfflineLLMError):
+        failing_llm._simulate_request()
+
+def test_latency_sampler():
+    assert LatencySampler('constant:0.5').sample() == 0.5
+    samples = [LatencySampler('uniform:0.1,0.2', seed=0).sample() for _ in range(10)]
+    assert all(0.1 <= s <= 0.2 for s in samples)
+    assert LatencySampler('normal:0,1', seed=0).sample() >= 0
+    with pytest.raises(ValueError):
+        LatencySampler('gamma:1,2')
+
+def test_offline_embeddings():
+    embedding_model = OfflineEmbedding(embedding_dimensions=64)
+    embeddings = embedding_model.get_embeddings(['apple tree', 'apple tree', 'attacked agent'])
+    assert len(embeddings[0]) == 64
+    assert embeddings[0] == embeddings[1]
+    assert np.isclose(np.linalg.norm(embeddings[2]), 1)
+
+    async_embeddings = asyncio.run(embedding_model.aget_embeddings(['apple tree']))
+    assert async_embeddings == embeddings[:1]
@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from llm.base_llm import BaseLLM
+from llm.rate_limiter import RateLimiter, get_rate_limiter, is_rate_limit_error, parse_duration
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def test_parse_duration():
+    assert parse_duration('1s') == 1
+    assert parse_duration('6m0s') == 360
+    assert parse_duration('20ms') == pytest.approx(0.02)
+    assert parse_duration('2') == 2
+
+def test_is_rate_limit_error():
+    assert is_rate_limit_error(RateLimitError())
+    assert is_rate_limit_error(Exception('API error: 429 Too Many Requests'))
+    assert not is_rate_limit_error(ConnectionError('Connection reset'))
+
+def test_requests_per_minute_bucket():
+    limiter = RateLimiter('model', requests_per_minute=600)
+    limiter._state['requests'] = 2
+    start = time.time()
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(used_tokens=0)
+    # The third request waits for the bucket to refill 1 request (0.1 seconds at 600 rpm)
+    assert time.time() - start >= 0.08
+
+def test_tokens_are_reserved_and_corrected():
+    limiter = RateLimiter('model', tokens_per_minute=1000)
+    limiter.acquire(400)
+    assert limiter._state['tokens'] == pytest.approx(600, abs=1)
+    limiter.release(400, used_tokens=100)
+    assert limiter._state['tokens'] == pytest.approx(900, abs=1)
+
+def test_concurrency_window_adapts_to_rate_limits():
+    limiter = RateLimiter('model', max_concurrency=8)
+    wait = limiter.on_rate_limit(RateLimitError())
+    assert limiter.concurrency == 4
+    assert 0 < wait <= 1
+    # Every request waits for the shared cool down
+    assert limiter._try_acquire(0) > 0
+
+    limiter._state['cooldown_until'] = 0
+    limiter.acquire()
+    limiter.release(used_tokens=10)
+    assert 4 < limiter.concurrency < 5
+
+def test_concurrency_window_limits_requests_in_flight():
+    limiter = RateLimiter('model', max_concurrency=2)
+    in_flight, max_in_flight = 0, 0
+    lock = threading.Lock()
+
+    def request():
+        nonlocal in_flight, max_in_flight
+        limiter.acquire()
+        with lock:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        limiter.release(used_tokens=1)
+
+    threads = [threading.Thread(target=request) for _ in range(6)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    assert max_in_flight == 2
+
+def test_update_from_headers():
+    limiter = RateLimiter('model', requests_per_minute=100, tokens_per_minute=1000)
+    limiter.update_from_headers({'x-ratelimit-remaining-requests': '0', 'x-ratelimit-reset-requests': '2s', 'x-ratelimit-remaining-tokens': '500'})
+    assert limiter._state['tokens'] == pytest.approx(500, abs=1)
+    assert limiter._state['cooldown_until'] - time.time() > 1.5
+
+def test_limiter_shared_between_processes(tmp_path):
+    lock_path = str(tmp_path / 'model.lock')
+    limiter_1 = RateLimiter('model', requests_per_minute=60, lock_path=lock_path)
+    limiter_2 = RateLimiter('model', requests_per_minute=60, lock_path=lock_path)
+    limiter_1._state['requests'] = 1
+    limiter_1.acquire()
+    limiter_1.release(used_tokens=0)
+    # The second limiter reads the budget spent by the first one
+    assert limiter_2._try_acquire(0) > 0
+
+def test_limiter_shared_by_model_instances():
+    assert get_rate_limiter('shared_model') is get_rate_limiter('shared_model')
+
+def test_retry_notifies_the_limiter():
+    limiter = RateLimiter('model', requests_per_minute=6000)
+    calls = []
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RateLimitError()
+        return 'ok'
+
+    wrapper = BaseLLM.retry_with_exponential_backoff(flaky, logger, errors=(RateLimitError,), initial_delay=0.001, rate_limiter=limiter)
+    assert wrapper() == 'ok'
+    assert limiter.concurrency == 8
+
+def test_retries_reserve_their_budget_again():
+    limiter = RateLimiter('model', requests_per_minute=60, tokens_per_minute=1000)
+    limiter._state['requests'] = 5
+    calls = []
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError('Connection reset')
+        return 'ok'
+
+    wrapper = BaseLLM.retry_with_exponential_backoff(flaky, logger, errors=(ConnectionError,), initial_delay=0.001, rate_limiter=limiter)
+    limiter.acquire(100)
+    assert wrapper() == 'ok'
+    # The first attempt and the two retries reserved a request and the tokens each
+    assert limiter._state['requests'] == pytest.approx(2, abs=0.1)
+    assert limiter._state['tokens'] == pytest.approx(700, abs=1)
+    assert limiter.in_flight == 1
+    limiter.release(100, used_tokens=100)
+    assert limiter.in_flight == 0
+
+def test_retry_jitter_is_added_to_the_cooldown():
+    limiter = RateLimiter('model', requests_per_minute=6)
+    waits = [BaseLLM._get_retry_wait(RateLimitError(), 1, True, limiter) for _ in range(20)]
+    # Every request waits for the shared cool down of 10 seconds, and they do not retry at the same time
+    assert min(waits) >= 9.9
+    assert max(waits) - min(waits) > 0.1
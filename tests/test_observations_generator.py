@@ -1,6 +1,7 @@
+import numpy as np
 from game_environment.scene_descriptor.observations_generator import ObservationsGenerator
 from game_environment.substrates.python.commons_harvest_open import ASCII_MAP
-from game_environment.utils import connected_elems_map, get_element_global_pos
+from game_environment.utils import ComponentIndex, connected_elems_map, get_element_global_pos, get_elements_global_pos, get_matrix, get_observed_changes_by_rules, get_sprites_colors, get_global_entities, get_visible_entities, get_avatar_symbol, get_avatar_id, DIGITS
 
 players = ['agent1', 'agent2', 'agent3']
 obs_gen = ObservationsGenerator(ASCII_MAP, players, 'commons_harvest_open')
@@ -51,6 +52,15 @@ def test_get_element_global_pos():
 
     print("All test cases pass")
     
+def test_get_elements_global_pos():
+    elements = [(0, 0), (4, 1), (2, 3), (5, 2)]
+    local_position = (4, 1)
+    global_position = (7, 21)
+    for agent_orientation in range(4):
+        expected_output = [get_element_global_pos(element, local_position, global_position, agent_orientation) for element in elements]
+        global_positions = get_elements_global_pos(elements, local_position, global_position, agent_orientation)
+        assert global_positions.tolist() == expected_output, f"Expected {expected_output}, got {global_positions.tolist()}."
+
 def test_connected_elems_map():
     # Test case 1: Single element
     observed_map = "A"
@@ -88,6 +98,47 @@ def test_connected_elems_map():
 
     print("All test cases pass")
 
+def test_component_index():
+    observed_map = [
+        "-AA---",
+        "GA----",
+        "----AG",
+        "----GA",
+        ]
+    index = ComponentIndex("\n".join(observed_map), ["A", "G"])
+    assert index.get_component((1, 0)) == 1 and index.get_component((3, 5)) == 2
+    assert index.get_component((0, 0)) is None
+    assert index.count("A") == {1: 3, 2: 2}
+
+    # Only the resources change, the components keep their ids
+    observed_map[0] = "-GA---"
+    index.update("\n".join(observed_map))
+    assert index.count("A") == {1: 2, 2: 2}
+
+    # The second tree is split, only its components are labelled again
+    observed_map[2] = "----A-"
+    observed_map[3] = "-----A"
+    index.update("\n".join(observed_map))
+    assert index.get_component((0, 1)) == 1
+    assert index.get_elements(index.get_component((2, 4))) == [[2, 4]]
+    assert index.get_elements(index.get_component((3, 5))) == [[3, 5]]
+    expected_components = connected_elems_map("\n".join(observed_map), ["A", "G"]).values()
+    assert list(index.get_components().values()) == list(expected_components)
+    assert sorted(index.count("A").values()) == [1, 1, 2]
+
+def test_get_sprites_colors():
+    red, yellow = (238, 102, 119), (204, 187, 68)
+    map_rgb = np.zeros((8, 12, 3), dtype=np.uint8)
+    map_rgb[1, 1] = red      # Sprite of the cell (0, 0)
+    map_rgb[5, 5] = yellow   # Sprite of the cell (1, 1)
+    map_rgb[6, 9] = red      # Sprite of the cell (1, 2)
+    map_rgb[5, 10] = yellow  # The right-most colored column sets the color
+    map_rgb[7, 11] = yellow  # The last row and column of the sprites are skipped
+    positions = np.array([[0, 0], [1, 1], [1, 2], [0, 2]])
+    colors, pixels = get_sprites_colors(map_rgb, (2, 3), positions, np.array([red, yellow]))
+    assert colors.tolist() == [0, 1, 1, -1]
+    assert pixels[:3].tolist() == [[1, 1], [5, 5], [5, 10]]
+
 def test_get_trees_descriptions():
     observed_map = 'FFA\nFFF\nFFF\nAFF\nA#F\nAGA'
     local_map_position = (4,1)
@@ -246,6 +297,80 @@ def test_get_observed_agents():
     agents_observed = obs_gen.get_agents_observed(observed_map, local_map_position, global_position, agent_orientation)
     assert sorted(agents_observed) == sorted(expected_output), f"Expected {expected_output}, got {agents_observed}."
 
+def test_get_all_observations_descriptions():
+    scene_description = {
+        'agent1': {'observation': "There are no observations: you're out of the game.", 'global_position': None},
+        'agent2': {'observation': 'There are no observations: You were attacked by agent agent1.', 'global_position': (7, 21)},
+    }
+    expected_output = {
+        'agent1': ["There are no observations: you're out of the game."],
+        'agent2': ['There are no observations: You were attacked by agent agent1. At position (7, 21)'],
+    }
+    assert obs_gen.get_all_observations_descriptions(scene_description) == expected_output
+    # The string representation of the scene description is still accepted
+    assert obs_gen.get_all_observations_descriptions(str(scene_description)) == expected_output
+
+def test_get_visible_entities():
+    global_map = get_matrix('A.1A\n.0..\nA..2')
+    entities = get_global_entities(global_map, ['A', '0', '1', '2'])
+    # Window of 3x3 cells, the agent 0 is in the middle
+    visible_entities = get_visible_entities(entities, (1, 1), (1, 1), 0, (3, 3))
+    assert visible_entities == [('A', (0, 0), [0, 0]), ('1', (0, 2), [0, 2]), ('A', (2, 0), [2, 0])]
+    # Looking to the south the window is read from the bottom right corner of the map
+    visible_entities = get_visible_entities(entities, (1, 1), (1, 1), 2, (3, 3))
+    assert visible_entities == [('A', (0, 2), [2, 0]), ('1', (2, 0), [0, 2]), ('A', (2, 2), [0, 0])]
+
+def test_avatar_ids_layer():
+    # The avatars 2 and 12 are drawn with the same symbol, the layer of ids tells them apart
+    assert get_avatar_symbol(2) == get_avatar_symbol(12) == '2'
+    global_map = get_matrix('A.2A\n.0..\nA..2')
+    avatar_ids_map = np.full(global_map.shape, -1)
+    avatar_ids_map[0, 2], avatar_ids_map[1, 1], avatar_ids_map[2, 3] = 12, 0, 2
+    assert get_avatar_id('2', [0, 2], avatar_ids_map) == '12'
+    assert get_avatar_id('2', [0, 2]) == '2'
+    assert get_avatar_id('A', [0, 0], avatar_ids_map) == 'A'
+    entities = get_global_entities(global_map, ['A'], avatar_ids_map)
+    visible_entities = get_visible_entities(entities, (1, 1), (1, 1), 0, (3, 3))
+    assert visible_entities == [('A', (0, 0), [0, 0]), ('12', (0, 2), [0, 2]), ('A', (2, 0), [2, 0])]
+    # The functions of the rules receive the ids of the avatars
+    rules = [('A', DIGITS, lambda last_el, curr_el, el_pos: f"Agent {curr_el} took an apple from position {el_pos}.")]
+    last_m, curr_m = get_matrix('..A\n.0.\n...'), get_matrix('..2\n.0.\n...')
+    changes = get_observed_changes_by_rules(curr_m, last_m, rules, (1, 1), (1, 1), 0, 'time', avatar_ids=(avatar_ids_map, avatar_ids_map))
+    assert changes == [("Agent 12 took an apple from position [0, 2].", 'time')]
+
+def test_observations_descriptions_cache():
+    cache_obs_gen = ObservationsGenerator(ASCII_MAP, players, 'commons_harvest_open')
+    observed_map = "\n".join(["-----------", "--AAA------", "---A---1---", "-----------", "-----------", "-----------",
+                               "-----------", "-----------", "-----------", "-----#-----", "-----------"])
+    scene_description = {
+        'agent1': {'observation': observed_map, 'last_observation': None, 'global_position': (10, 10), 'orientation': 0},
+        'agent3': {'observation': observed_map, 'last_observation': None, 'global_position': (10, 10), 'orientation': 0},
+    }
+    descriptions = cache_obs_gen.get_all_observations_descriptions(scene_description)
+    assert cache_obs_gen.get_cache_stats() == {'hits': 1, 'misses': 1, 'size': 1}
+    assert descriptions['agent1'] == descriptions['agent3']
+    # The agent turned, the window is described again
+    scene_description['agent1']['orientation'] = 1
+    assert cache_obs_gen.get_all_observations_descriptions(scene_description)['agent3'] == descriptions['agent3']
+    assert cache_obs_gen.get_cache_stats() == {'hits': 2, 'misses': 2, 'size': 2}
+
+def test_get_observed_changes_by_rules():
+    last_m = get_matrix('AG<\nF0B\n#FA')
+    curr_m = get_matrix('1AG\nGBF\n#FA')
+    rules = [
+        (DIGITS, 'B', lambda last_el, curr_el, el_pos: f"{players[int(last_el)]} was attacked at position {el_pos}."),
+        ('B', None, None),
+        ('A', DIGITS, lambda last_el, curr_el, el_pos: f"Observed that agent {players[int(curr_el)]} took an apple from position {el_pos}."),
+        ('G', 'A', "Observed that an apple grew at position {position}."),
+        ('F', 'G', "Observed that grass to grow apples appeared at position {position}."),
+    ]
+    expected_output = [("Observed that agent agent2 took an apple from position [5, 20].", 'time'),
+                       ("Observed that an apple grew at position [5, 21].", 'time'),
+                       ("Observed that grass to grow apples appeared at position [6, 20].", 'time'),
+                       ("agent1 was attacked at position [6, 21].", 'time')]
+    changes = get_observed_changes_by_rules(curr_m, last_m, rules, (2, 0), (7, 20), 0, 'time', pad_token='<')
+    assert changes == expected_output, f"Expected {expected_output}, got {changes}."
+
 def test_get_observed_changes():
     game_time = '2021-09-30 12:00:00'
     observed_map = 'AAA\nF#F\n2AF'
@@ -0,0 +1,39 @@
+import threading
+import time
+
+from utils.round_executor import RoundExecutor
+from utils.llm_cost import CostManager
+
+
+def slow_move(delay, action):
+    time.sleep(delay)
+    return action
+
+def test_results_keep_agents_order():
+    executor = RoundExecutor()
+    # The first agent finishes last
+    moves = [('Laura', slow_move, (0.05, 'move up'), {}),
+             ('Juan', slow_move, (0.0, 'turn left'), {}),
+             ('Pedro', slow_move, (0.01, 'stay put'), {})]
+    results = executor.run(moves)
+    executor.shutdown()
+
+    assert list(results.keys()) == ['Laura', 'Juan', 'Pedro']
+    assert results == {'Laura': 'move up', 'Juan': 'turn left', 'Pedro': 'stay put'}
+
+def test_sequential_mode_runs_in_main_thread():
+    executor = RoundExecutor(max_workers=1)
+    moves = [(name, lambda: threading.current_thread().name, (), {}) for name in ['Laura', 'Juan']]
+    results = executor.run(moves)
+
+    assert results == {'Laura': threading.current_thread().name, 'Juan': threading.current_thread().name}
+
+def test_cost_manager_concurrent_updates():
+    cost_manager = CostManager(prompt_token_cost=1, response_token_cost=2)
+    executor = RoundExecutor(max_workers=8)
+    update = lambda: [cost_manager.update_costs(prompt_tokens=1, response_tokens=1) for _ in range(1000)]
+    executor.run([(str(i), update, (), {}) for i in range(8)])
+    executor.shutdown()
+
+    assert cost_manager.get_tokens() == {'prompt_tokens': 8000, 'response_tokens': 8000, 'total_tokens': 16000}
+    assert cost_manager.get_costs()['total_cost'] == 8000 * 3
@@ -1,5 +1,7 @@
+import numpy as np
 
 from game_environment.scene_descriptor.scene_descriptor import SceneDescriptor
+from game_environment.utils import parse_string_to_grid, grid_to_string, grid_to_matrix, matrix_to_grid
 
 def test_describe_scene_commons_harvest(mocker):
     # Test that an agent who zapped another agent is detected
@@ -116,4 +118,32 @@ def test_describe_scene_commons_harvest(mocker):
 
     assert scene_description['player1']['effective_zap'] == False, "The 'effective_zap' observation for player1 should be False"
     assert scene_description['player2']['effective_zap'] == False, "The 'effective_zap' observation for player2 should be False"
-    assert scene_description['player3']['effective_zap'] == False, "The 'effective_zap' observation for player3 should be False"
\ No newline at end of file
+    assert scene_description['player3']['effective_zap'] == False, "The 'effective_zap' observation for player3 should be False"
+
+def test_rotated_maps_are_shared_views():
+    scene_descriptor = SceneDescriptor.__new__(SceneDescriptor)
+    scene_descriptor._padded_maps = []
+    global_map = np.full((7, 14), ord('F'), dtype=np.uint8)
+    global_map[2, 5] = ord('0')
+
+    padded_maps = scene_descriptor.get_padded_maps(global_map)
+    for orientation in range(4):
+        rotated_map, avatar_pos = scene_descriptor.get_rotated_map(padded_maps, global_map, 9, orientation, (2, 5))
+        # The position of the avatar is tracked through the padding and the rotation
+        assert rotated_map[avatar_pos] == ord('0')
+        assert np.shares_memory(rotated_map, padded_maps[9]), "The rotations should be views of the padded map"
+
+    # The padded maps of the last map are kept for the next step
+    assert scene_descriptor.get_padded_maps(np.full((7, 14), ord('F'), dtype=np.uint8)) is not padded_maps
+    assert scene_descriptor.get_padded_maps(global_map) is padded_maps
+
+def test_symbols_grid():
+    text_map = 'WWWW\nWA0W\nWGFW\n'
+    grid = parse_string_to_grid(text_map)
+    assert grid.dtype == np.uint8 and grid.shape == (3, 4)
+    assert grid_to_string(grid) == text_map.strip()
+    # Crops of the rotated views are rendered as text
+    assert grid_to_string(np.rot90(grid)[1:3, 1:]) == '0F\nAG'
+    matrix = grid_to_matrix(grid)
+    assert matrix.tolist() == [list(row) for row in text_map.split()]
+    assert (matrix_to_grid(matrix) == grid).all()
@@ -2,6 +2,7 @@ from game_environment.scene_descriptor.observations_generator import Observation
 from game_environment.substrates.python.commons_harvest_open import ASCII_MAP
 from agent.memory_structures.spatial_memory import SpatialMemory
 from unittest.mock import patch
+import numpy as np
 
 spatial_memory = SpatialMemory(ASCII_MAP, '0')
 orientation_map = {0: 'North', 1: 'East', 2: 'South', 3: 'West'}
@@ -68,10 +69,10 @@ def test_find_route_to_position(mock_shortest_valid_route):
     result = spatial_memory.find_route_to_position("WWWW\nW..W\nW..W\nWWWW", (1, 1), 0)
     assert list(result.queue) == ['stay put'], f'Expected ["stay put"], got {list(result.queue)}'
 
-    # Test case 2: Normal route
+    # Test case 2: Normal route, the planner already ends the route with the final orientation
     mock_shortest_valid_route.return_value = ['move down', 'move right']
     result = spatial_memory.find_route_to_position("WWWW\nW..W\nW..W\nWWWW", (2, 2), 0)
-    expected_route = ['move down', 'move right', 'turn right']
+    expected_route = ['move down', 'move right']
     assert list(result.queue) == expected_route, f'Expected {expected_route}, got {list(result.queue)}'
 
     # Test case 3: End should end facing north, but it is already facing north. So, it should just move up without turning
@@ -80,3 +81,44 @@ def test_find_route_to_position(mock_shortest_valid_route):
     result = spatial_memory.find_route_to_position("WWWW\nW..W\nW..W\nWWWW", (1, 1), 0)
     expected_route = ['move up']
     assert list(result.queue) == expected_route, f'Expected {expected_route}, got {list(result.queue)}'
+
+def test_update_known_map():
+    small_memory = SpatialMemory('\n' + '\n'.join(['.' * 12] * 12) + '\n', '0')
+    def observe(global_map, position, orientation):
+        # Window of 11x11 cells with the agent at the local position (9, 5)
+        small_memory.position, small_memory.orientation = position, orientation
+        window = []
+        for i in range(11):
+            row = ''
+            for j in range(11):
+                global_row, global_col = small_memory.get_global_position((i, j), (9, 5))
+                if (i, j) == (9, 5):
+                    row += '#'
+                elif 0 <= global_row < 12 and 0 <= global_col < 12:
+                    row += global_map[global_row][global_col]
+                else:
+                    row += '-'
+            window.append(row)
+        small_memory.update_current_scene(position, orientation, '\n'.join(window), None)
+
+    global_map = [['.'] * 12 for _ in range(12)]
+    global_map[2][3] = '1'
+    observe(global_map, (9, 5), 0)
+    assert small_memory.known_map[2, 3] == '1' and small_memory.known_map[9, 5] == '0'
+    assert small_memory.near_agents == ['1']
+    assert small_memory.get_percentage_known() == float("{:.2f}".format(121 / 144 * 100))
+
+    # The agent 1 moved behind the agent, that turned around, its old position is not seen anymore and is cleared
+    global_map[2][3], global_map[10][5] = '.', '1'
+    observe(global_map, (9, 5), 2)
+    assert small_memory.known_map[2, 3] == '?' and small_memory.known_map[10, 5] == '1'
+    assert small_memory.timestamp_map[2, 3] == 2 and small_memory.updated_frequency_map[2, 3] == 2
+    assert small_memory.agents_positions['1'] == {(10, 5)} and small_memory.agents_positions['0'] == {(9, 5)}
+    # The last row of the map is seen for the first time
+    assert np.count_nonzero(small_memory.known_map == '?') == 144 - 121 - 11 + 1
+    assert small_memory.get_percentage_known() == float("{:.2f}".format((121 + 11 - 1) / 144 * 100))
+    assert list(small_memory.explored_map_per_round[:small_memory.explored_rounds]) == [0, float("{:.2f}".format(121 / 144 * 100)), small_memory.get_percentage_known()]
+    # The known cells are up to date but the agent itself, that is not drawn on this global map
+    assert small_memory.get_percentage_map_is_updated(global_map) == (121 + 11 - 2) / 144 * 100
+    global_map[0][0] = 'A'
+    assert small_memory.get_percentage_map_is_updated(global_map) == (121 + 11 - 3) / 144 * 100
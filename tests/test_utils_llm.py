@@ -0,0 +1,19 @@
+from utils.llm import extract_answers, extract_tags, json_answer_complete, tags_closed
+
+
+def test_json_answer_complete():
+    response = 'Reasoning first.\n```json\n{"Answer": "go to {3, 4}", "Reasoning": "say \\"hi\\"", "Plan": {"a": 1}'
+    assert not json_answer_complete('Reasoning first.')
+    assert not json_answer_complete(response)
+    assert not json_answer_complete(response + '}')
+    # The snippet must be closed for extract_answers to find it
+    assert json_answer_complete(response + '}\n```')
+    assert extract_answers(response + '}\n```')['Answer'] == 'go to {3, 4}'
+
+def test_tags_closed():
+    stop_condition = tags_closed('used_knowledge', 'future_observations')
+    response = '<used_knowledge>None</used_knowledge>\n<future_observations>More apples'
+    assert not stop_condition(response)
+    assert stop_condition(response + '</future_observations>')
+    assert extract_tags(response + '</future_observations>')['future_observations'] == 'More apples'
+    assert stop_condition.__name__ == 'tags_closed(used_knowledge,future_observations)'
@@ -1,4 +1,5 @@
-from utils.route_plan import get_shortest_valid_route
+import numpy as np
+from utils.route_plan import DistanceFieldCache, get_directions, get_oriented_route, get_shortest_valid_route, shortest_valid_route
 
 def test_get_shortest_valid_route_no_obstacles():
     matrix = [
@@ -71,4 +72,80 @@ def test_get_shortest_valid_route_when_destination_is_an_obstacle():
     end = (2, 2)
     invalid_symbols = ['X']
     expected_route = ['move right', 'move right', 'move down', 'move down']
-    assert get_shortest_valid_route(matrix, start, end, invalid_symbols) == expected_route
\ No newline at end of file
+    assert get_shortest_valid_route(matrix, start, end, invalid_symbols) == expected_route
+
+def test_shortest_valid_route_avoids_passable_obstacles():
+    matrix = [
+        ['.', 'A', '.'],
+        ['.', '.', '.']
+    ]
+    scenario_obstacles = {'impassable_obstacles': ['W'], 'passable_obstacles': ['A']}
+    expected_route = ['move down', 'move right', 'move right', 'move up']
+    assert shortest_valid_route(matrix, (0, 0), (0, 2), scenario_obstacles) == expected_route
+
+def test_shortest_valid_route_crosses_the_fewest_passable_obstacles():
+    matrix = [
+        ['.', 'A', 'A', '.'],
+        ['.', 'W', 'A', '.'],
+        ['.', 'A', '.', '.']
+    ]
+    scenario_obstacles = {'impassable_obstacles': ['W'], 'passable_obstacles': ['A']}
+    # The route along the first row is shorter, but it crosses two passable obstacles
+    expected_route = ['move down', 'move down', 'move right', 'move right', 'move right', 'move up', 'move up']
+    assert shortest_valid_route(matrix, (0, 0), (0, 3), scenario_obstacles) == expected_route
+    scenario_obstacles['impassable_obstacles'].append('A')
+    assert shortest_valid_route(matrix, (0, 0), (0, 3), scenario_obstacles) == []
+
+def test_distance_field_cache():
+    scenario_map = '\n'.join(['WWWWW', 'W...W', 'W.W.W', 'W...W', 'WWWWW'])
+    distance_fields = DistanceFieldCache(scenario_map, ['W', '$'])
+    scenario_obstacles = {'impassable_obstacles': ['W', '$', '0', '1'], 'passable_obstacles': ['A']}
+    current_map = np.array([list(row) for row in ['WWWWW', 'W0..W', 'W.W.W', 'W...W', 'WWWWW']])
+    # The route of the field has no dynamic obstacles
+    route = distance_fields.find_route(current_map, (1, 1), (3, 3), scenario_obstacles)
+    assert route == ['move right', 'move right', 'move down', 'move down']
+    assert shortest_valid_route(current_map, (1, 1), (3, 3), scenario_obstacles, distance_fields=distance_fields) == route
+    # Another agent blocks the route of the field in the next step, the route goes around it
+    current_map = current_map.copy()
+    current_map[1, 2] = '1'
+    route = distance_fields.find_route(current_map, (1, 1), (3, 3), scenario_obstacles)
+    assert route == ['move down', 'move down', 'move right', 'move right']
+    # The apples are crossed only if there is no other route
+    current_map = current_map.copy()
+    current_map[3, 1] = 'A'
+    assert distance_fields.find_route(current_map, (1, 1), (3, 3), scenario_obstacles) == route
+    assert distance_fields.get_stats() == {'hits': 3, 'misses': 1, 'size': 1}
+
+    assert distance_fields.get_nearest((1, 1), np.array([[3, 3], [1, 3], [3, 2]])) == (1, 2)
+    assert distance_fields.get_nearest((1, 1), np.array([[2, 2]])) == (None, float('inf'))
+
+def test_get_oriented_route():
+    def walk(position, orientation, route):
+        for step in route:
+            if step.startswith('turn'):
+                orientation = (orientation + (1 if step == 'turn right' else 3)) % 4
+                continue
+            direction = (orientation + get_directions(0).index(step)) % 4
+            position = (position[0] + [-1, 0, 1, 0][direction], position[1] + [0, 1, 0, -1][direction])
+        return position, orientation
+
+    matrix = [
+        ['.', '.', '.'],
+        ['.', 'W', '.'],
+        ['.', '.', '.']
+    ]
+    # Facing north, the agent moves to the right without turning and ends with a forward move, 4 steps instead of 5
+    route = get_oriented_route(matrix, (2, 0), (0, 2), ['W'], [], orientation=0)
+    assert len(route) == 4 and route[-1] == 'move up'
+    assert walk((2, 0), 0, route) == ((0, 2), 0)
+    # Facing west, the agent needs a single turn to end facing north
+    route = get_oriented_route(matrix, (2, 2), (0, 2), ['W'], [], orientation=3)
+    assert len(route) == 3 and route.count('turn right') == 1
+    assert walk((2, 2), 3, route) == ((0, 2), 0)
+    # The route stops next to the end facing it
+    route = get_oriented_route(matrix, (2, 0), (0, 2), ['W'], [], orientation=0, face_end=True)
+    assert route == ['move right', 'move right', 'move up']
+    assert walk((2, 0), 0, route) == ((1, 2), 0)
+    scenario_obstacles = {'impassable_obstacles': ['W'], 'passable_obstacles': []}
+    assert shortest_valid_route(matrix, (2, 0), (0, 2), scenario_obstacles, turns=True, face_end=True) == route
+    assert get_oriented_route(matrix, (1, 0), (1, 1), ['W'], [], orientation=1, face_end=True) == []
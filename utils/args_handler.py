@@ -91,6 +91,49 @@ def get_args():
         default=False,
         help="Whether to use the simple CoT agent. True/False."
     )
+
+    parser.add_argument(
+        "--max_concurrent_agents",
+        type=int,
+        default=None,
+        help="Maximum number of agents deciding their actions at the same time in a round. By default all the agents think concurrently, use 1 to run them one after another"
+    )
+
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="Record each step, the memories and the history file in the background while the agents think about the next step"
+    )
+    
+    parser.add_argument(
+        "--llm_backend",
+        type=str,
+        default=None,
+        choices=["online", "offline"],
+        help="Backend of the LLMs: online uses the providers apis, offline uses local stand-in models that need no api keys. Defaults to the LLM_BACKEND environment variable or online"
+    )
+
+    parser.add_argument(
+        "--llm_cache_mode",
+        type=str,
+        default=None,
+        choices=["off", "read_write", "replay", "record"],
+        help="Mode of the persistent LLM responses cache: off, read_write, replay (only cached responses, works offline) or record. Defaults to the LLM_CACHE_MODE environment variable or off"
+    )
+
+    parser.add_argument(
+        "--llm_cache_path",
+        type=str,
+        default=None,
+        help="Path to the SQLite database of the LLM responses cache. Defaults to the LLM_CACHE_PATH environment variable or data/llm_cache.sqlite"
+    )
+
+    parser.add_argument(
+        "--llm_routes",
+        type=str,
+        default=None,
+        help="Path to the json routing table that selects the model of every cognitive module. Defaults to the LLM_ROUTES_PATH environment variable or config/model_routes.json, which routes every module to the main model. config/model_routes.small_models.json sends should_react to a smaller model first"
+    )
     
     args = parser.parse_args()
     return args
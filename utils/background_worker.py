@@ -0,0 +1,51 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+from typing import Any, Callable
+
+class BackgroundWorker:
+    """Runs the bookkeeping of the simulation (recording, history files, indicators) in a background thread.
+    The tasks run one after another in the order they were submitted, so the files are written in the same order
+    as in a sequential run, while the main thread goes on with the cognition of the next round.
+    """
+
+    def __init__(self, name: str = 'background'):
+        """Initializes the background worker.
+
+        Args:
+            name (str, optional): Name of the worker thread. Defaults to 'background'.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._pending: list[Future] = []
+        self._lock = threading.Lock()
+
+    def submit(self, func: Callable[..., Any], *args, **kwargs) -> Future:
+        """Schedules a task after the tasks already submitted.
+
+        Args:
+            func (Callable[..., Any]): Function to run.
+            *args: Positional arguments of the function.
+            **kwargs: Keyword arguments of the function.
+
+        Returns:
+            Future: Future with the result of the task.
+        """
+        future = self.executor.submit(func, *args, **kwargs)
+        with self._lock:
+            self._pending = [f for f in self._pending if not f.done() or f.exception() is not None]
+            self._pending.append(future)
+        return future
+
+    def wait(self) -> None:
+        """Waits until all the submitted tasks are finished.
+
+        Raises:
+            Exception: The first exception raised by a task, in the order they were submitted.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def shutdown(self) -> None:
+        """Waits for the submitted tasks and stops the worker thread."""
+        self.executor.shutdown(wait=True)
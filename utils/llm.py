@@ -1,9 +1,6 @@
 import re
 import json
 import os
-from chromadb import Documents, EmbeddingFunction, Embeddings
-
-from llm import LLMModels
 
 def extract_answers(response: str) -> dict[str, str]:
     """Extracts the answers from the response. The answers are extracted by parsing the json part of the response.
@@ -53,13 +50,59 @@ def extract_tags(response: str) -> dict:
     patt = r'<(\w+)>(.*)?</\1>'
     return {k: v.strip() for k, v in re.findall(patt, response, re.DOTALL)}
 
-class CustomEmbeddingFunction(EmbeddingFunction):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.model = LLMModels().get_embedding_model()
-    def __call__(self, texts: Documents) -> Embeddings:
-        return self.model.get_embeddings(texts)
-    
+def json_answer_complete(response: str) -> bool:
+    """Stop condition for streamed completions. Checks if the first ```json code snippet of the response is complete,
+    that is, its json object is balanced and the snippet is closed. It is all that extract_answers needs.
+
+    Args:
+        response (str): Response generated so far.
+
+    Returns:
+        bool: True if the json code snippet is complete.
+    """
+    start = response.find('```json')
+    if start == -1:
+        return False
+    start = response.find('{', start)
+    if start == -1:
+        return False
+
+    depth, in_string, escaped = 0, False, False
+    for i in range(start, len(response)):
+        char = response[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return '```' in response[i + 1:]
+    return False
+
+def tags_closed(*tags: str):
+    """Create a stop condition for streamed completions that checks if all the given tags have been closed.
+
+    Args:
+        *tags (str): Names of the tags. For example: "used_knowledge", "future_observations"
+
+    Returns:
+        Callable[[str], bool]: Function that returns True when the response contains the closing tag of every tag.
+    """
+    closing_tags = [f'</{tag}>' for tag in tags]
+    def stop_condition(response: str) -> bool:
+        return all(tag in response for tag in closing_tags)
+    # The name identifies the condition in the response cache
+    stop_condition.__name__ = f'tags_closed({",".join(tags)})'
+    return stop_condition
+
 def load_prompt(prompt: str) -> str:
     """Load the prompt from a file or return the prompt if it is a string
     Args:
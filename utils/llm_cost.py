@@ -1,3 +1,5 @@
+import threading
+
 class CostManager():
     """Class for managing the cost of the LLMs apis"""
     def __init__(self, prompt_token_cost: float, response_token_cost: float):
@@ -14,6 +16,18 @@ class CostManager():
         self.prompt_tokens = 0
         self.response_tokens = 0
         self.total_tokens = 0
+        # Requests answered by the response cache, they are not included in the costs
+        self.cache_hits = 0
+        self.cached_prompt_tokens = 0
+        self.cached_response_tokens = 0
+        self.saved_cost = 0
+        # Requests that shared the response of an identical request in flight, the cost is only paid by that request
+        self.coalesced_requests = 0
+        self.coalesced_prompt_tokens = 0
+        self.coalesced_response_tokens = 0
+        self.coalesced_saved_cost = 0
+        # The costs can be updated from several threads when the agents move concurrently
+        self._lock = threading.Lock()
     
     def update_costs(self, prompt_tokens: int = 0, response_tokens: int = 0):
         """Update the cost of the prompt and response
@@ -21,32 +35,85 @@ class CostManager():
             prompt_tokens (int, optional): Number of tokens in the prompt. Defaults to 0.
             response_tokens (int, optional): Number of tokens in the response. Defaults to 0.
         """
-        self.prompt_cost += prompt_tokens * self.prompt_token_cost
-        self.response_cost += response_tokens * self.response_token_cost
-        self.total_cost = self.prompt_cost + self.response_cost
+        with self._lock:
+            self.prompt_cost += prompt_tokens * self.prompt_token_cost
+            self.response_cost += response_tokens * self.response_token_cost
+            self.total_cost = self.prompt_cost + self.response_cost
 
-        self.prompt_tokens += prompt_tokens
-        self.response_tokens += response_tokens
-        self.total_tokens = self.prompt_tokens + self.response_tokens
+            self.prompt_tokens += prompt_tokens
+            self.response_tokens += response_tokens
+            self.total_tokens = self.prompt_tokens + self.response_tokens
+
+    def update_cached_costs(self, prompt_tokens: int = 0, response_tokens: int = 0):
+        """Register a response read from the cache. It does not add cost, it only counts the tokens that were saved
+        Args:
+            prompt_tokens (int, optional): Number of tokens in the prompt. Defaults to 0.
+            response_tokens (int, optional): Number of tokens in the response. Defaults to 0.
+        """
+        with self._lock:
+            self.cache_hits += 1
+            self.cached_prompt_tokens += prompt_tokens
+            self.cached_response_tokens += response_tokens
+            self.saved_cost += prompt_tokens * self.prompt_token_cost + response_tokens * self.response_token_cost
+
+    def update_coalesced_costs(self, prompt_tokens: int = 0, response_tokens: int = 0):
+        """Register a response shared with an identical request in flight. It does not add cost, it only counts the tokens that were saved
+        Args:
+            prompt_tokens (int, optional): Number of tokens in the prompt. Defaults to 0.
+            response_tokens (int, optional): Number of tokens in the response. Defaults to 0.
+        """
+        with self._lock:
+            self.coalesced_requests += 1
+            self.coalesced_prompt_tokens += prompt_tokens
+            self.coalesced_response_tokens += response_tokens
+            self.coalesced_saved_cost += prompt_tokens * self.prompt_token_cost + response_tokens * self.response_token_cost
 
     def get_costs(self) -> dict[str, float]:
         """Get the cost of the llm api
         Returns:
             dict: Dictionary containing the cost of the prompt and response, and the total cost
         """
-        return {
-            "prompt_cost": self.prompt_cost,
-            "response_cost": self.response_cost,
-            "total_cost": self.total_cost
-        }
+        with self._lock:
+            return {
+                "prompt_cost": self.prompt_cost,
+                "response_cost": self.response_cost,
+                "total_cost": self.total_cost
+            }
     
     def get_tokens(self) -> dict[str, int]:
         """Get the number of tokens used in the llm api
         Returns:
             dict: Dictionary containing the number of tokens in the prompt and response, and the total number of tokens
         """
-        return {
-            "prompt_tokens": self.prompt_tokens,
-            "response_tokens": self.response_tokens,
-            "total_tokens": self.total_tokens
-        }
\ No newline at end of file
+        with self._lock:
+            return {
+                "prompt_tokens": self.prompt_tokens,
+                "response_tokens": self.response_tokens,
+                "total_tokens": self.total_tokens
+            }
+
+    def get_cache_stats(self) -> dict[str, float]:
+        """Get the statistics of the responses read from the cache
+        Returns:
+            dict: Dictionary containing the number of cache hits, the tokens of the cached responses and the cost saved
+        """
+        with self._lock:
+            return {
+                "cache_hits": self.cache_hits,
+                "cached_prompt_tokens": self.cached_prompt_tokens,
+                "cached_response_tokens": self.cached_response_tokens,
+                "saved_cost": self.saved_cost
+            }
+
+    def get_coalesced_stats(self) -> dict[str, float]:
+        """Get the statistics of the responses shared between identical requests in flight
+        Returns:
+            dict: Dictionary containing the number of coalesced requests, the tokens of their responses and the cost saved
+        """
+        with self._lock:
+            return {
+                "coalesced_requests": self.coalesced_requests,
+                "coalesced_prompt_tokens": self.coalesced_prompt_tokens,
+                "coalesced_response_tokens": self.coalesced_response_tokens,
+                "saved_cost": self.coalesced_saved_cost
+            }
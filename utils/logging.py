@@ -2,6 +2,7 @@ from collections.abc import Mapping
 import logging
 import logging.config
 import os
+import threading
 from datetime import datetime
 from typing import Any
 
@@ -31,6 +32,8 @@ class CustomAdapter(logging.LoggerAdapter):
     """
     Adapter to pass extra context to the logger
     """
+    _lock = threading.Lock()
+
     def __new__(cls, logger: logging.Logger, extra: dict[str, Any] = {}, game_env = None) -> logging.LoggerAdapter:
         """
         Constructor for the CustomAdapter class
@@ -44,11 +47,13 @@ class CustomAdapter(logging.LoggerAdapter):
             logging.LoggerAdapter: Logger adapter
         """
         # Reuse the game_env from the previous adapter
-        if not game_env:
-            game_env = getattr(cls, 'prev_game_env', None)
-        
-        if not hasattr(cls, 'prev_game_env') and game_env:
-            cls.prev_game_env = game_env
+        # The lock avoids two threads creating adapters at the same time from setting different game environments
+        with cls._lock:
+            if not game_env:
+                game_env = getattr(cls, 'prev_game_env', None)
+
+            if not hasattr(cls, 'prev_game_env') and game_env:
+                cls.prev_game_env = game_env
 
         instance = super().__new__(cls)
         return instance
@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+class RoundExecutor:
+    """Runs the cognition of every agent for a round concurrently.
+    All the agents read the same environment snapshot, so their moves are independent and can overlap
+    while they wait for the LLM responses. The results are merged in the order of the agents list,
+    so the actions map sent to the environment does not depend on which agent finished first.
+    """
+
+    def __init__(self, max_workers: int | None = None):
+        """Initializes the round executor.
+
+        Args:
+            max_workers (int | None, optional): Maximum number of agents thinking at the same time. If None, all the agents of a round run at the same time. If 1, the agents run one after another. Defaults to None.
+        """
+        self.max_workers = max_workers
+        self.executor = None
+
+    def _get_executor(self, n_tasks: int) -> ThreadPoolExecutor:
+        """Returns the thread pool, creating it on the first round.
+
+        Args:
+            n_tasks (int): Number of tasks of the round. Used as the pool size when max_workers is not defined.
+
+        Returns:
+            ThreadPoolExecutor: Thread pool used to run the agents.
+        """
+        if self.executor is None:
+            workers = self.max_workers or max(n_tasks, 1)
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='agent')
+        return self.executor
+
+    def run(self, agents_moves: list[tuple[str, Callable[..., Any], tuple, dict]]) -> dict[str, Any]:
+        """Executes the moves of a round and returns their results in the order they were given.
+
+        Args:
+            agents_moves (list[tuple[str, Callable, tuple, dict]]): List with the agent name, the function to call, and its args and kwargs.
+
+        Returns:
+            dict[str, Any]: Result of each move by agent name.
+
+        Raises:
+            Exception: The first exception raised by a move, in the order of the agents.
+        """
+        if self.max_workers == 1 or len(agents_moves) <= 1:
+            return {name: func(*args, **kwargs) for name, func, args, kwargs in agents_moves}
+
+        executor = self._get_executor(len(agents_moves))
+        futures = [(name, executor.submit(func, *args, **kwargs)) for name, func, args, kwargs in agents_moves]
+        # Merge the results in the same order the agents were submitted
+        return {name: future.result() for name, future in futures}
+
+    def shutdown(self) -> None:
+        """Stops the thread pool."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
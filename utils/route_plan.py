@@ -1,49 +1,51 @@
 
 
 
-from collections import deque
+from collections import OrderedDict, deque
+from heapq import heappop, heappush
+import os
+import threading
+from types import SimpleNamespace
 from typing import Dict
 
+import numpy as np
+
+# Buffers of the searches of every thread by number of nodes
+_buffers = threading.local()
+# Row and column offsets of the moves up, right, down and left
+DX = [-1, 0, 1, 0]
+DY = [0, 1, 0, -1]
+# Distance fields caches shared by all the agents, by map and static obstacles
+_distance_field_caches = {}
+_distance_field_caches_lock = threading.Lock()
+
 def shortest_valid_route(matrix: list[list[str]], start: tuple[int, int], end: tuple[int, int],
-                            scenario_obstacles: Dict[str, list], orientation:int = 0):
+                            scenario_obstacles: Dict[str, list], orientation:int = 0, distance_fields: 'DistanceFieldCache | None' = None,
+                            turns: bool = False, face_end: bool = False):
     """ 
-    This function will do a call to the function get_shortest_valid_route with the same parameters,
-    but at the first time it will send the parameter invalid_symbols as a list of the combination of the two lists 
-    in scenario_obstacles (impassable_obstacles + passable_obstacles). 
-    If the first call returns an empty list, it will return the result of the second call with the parameter invalid_symbols
-    as only the list of impassable_obstacles.
+    Gets the shortest route that avoids the obstacles of the scenario if possible. The impassable obstacles are
+    never crossed, while the passable obstacles are only crossed when there is no route without them, and then
+    the route crosses the fewest passable obstacles possible. All of it is solved in a single search.
     
     Args:
         matrix (list[list[str]]): Matrix.
         start (tuple[int, int]): Start point.
         end (tuple[int, int]): End point.
-        invalid_symbols (Dict[str, list]): Invalid symbols. Contains two lists, impassable_obstacles and passable_obstacles.
+        scenario_obstacles (Dict[str, list]): Obstacles of the scenario. Contains two lists, impassable_obstacles and passable_obstacles.
         orientation (int, optional): Orientation of the agent. 0: North, 1: East, 2: South, 3: West. Defaults to 0.
+        distance_fields (DistanceFieldCache | None, optional): Distance fields of the map. If they are given, the route is taken
+            from them when no dynamic obstacle is in the way. Defaults to None.
+        turns (bool, optional): If True, the route is planned with the turns of the agent, see get_oriented_route. Defaults to False.
+        face_end (bool, optional): With the turns, the route stops next to the end facing it instead of entering it. Defaults to False.
     Returns:
         list[str]: Shortest valid route.
     """
-    invalid_symbols = scenario_obstacles['impassable_obstacles'] + scenario_obstacles['passable_obstacles']
-    route = get_shortest_valid_route(matrix, start, end, invalid_symbols, orientation)
-    if route:
-        return route
-    else:
-        possible_route = get_shortest_valid_route(matrix, start, end, scenario_obstacles['impassable_obstacles'], orientation)
-        # Now, by using the possible_route, we will make inverse moves since the end_position, to try to find a valid route by calling
-        # with both lists of invalid_symbols. If we find a valid route, we will return it.
-        # If we don't find a valid route, we will return the possible_route.
-        # At the end, we will append the removed moves from the possible_route to the final route.
-        if possible_route:
-            #Iterates the possible_route in reverse order
-            new_end_position = end
-            final_movements_to_add = []
-            for  move in  possible_route[::-1]:
-                new_end_position = inverse_move_in_grid(new_end_position, move, orientation)
-                #Append it at the beginning of the list
-                final_movements_to_add.insert(0, move)
-                route = get_shortest_valid_route(matrix, start, new_end_position, invalid_symbols, orientation)
-                if route:
-                    return route + final_movements_to_add
-        return possible_route
+    if turns:
+        heuristic = distance_fields.get_heuristic(matrix, end, scenario_obstacles) if distance_fields is not None else None
+        return get_oriented_route(matrix, start, end, scenario_obstacles['impassable_obstacles'], scenario_obstacles['passable_obstacles'], orientation, face_end, heuristic)
+    if distance_fields is not None:
+        return distance_fields.find_route(matrix, start, end, scenario_obstacles, orientation)
+    return get_weighted_route(matrix, start, end, scenario_obstacles['impassable_obstacles'], scenario_obstacles['passable_obstacles'], orientation)
 
 def get_shortest_valid_route(matrix: list[list[str]], start: tuple[int, int], end: tuple[int, int], 
                              invalid_symbols: list[str], orientation:int = 0):
@@ -59,45 +61,522 @@ def get_shortest_valid_route(matrix: list[list[str]], start: tuple[int, int], en
     Returns:
         list[str]: Shortest valid route.
     """
-    dx = [-1, 0, 1, 0]
-    dy = [0, 1, 0, -1]
+    return get_weighted_route(matrix, start, end, invalid_symbols, [], orientation)
+
+def get_directions(orientation: int) -> list[str]:
+    """Gets the names of the moves up, right, down and left of the map for an orientation of the agent.
+
+    Args:
+        orientation (int): Orientation of the agent. 0: North, 1: East, 2: South, 3: West.
+
+    Returns:
+        list[str]: Names of the moves.
+    """
     directions = ['move up', 'move right', 'move down', 'move left']
     #Rotate directions according to the orientation of the agent
     orientation = 1 if orientation == 3 else 3 if orientation == 1 else orientation # Changes 1 to 3 and 3 to 1 (right and left)
-    directions = directions[orientation:] + directions[:orientation]
-    
-    def bfs(start, end):
-        visited = [[False for _ in range(len(matrix[0]))] for _ in range(len(matrix))]
-        prev = [[None for _ in range(len(matrix[0]))] for _ in range(len(matrix))]
-        
-        queue = deque([start])
-        visited[start[0]][start[1]] = True
-        
+    return directions[orientation:] + directions[:orientation]
+
+def get_search_buffers(size: int) -> SimpleNamespace:
+    """Gets the buffers of the searches of the current thread for a number of nodes, they are allocated only the first time.
+    The nodes written by a search are marked with its generation, so the buffers do not need to be cleared.
+
+    Args:
+        size (int): Number of nodes of the search, the cells of the map or the cells and orientations of the agent.
+
+    Returns:
+        SimpleNamespace: Buffers with the cost, the previous node and the action to each node, the generation of each node and the current generation.
+    """
+    if not hasattr(_buffers, 'by_size'):
+        _buffers.by_size = {}
+    buffers = _buffers.by_size.get(size)
+    if buffers is None:
+        buffers = SimpleNamespace(cost=[0] * size, prev=[0] * size, move=[0] * size, generation_map=[0] * size, generation=0)
+        _buffers.by_size[size] = buffers
+    buffers.generation += 1
+    return buffers
+
+def get_weighted_route(matrix: list[list[str]], start: tuple[int, int], end: tuple[int, int],
+                       impassable_symbols: list[str], passable_symbols: list[str], orientation:int = 0):
+    """Gets the route between two points that crosses the fewest passable obstacles and, among them, the shortest one.
+    The cost of a route is the number of passable obstacles crossed followed by its length, so the route only crosses
+    passable obstacles when there is no route without them. The end point can always be reached, whatever its symbol.
+    Ties are broken in the same order as a breadth first search, so without passable obstacles the route is the one
+    of the breadth first search.
+
+    Args:
+        matrix (list[list[str]]): Matrix.
+        start (tuple[int, int]): Start point.
+        end (tuple[int, int]): End point.
+        impassable_symbols (list[str]): Symbols that can not be crossed.
+        passable_symbols (list[str]): Symbols that are crossed only if necessary.
+        orientation (int, optional): Orientation of the agent. 0: North, 1: East, 2: South, 3: West. Defaults to 0.
+
+    Returns:
+        list[str]: Route, empty if there is no route.
+    """
+    directions = get_directions(orientation)
+    impassable_symbols, passable_symbols = set(impassable_symbols), set(passable_symbols)
+
+    rows, cols = len(matrix), len(matrix[0])
+    buffers = get_search_buffers(rows * cols)
+    cost, prev, move, generation_map, generation = buffers.cost, buffers.prev, buffers.move, buffers.generation_map, buffers.generation
+    start, end = tuple(start), tuple(end)
+    start_index, end_index = start[0] * cols + start[1], end[0] * cols + end[1]
+    # The cost of a cell is its number of obstacles crossed times the number of cells plus its length, it is the same order
+    # as comparing the number of obstacles and then the length because no route is longer than the number of cells
+    obstacle_cost = rows * cols
+    cost[start_index] = 0
+    generation_map[start_index] = generation
+
+    # The cells are expanded in order of cost and then of insertion, as in a breadth first search. The cells with the current
+    # number of obstacles come from two queues that are already sorted: the ones entered by crossing an obstacle and the rest
+    obstacle_queue = deque([(0, 0, start[0], start[1])])
+    pushed = 0
+    found = False
+    while obstacle_queue and not found:
+        next_obstacle_queue = deque()
+        free_queue = deque()
+        while obstacle_queue or free_queue:
+            if free_queue and (not obstacle_queue or free_queue[0] < obstacle_queue[0]):
+                current_cost, _, x, y = free_queue.popleft()
+            else:
+                current_cost, _, x, y = obstacle_queue.popleft()
+            index = x * cols + y
+            if cost[index] != current_cost:
+                continue # Already reached with a lower cost
+            if index == end_index:
+                found = True
+                break
+            for d in range(4):
+                nx, ny = x + DX[d], y + DY[d]
+                if not (0 <= nx < rows and 0 <= ny < cols):
+                    continue
+                new_index = nx * cols + ny
+                crosses_obstacle = False
+                if new_index != end_index:
+                    symbol = matrix[nx][ny]
+                    if symbol in impassable_symbols:
+                        continue
+                    crosses_obstacle = symbol in passable_symbols
+                new_cost = current_cost + 1 + obstacle_cost * crosses_obstacle
+                if generation_map[new_index] != generation or new_cost < cost[new_index]:
+                    generation_map[new_index] = generation
+                    cost[new_index] = new_cost
+                    prev[new_index] = index
+                    move[new_index] = d
+                    pushed += 1
+                    (next_obstacle_queue if crosses_obstacle else free_queue).append((new_cost, pushed, nx, ny))
+        obstacle_queue = next_obstacle_queue
+
+    if start_index == end_index or generation_map[end_index] != generation:
+        return []
+    path = []
+    at = end_index
+    while at != start_index:
+        path.append(directions[move[at]])
+        at = prev[at]
+    path.reverse()
+    return path
+
+
+def get_oriented_route(matrix: list[list[str]], start: tuple[int, int], end: tuple[int, int], impassable_symbols: list[str],
+                       passable_symbols: list[str], orientation: int = 0, face_end: bool = False, heuristic: list[int] | None = None) -> list[str]:
+    """Gets the route with the fewest steps of the agent, counting the moves and the turns, among the ones that cross the fewest
+    passable obstacles. It is an A* search over the positions and orientations of the agent. The moves are relative to the
+    orientation of the agent when they are taken and do not change it, while the turns change it.
+    The route ends with a forward move into the end, so the agent faces the direction of its last move as when the turns were
+    added after the route. If face_end is True, the route instead stops next to the end facing it.
+
+    Args:
+        matrix (list[list[str]]): Matrix.
+        start (tuple[int, int]): Start point.
+        end (tuple[int, int]): End point.
+        impassable_symbols (list[str]): Symbols that can not be crossed.
+        passable_symbols (list[str]): Symbols that are crossed only if necessary.
+        orientation (int, optional): Orientation of the agent. 0: North, 1: East, 2: South, 3: West. Defaults to 0.
+        face_end (bool, optional): If True, the route stops next to the end facing it. Defaults to False.
+        heuristic (list[int] | None, optional): Distances from every cell to the end avoiding the static obstacles, -1 if the end
+            can not be reached, as a flat list. Defaults to None, the manhattan distance is used.
+
+    Returns:
+        list[str]: Steps of the route, empty if there is no route or the agent is already at the end.
+    """
+    start, end = (int(start[0]), int(start[1])), (int(end[0]), int(end[1]))
+    if start == end:
+        return []
+    impassable_symbols, passable_symbols = set(impassable_symbols), set(passable_symbols)
+    rows, cols = len(matrix), len(matrix[0])
+    # The nodes are the cells times the 4 orientations, a route never takes more steps than twice the number of nodes
+    nodes = rows * cols * 4
+    obstacle_cost = 2 * nodes
+    buffers = get_search_buffers(nodes)
+    cost, prev, action, generation_map, generation = buffers.cost, buffers.prev, buffers.move, buffers.generation_map, buffers.generation
+    # The last move to the end does not count when the route stops next to it
+    last_move = 0 if face_end else 1
+
+    def get_heuristic(x: int, y: int) -> int:
+        """Lower bound of the steps left from a cell, -1 if the end can not be reached from it"""
+        if heuristic is None:
+            distance = abs(x - end[0]) + abs(y - end[1])
+        else:
+            distance = heuristic[x * cols + y]
+            if distance < 0:
+                return -1
+        return max(distance - 1 + last_move, 0)
+
+    # The actions are the moves up, right, down and left of the map (0 to 3) and the turns right (4) and left (5)
+    # The priority of a node keeps the passable obstacles first, so the steps and the heuristic never outweigh them
+    start_node = (start[0] * cols + start[1]) * 4 + orientation
+    cost[start_node] = 0
+    generation_map[start_node] = generation
+    heap = [(get_heuristic(*start), 0, start_node, 0)]
+    pushed = 0
+    end_node = None
+    while heap:
+        _, _, node, current_cost = heappop(heap)
+        if node < 0:
+            end_node = -node - 1
+            break
+        if current_cost != cost[node]:
+            continue # Already reached with a lower cost
+        cell, node_orientation = divmod(node, 4)
+        x, y = divmod(cell, cols)
+        obstacles, steps = divmod(current_cost, obstacle_cost)
+        base_priority = obstacles * 2 * obstacle_cost + steps
+
+        # Turns, the heuristic of the cell does not change
+        current_heuristic = get_heuristic(x, y)
+        for new_node, new_action in ((cell * 4 + (node_orientation + 1) % 4, 4), (cell * 4 + (node_orientation + 3) % 4, 5)):
+            if generation_map[new_node] != generation or current_cost + 1 < cost[new_node]:
+                generation_map[new_node] = generation
+                cost[new_node] = current_cost + 1
+                prev[new_node] = node
+                action[new_node] = new_action
+                pushed += 1
+                heappush(heap, (base_priority + 1 + current_heuristic, pushed, new_node, current_cost + 1))
+
+        # Moves, the orientation does not change
+        for d in range(4):
+            nx, ny = x + DX[d], y + DY[d]
+            if not (0 <= nx < rows and 0 <= ny < cols):
+                continue
+            if nx == end[0] and ny == end[1]:
+                if d == node_orientation:
+                    # The agent faces the end, the route finishes with a forward move or here
+                    pushed += 1
+                    heappush(heap, (base_priority + last_move, pushed, -node - 1, current_cost))
+                continue
+            symbol = matrix[nx][ny]
+            if symbol in impassable_symbols:
+                continue
+            new_heuristic = get_heuristic(nx, ny)
+            if new_heuristic < 0:
+                continue
+            new_node = (nx * cols + ny) * 4 + node_orientation
+            new_cost = current_cost + 1
+            new_priority = base_priority + 1 + new_heuristic
+            if symbol in passable_symbols:
+                new_cost += obstacle_cost
+                new_priority += 2 * obstacle_cost
+            if generation_map[new_node] != generation or new_cost < cost[new_node]:
+                generation_map[new_node] = generation
+                cost[new_node] = new_cost
+                prev[new_node] = node
+                action[new_node] = d
+                pushed += 1
+                heappush(heap, (new_priority, pushed, new_node, new_cost))
+
+    if end_node is None:
+        return []
+    path = ['move up'] if not face_end else []
+    node = end_node
+    while node != start_node:
+        node_action = action[node]
+        if node_action == 4:
+            path.append('turn right')
+        elif node_action == 5:
+            path.append('turn left')
+        else:
+            path.append(get_directions(node % 4)[node_action])
+        node = prev[node]
+    path.reverse()
+    return path
+
+
+class DistanceFieldCache:
+    """Distance fields of a map over its static obstacles, shared by all the agents. The field of a position has the distance
+    from every cell to the position and the first move of a shortest route from every cell to it. The fields of the most
+    recently used positions are kept, so the routes to the usual targets and the distances from the agents are not searched again.
+    The dynamic obstacles (the agents and the passable obstacles) are kept in an overlay that is built once for every new map,
+    and a route is only searched on the map when the route of the field crosses one of them.
+    """
+
+    def __init__(self, scenario_map: str | list[list[str]], static_obstacles: list[str], max_fields: int | None = None):
+        """Constructor for the DistanceFieldCache class
+        Args:
+            scenario_map (str | list[list[str]]): Map of the scenario, in ascci format or as a matrix
+            static_obstacles (list[str]): Obstacles that never change during the game. For example: ['W', '$']
+            max_fields (int | None, optional): Number of fields kept. Defaults to the DISTANCE_FIELDS_CACHE_SIZE environment variable or 256.
+        """
+        self.static_map = self._to_matrix(scenario_map)
+        self.static_obstacles = list(static_obstacles)
+        self.static_blocked = np.isin(self.static_map, self.static_obstacles)
+        self.max_fields = max_fields or int(os.getenv('DISTANCE_FIELDS_CACHE_SIZE', 256))
+        self.fields: OrderedDict[tuple[int, int], tuple[np.ndarray, np.ndarray, list[int]]] = OrderedDict()
+        self.fields_hits = 0
+        self.fields_misses = 0
+        self._overlay_key = None
+        self._overlay = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _to_matrix(ascci_map: str | list[list[str]]) -> np.ndarray:
+        """Converts a map in ascci format into a matrix of characters"""
+        if isinstance(ascci_map, np.ndarray):
+            return ascci_map
+        if isinstance(ascci_map, str):
+            ascci_map = [row for row in ascci_map.split('\n') if row != '']
+        return np.array([list(row) for row in ascci_map])
+
+    def _compute_field(self, position: tuple[int, int]) -> tuple[np.ndarray, np.ndarray]:
+        """Computes the field of a position with a breadth first search over the cells without static obstacles
+        Returns:
+            tuple[np.ndarray, np.ndarray, list[int]]: Distance from every cell to the position, -1 if it can not be reached, the direction
+                of the first move towards the position (0: up, 1: right, 2: down, 3: left), -1 if there is none, and the distances as a flat list
+        """
+        rows, cols = self.static_blocked.shape
+        blocked = self.static_blocked.ravel().tolist()
+        distances = [-1] * (rows * cols)
+        distances[position[0] * cols + position[1]] = 0
+        queue = deque([position])
         while queue:
             x, y = queue.popleft()
-            
-            for d in range(4):
-                nx, ny = x + dx[d], y + dy[d]
-                
-                if 0 <= nx < len(matrix) and 0 <= ny < len(matrix[0]) and not visited[nx][ny]:
-                    if matrix[nx][ny] not in invalid_symbols or (nx,ny) == end:
+            distance = distances[x * cols + y] + 1
+            for nx, ny in ((x - 1, y), (x, y + 1), (x + 1, y), (x, y - 1)):
+                if 0 <= nx < rows and 0 <= ny < cols:
+                    index = nx * cols + ny
+                    if distances[index] == -1 and not blocked[index]:
+                        distances[index] = distance
                         queue.append((nx, ny))
-                        visited[nx][ny] = True
-                        prev[nx][ny] = (x, y, directions[d])
-        
+        distances_list = distances
+        distances = np.array(distances).reshape(rows, cols)
+
+        # The first move of every cell goes to the first neighbor, in the order up, right, down, left, that is one step closer
+        padded = np.pad(distances, 1, constant_values=-1)
+        neighbors = [padded[:-2, 1:-1], padded[1:-1, 2:], padded[2:, 1:-1], padded[1:-1, :-2]]
+        next_moves = np.full(distances.shape, -1)
+        for direction in reversed(range(4)):
+            next_moves[(distances > 0) & (neighbors[direction] == distances - 1)] = direction
+        return distances, next_moves, distances_list
+
+    def get_field(self, position: tuple[int, int]) -> tuple[np.ndarray, np.ndarray, list[int]]:
+        """Gets the field of a position, it is computed the first time it is requested
+        Args:
+            position (tuple[int, int]): Position of the map
+        Returns:
+            tuple[np.ndarray, np.ndarray, list[int]]: Distances to the position, first moves towards it and the distances as a flat list
+        """
+        position = (int(position[0]), int(position[1]))
+        with self._lock:
+            field = self.fields.get(position)
+            if field is not None:
+                self.fields.move_to_end(position)
+                self.fields_hits += 1
+                return field
+        field = self._compute_field(position)
+        with self._lock:
+            self.fields_misses += 1
+            self.fields[position] = field
+            while len(self.fields) > self.max_fields:
+                self.fields.popitem(last=False)
+        return field
+
+    def get_distances(self, position: tuple[int, int]) -> np.ndarray:
+        """Gets the distances from a position to every cell of the map avoiding the static obstacles
+        Args:
+            position (tuple[int, int]): Position of the map
+        Returns:
+            np.ndarray: Distances, -1 where the cell can not be reached
+        """
+        return self.get_field(position)[0]
+
+    def get_nearest(self, position: tuple[int, int], targets: np.ndarray) -> tuple[int | None, float]:
+        """Gets the nearest target from a position avoiding the static obstacles. The ties are broken by the order of the targets
+        Args:
+            position (tuple[int, int]): Position of the map
+            targets (np.ndarray): Positions of the targets, an array of shape (n, 2)
+        Returns:
+            tuple[int | None, float]: Index of the nearest target and its distance. None and inf if no target can be reached
+        """
+        rows, cols = self.static_blocked.shape
+        targets = np.asarray(targets, dtype=int).reshape(-1, 2)
+        if len(targets) == 0 or not (0 <= position[0] < rows and 0 <= position[1] < cols):
+            return None, float('inf')
+        inside = (targets[:, 0] >= 0) & (targets[:, 0] < rows) & (targets[:, 1] >= 0) & (targets[:, 1] < cols)
+        distances = np.full(len(targets), np.inf)
+        distances[inside] = self.get_distances(position)[targets[inside, 0], targets[inside, 1]]
+        distances[distances < 0] = np.inf
+        if np.isinf(distances.min()):
+            return None, float('inf')
+        nearest = int(distances.argmin())
+        return nearest, int(distances[nearest])
+
+    def get_overlay(self, current_map: list[list[str]], scenario_obstacles: Dict[str, list]) -> np.ndarray | None:
+        """Gets the overlay of the dynamic obstacles of a map. It is built once for every new map
+        Args:
+            current_map (list[list[str]]): Current map
+            scenario_obstacles (Dict[str, list]): Obstacles of the scenario, with the impassable_obstacles and the passable_obstacles
+        Returns:
+            np.ndarray | None: Mask of the cells that the routes of the fields can not cross. None if the static obstacles of the fields are not
+                the ones of the map, then the fields can not be used on it
+        """
+        key = (current_map, tuple(scenario_obstacles['impassable_obstacles']), tuple(scenario_obstacles['passable_obstacles']))
+        with self._lock:
+            if self._overlay_key is not None and self._overlay_key[0] is key[0] and self._overlay_key[1:] == key[1:]:
+                return self._overlay
+        matrix = self._to_matrix(current_map)
+        overlay = None
+        if matrix.shape == self.static_blocked.shape:
+            impassable = np.isin(matrix, scenario_obstacles['impassable_obstacles'])
+            if not (self.static_blocked & ~impassable).any():
+                overlay = impassable | np.isin(matrix, scenario_obstacles['passable_obstacles'])
+        with self._lock:
+            self._overlay_key, self._overlay = key, overlay
+        return overlay
+
+    def get_heuristic(self, current_map: list[list[str]], end: tuple[int, int], scenario_obstacles: Dict[str, list]) -> list[int] | None:
+        """Gets the distances to a position over the static obstacles to guide the searches on a map
+        Args:
+            current_map (list[list[str]]): Current map
+            end (tuple[int, int]): End point of the search
+            scenario_obstacles (Dict[str, list]): Obstacles of the scenario, with the impassable_obstacles and the passable_obstacles
+        Returns:
+            list[int] | None: Distances as a flat list, -1 where the end can not be reached. None if the fields can not be used on the map
+        """
+        rows, cols = self.static_blocked.shape
+        if self.get_overlay(current_map, scenario_obstacles) is None or not (0 <= end[0] < rows and 0 <= end[1] < cols):
+            return None
+        return self.get_field(end)[2]
+
+    def find_route(self, current_map: list[list[str]], start: tuple[int, int], end: tuple[int, int], scenario_obstacles: Dict[str, list], orientation: int = 0) -> list[str]:
+        """Finds a shortest route that avoids the obstacles of the scenario if possible, with the same cost as shortest_valid_route.
+        The route is followed on the field of the end position, and when it crosses a dynamic obstacle it is searched with the
+        distances of the field as the heuristic of an A* search
+        Args:
+            current_map (list[list[str]]): Current map
+            start (tuple[int, int]): Start point
+            end (tuple[int, int]): End point
+            scenario_obstacles (Dict[str, list]): Obstacles of the scenario, with the impassable_obstacles and the passable_obstacles
+            orientation (int, optional): Orientation of the agent. 0: North, 1: East, 2: South, 3: West. Defaults to 0.
+        Returns:
+            list[str]: Route, empty if there is no route
+        """
+        overlay = self.get_overlay(current_map, scenario_obstacles)
+        rows, cols = self.static_blocked.shape
+        start, end = (int(start[0]), int(start[1])), (int(end[0]), int(end[1]))
+        if overlay is None or not (0 <= start[0] < rows and 0 <= start[1] < cols and 0 <= end[0] < rows and 0 <= end[1] < cols) \
+                or self.static_blocked[start]:
+            return get_weighted_route(current_map, start, end, scenario_obstacles['impassable_obstacles'], scenario_obstacles['passable_obstacles'], orientation)
+
+        distances, next_moves, heuristic = self.get_field(end)
+        if start == end or distances[start] < 0:
+            return [] # Not even the static obstacles let reach the end
+        directions = get_directions(orientation)
+        route = []
+        x, y = start
+        while (x, y) != end:
+            move = next_moves[x, y]
+            x, y = x + DX[move], y + DY[move]
+            if (x, y) != end and overlay[x, y]:
+                return self._search_route(current_map, start, end, heuristic, scenario_obstacles, directions)
+            route.append(directions[move])
+        return route
+
+    def _search_route(self, current_map: list[list[str]], start: tuple[int, int], end: tuple[int, int], heuristic: list[int], scenario_obstacles: Dict[str, list], directions: list[str]) -> list[str]:
+        """Searches the route that crosses the fewest passable obstacles and then is the shortest one with an A* search, the distances
+        to the end avoiding the static obstacles are the heuristic
+        Returns:
+            list[str]: Route, empty if there is no route
+        """
+        impassable_symbols, passable_symbols = set(scenario_obstacles['impassable_obstacles']), set(scenario_obstacles['passable_obstacles'])
+        rows, cols = self.static_blocked.shape
+        size = rows * cols
+        buffers = get_search_buffers(size)
+        cost, prev, move, generation_map, generation = buffers.cost, buffers.prev, buffers.move, buffers.generation_map, buffers.generation
+        start_index, end_index = start[0] * cols + start[1], end[0] * cols + end[1]
+        # The costs are the number of obstacles crossed times the number of cells plus the length, and the heap is ordered by the
+        # obstacles crossed and then by the length plus the heuristic, that is never longer than twice the number of cells
+        cost[start_index] = 0
+        generation_map[start_index] = generation
+        heap = [(heuristic[start_index], 0, start_index)]
+        pushed = 0
+        while heap:
+            priority, _, index = heappop(heap)
+            current_cost = cost[index]
+            obstacles, length = divmod(current_cost, size)
+            if priority != obstacles * 2 * size + length + heuristic[index]:
+                continue # Already reached with a lower cost
+            if index == end_index:
+                break
+            x, y = divmod(index, cols)
+            for d in range(4):
+                nx, ny = x + DX[d], y + DY[d]
+                if not (0 <= nx < rows and 0 <= ny < cols):
+                    continue
+                new_index = nx * cols + ny
+                if heuristic[new_index] < 0:
+                    continue # The end can not be reached from the cell
+                crosses_obstacle = False
+                if new_index != end_index:
+                    symbol = current_map[nx][ny]
+                    if symbol in impassable_symbols:
+                        continue
+                    crosses_obstacle = symbol in passable_symbols
+                new_cost = current_cost + 1 + size * crosses_obstacle
+                if generation_map[new_index] != generation or new_cost < cost[new_index]:
+                    generation_map[new_index] = generation
+                    cost[new_index] = new_cost
+                    prev[new_index] = index
+                    move[new_index] = d
+                    pushed += 1
+                    obstacles, length = divmod(new_cost, size)
+                    heappush(heap, (obstacles * 2 * size + length + heuristic[new_index], pushed, new_index))
+
+        if generation_map[end_index] != generation:
+            return []
         path = []
-        at = end
-        while at != start:
-            if prev[at[0]][at[1]] is None:
-                return []  # No hay camino
-            x, y, d = prev[at[0]][at[1]]
-            path.append(d)
-            at = (x, y)
+        at = end_index
+        while at != start_index:
+            path.append(directions[move[at]])
+            at = prev[at]
         path.reverse()
-        
         return path
 
-    return bfs(start, end)
+    def get_stats(self) -> dict:
+        """Get the hits and misses of the fields
+        Returns:
+            dict: Hits, misses and number of fields kept
+        """
+        with self._lock:
+            return {'hits': self.fields_hits, 'misses': self.fields_misses, 'size': len(self.fields)}
+
+
+def get_distance_field_cache(scenario_map: str | list[list[str]], static_obstacles: list[str]) -> DistanceFieldCache:
+    """Gets the distance fields of a map, they are shared by all the callers with the same map and static obstacles.
+
+    Args:
+        scenario_map (str | list[list[str]]): Map of the scenario, in ascci format or as a matrix.
+        static_obstacles (list[str]): Obstacles that never change during the game.
+
+    Returns:
+        DistanceFieldCache: Distance fields of the map.
+    """
+    key = (scenario_map if isinstance(scenario_map, str) else '\n'.join(''.join(row) for row in scenario_map), tuple(static_obstacles))
+    with _distance_field_caches_lock:
+        if key not in _distance_field_caches:
+            _distance_field_caches[key] = DistanceFieldCache(scenario_map, static_obstacles)
+        return _distance_field_caches[key]
 
 
 def inverse_move_in_grid(end_position: tuple[int, int], move: str, orientation:int):